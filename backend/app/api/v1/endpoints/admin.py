@@ -1,16 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Body
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Body, Request
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from datetime import datetime
+import json
 import logging
 from bson import ObjectId # Import ObjectId
-import yaml
 
-from app.api.v1.schemas import SyllabusSummaryResponse # We need a summary response
 from app.core.config import get_settings
 from app.db.session import get_db
-from app.core.llm_services import process_syllabus_with_llm, answer_question_naively_streamed # Import the new service and refactored function
-from fastapi.responses import StreamingResponse # Will be needed for actual streaming
+from app.core.llm_services import stream_answer_naively, naive_answer_reserved_tokens, get_speculation_stats
+from app.core.token_budget import SyllabusContextPart, fit_syllabus_context
+from app.core.context_format import CONTEXT_FORMAT, ensure_llm_context
+from fastapi.responses import StreamingResponse
 import asyncio # For placeholder streaming if we adapt later
+import mimetypes
+from app.core.cache import answer_cache
+from app.core.llm_client import get_completion_cache_stats
+from app.core.cascade import get_cascade_stats
+from app.core.course_router import get_routing_stats, route_question, set_subscription
+from app.core.extraction import PDF_MIME_TYPE, DOCX_MIME_TYPE
+from app.core.hedging import get_hedging_stats
+from app.core.history import conversation_cache
+from app.core.ingestion_jobs import enqueue_job, get_job, list_jobs, ingestion_workers
+from app.core.llm_scheduler import llm_scheduler
+from app.core.message_writer import message_writer
+from app.core.resilience import get_resilience_stats
+from app.core.singleflight import chat_singleflight
+from app.core.summarizer import get_summary_stats
+from app.core.syllabus_search import get_search_stats
+from app.core.timings import get_stage_stats
 from pydantic import BaseModel, Field
 
 # Setup logging
@@ -26,14 +43,17 @@ class LLMTestRequest(BaseModel):
     temperature: Optional[float] = Field(1.0, ge=0.0, le=2.0)
     max_tokens: Optional[int] = Field(200, gt=0)
 
-@router.post("/llm/test-naive-stream", response_model=Dict[str, Any])
-async def test_llm_naive_stream(
-    request_data: LLMTestRequest = Body(...),
-    db=Depends(get_db)
-):
-    logger.info(f"Received LLM test request for syllabi: {request_data.syllabus_ids} with model: {request_data.model_name}")
+class CourseSubscription(BaseModel):
+    course_id: str
+    group: Optional[str] = None
 
-    full_syllabus_content_parts = []
+class SubscriptionRequest(BaseModel):
+    courses: List[CourseSubscription]
+
+async def _load_syllabus_context(request_data: LLMTestRequest, db) -> Tuple[List[SyllabusContextPart], Dict[str, int]]:
+    """Render each requested syllabus at its current version."""
+    full_syllabus_content_parts: List[SyllabusContextPart] = []
+    syllabus_versions: Dict[str, int] = {}
     for syllabus_id in request_data.syllabus_ids:
         try:
             oid = ObjectId(syllabus_id)
@@ -59,11 +79,21 @@ async def test_llm_naive_stream(
             content_header = f"--- START SYLLABUS: {syllabus_id} ---\n"
             content_footer = f"--- END SYLLABUS: {syllabus_id} ---\n\n"
             
-            yaml_data = {"courses": [version_doc["data"]]}
-            yaml_string = yaml.dump(yaml_data, allow_unicode=True, sort_keys=False, Dumper=yaml.SafeDumper)
+            llm_context = await ensure_llm_context(db, version_doc)
             
-            full_syllabus_content_parts.append(content_header + yaml_string + content_footer)
+            full_syllabus_content_parts.append(SyllabusContextPart(
+                syllabus_id=str(oid),
+                version=syllabus_doc["current_version"],
+                text=llm_context,
+                course_data=version_doc["data"],
+                header=content_header,
+                footer=content_footer,
+                rendering=CONTEXT_FORMAT
+            ))
+            syllabus_versions[str(oid)] = syllabus_doc["current_version"]
             logger.info(f"Added syllabus {syllabus_id} to full content")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error processing syllabus {syllabus_id}: {e}")
             if len(request_data.syllabus_ids) == 1:
@@ -73,15 +103,231 @@ async def test_llm_naive_stream(
     if not full_syllabus_content_parts:
         raise HTTPException(status_code=404, detail="No valid syllabus content could be loaded from the provided IDs.")
     
-    full_syllabus_content_str = "\n".join(full_syllabus_content_parts)
+    return full_syllabus_content_parts, syllabus_versions
+
+# Test answers are kept with the chat messages under a sender no student can have
+NAIVE_TEST_SENDER = "admin:test-naive-stream"
+
+async def _record_naive_answer(db, request_data: LLMTestRequest, model_name: str, syllabus_versions: Dict[str, int], response_text: str) -> None:
+    """Persist a completed test answer through the buffered message writer."""
+    await message_writer.write(db, {
+        "sender": NAIVE_TEST_SENDER,
+        "message": request_data.user_query,
+        "response": response_text,
+        "timestamp": datetime.utcnow(),
+        "model": model_name,
+        "syllabus_versions": syllabus_versions
+    })
+
+def _sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/llm/test-naive-stream", response_model=Dict[str, Any])
+async def test_llm_naive_stream(
+    request: Request,
+    request_data: LLMTestRequest = Body(...),
+    db=Depends(get_db)
+):
+    """
+    Answer a test question over the selected syllabi.
+
+    Clients that send `Accept: text/event-stream` receive Server-Sent Events:
+    one `data: {"delta": ...}` event per chunk, then an `event: done` carrying the
+    full response. Other clients receive a single JSON body once generation ends.
+    """
+    logger.info(f"Received LLM test request for syllabi: {request_data.syllabus_ids} with model: {request_data.model_name}")
+
+    context_parts, syllabus_versions = await _load_syllabus_context(request_data, db)
+    model_name = request_data.model_name or "gpt-4o"
+    max_tokens = request_data.max_tokens if request_data.max_tokens is not None else 200
+
+    # Fit the syllabi into the model's context window before sending anything
+    reserved_tokens = naive_answer_reserved_tokens(
+        model_name, request_data.user_query, request_data.system_prompt_override, max_tokens
+    )
+    budget_result = await asyncio.to_thread(
+        fit_syllabus_context, model_name, context_parts, reserved_tokens, request_data.user_query
+    )
+    if budget_result.trimmed_syllabi:
+        logger.warning(
+            f"Trimmed {budget_result.dropped_sections} sections from {budget_result.trimmed_syllabi} "
+            f"to fit {budget_result.budget} tokens for {model_name}"
+        )
+    full_syllabus_content_str = budget_result.content
     logger.info(f"Full syllabus content: {full_syllabus_content_str[:100] if len(full_syllabus_content_str) > 100 else full_syllabus_content_str}...")
-    response_text = await answer_question_naively_streamed(
+    answer_stream = stream_answer_naively(
         user_query=request_data.user_query,
         full_syllabus_content=full_syllabus_content_str,
-        model_name=request_data.model_name or "gpt-4o",
+        model_name=model_name,
         system_prompt_override=request_data.system_prompt_override,
         temperature=request_data.temperature if request_data.temperature is not None else 1.0,
-        max_tokens=request_data.max_tokens if request_data.max_tokens is not None else 200
+        max_tokens=max_tokens,
+        syllabus_versions=syllabus_versions
     )
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def event_stream() -> AsyncIterator[str]:
+            parts = []
+            async for delta in answer_stream:
+                parts.append(delta)
+                yield _sse_event({"delta": delta})
+            response_text = "".join(parts)
+            logger.info(f"Streamed response text: {response_text[:50] if len(response_text) > 50 else response_text}...")
+            await _record_naive_answer(db, request_data, model_name, syllabus_versions, response_text)
+            yield _sse_event({"response": response_text}, event="done")
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    response_text = "".join([delta async for delta in answer_stream])
     logger.info(f"Response text: {response_text[:50] if len(response_text) > 50 else response_text}...")
+    await _record_naive_answer(db, request_data, model_name, syllabus_versions, response_text)
     return {"response": response_text}
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """Hit/miss counters of the answer and completion caches, for tuning sizes and TTLs."""
+    return {
+        "answer_cache": answer_cache.stats(),
+        "completion_cache": get_completion_cache_stats(),
+        "chat_singleflight": chat_singleflight.stats(),
+        "conversation_history": conversation_cache.stats(),
+        "conversation_summaries": get_summary_stats()
+    }
+
+@router.get("/llm/scheduler", response_model=Dict[str, Any])
+async def get_llm_scheduler_stats():
+    """Per-model in-flight calls, queue depth by priority and wait times."""
+    return llm_scheduler.stats()
+
+@router.get("/llm/cascade", response_model=Dict[str, Any])
+async def get_llm_cascade_stats():
+    """Per-tier calls, latency and escalation rate of the chat model cascade."""
+    return get_cascade_stats()
+
+@router.get("/llm/hedging", response_model=Dict[str, Any])
+async def get_llm_hedging_stats():
+    """Hedged call counts, secondary wins and p95 first-token latency per model."""
+    return get_hedging_stats()
+
+@router.get("/llm/resilience", response_model=Dict[str, Any])
+async def get_llm_resilience_stats():
+    """Retry, fallback and deadline counters, and the circuit state of each model."""
+    return get_resilience_stats()
+
+@router.get("/chat/pipeline", response_model=Dict[str, Any])
+async def get_chat_pipeline_stats():
+    """Per-stage latency of the chat pipelines, speculative generation outcomes and message writes."""
+    return {
+        "stages": get_stage_stats(),
+        "speculation": get_speculation_stats(),
+        "message_writer": message_writer.get_stats()
+    }
+
+def _upload_mime_type(file: UploadFile) -> str:
+    mime_type = file.content_type
+    if not mime_type or mime_type == "application/octet-stream":
+        mime_type = mimetypes.guess_type(file.filename or "")[0] or ""
+    return mime_type
+
+@router.post("/syllabus/upload", response_model=Dict[str, Any], status_code=202)
+async def upload_syllabus(
+    file: UploadFile = File(...),
+    syllabus_id: Optional[str] = Form(None),
+    course_id: Optional[str] = Form(None),
+    name: Optional[str] = Form(None),
+    heb_name: Optional[str] = Form(None),
+    year: Optional[str] = Form(None),
+    semester: Optional[str] = Form(None),
+    change_summary: Optional[str] = Form(None),
+    db=Depends(get_db)
+):
+    """
+    Queue a syllabus file (PDF, DOCX, image or text) for structuring.
+
+    With syllabus_id the result becomes a new version of that syllabus;
+    otherwise course_id, name, heb_name, year and semester describe a new one.
+    Returns the job id at once; poll GET /ingestion/jobs/{job_id} for progress.
+    """
+    mime_type = _upload_mime_type(file)
+    if mime_type not in (PDF_MIME_TYPE, DOCX_MIME_TYPE) and not mime_type.startswith(("image/", "text/")):
+        raise HTTPException(status_code=415, detail=f"Unsupported file type: {mime_type or 'unknown'}")
+
+    course = None
+    if syllabus_id:
+        try:
+            oid = ObjectId(syllabus_id)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid syllabus ID format")
+        if not await db.syllabi.find_one({"_id": oid}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Syllabus not found")
+    else:
+        course = {"course_id": course_id, "name": name, "heb_name": heb_name, "year": year, "semester": semester}
+        missing = [field for field, value in course.items() if not value]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Either syllabus_id or {', '.join(missing)} is required")
+
+    file_content = await file.read()
+    if not file_content:
+        raise HTTPException(status_code=400, detail="Empty file")
+    if len(file_content) > get_settings().INGESTION_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    job_id = await enqueue_job(db, file_content, file.filename or "upload", mime_type, syllabus_id=syllabus_id, course=course, change_summary=change_summary)
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/ingestion/jobs", response_model=List[Dict[str, Any]])
+async def get_ingestion_jobs(status: Optional[str] = None, limit: int = 20, db=Depends(get_db)):
+    """Most recent ingestion jobs, optionally filtered by status."""
+    return await list_jobs(db, status=status, limit=min(limit, 100))
+
+@router.get("/ingestion/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_ingestion_job(job_id: str, db=Depends(get_db)):
+    """Status, progress and per-stage timings of an ingestion job."""
+    try:
+        job = await get_job(db, job_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid job ID format")
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/ingestion/stats", response_model=Dict[str, Any])
+async def get_ingestion_stats():
+    """Worker count, job outcomes since startup and per-stage ingestion latency."""
+    return {
+        **ingestion_workers.get_stats(),
+        "stages": get_stage_stats().get("ingestion", {})
+    }
+
+@router.put("/subscriptions/{sender_id}", response_model=Dict[str, Any])
+async def update_subscription(sender_id: str, request_data: SubscriptionRequest, db=Depends(get_db)):
+    """Set the courses (and student group per course) a sender's questions are routed to."""
+    course_ids = [course.course_id for course in request_data.courses]
+    known = {doc["course_id"] async for doc in db.syllabi.find({"course_id": {"$in": course_ids}}, {"course_id": 1})}
+    unknown = [course_id for course_id in course_ids if course_id not in known]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown course ids: {', '.join(unknown)}")
+    await set_subscription(db, sender_id, [course.model_dump() for course in request_data.courses])
+    return {"sender": sender_id, "courses": len(course_ids)}
+
+@router.get("/routing", response_model=Dict[str, Any])
+async def get_routing(sender_id: Optional[str] = None, query: Optional[str] = None, db=Depends(get_db)):
+    """Routing table stats; with sender_id and query, the courses that question would be routed to."""
+    if sender_id is None or query is None:
+        return get_routing_stats()
+    route = await route_question(db, sender_id, query)
+    return {
+        "reason": route.reason,
+        "courses": [{"course_id": c.course_id, "syllabus_id": c.syllabus_id, "name": c.name, "heb_name": c.heb_name} for c in route.courses],
+        "groups": route.groups
+    }
+
+@router.get("/search/stats", response_model=Dict[str, Any])
+async def get_syllabus_search_stats():
+    """Syllabus search counts, candidates fetched per search and latency since startup."""
+    return get_search_stats()
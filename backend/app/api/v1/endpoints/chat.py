@@ -3,6 +3,9 @@ from typing import Dict, Any
 
 from app.api.v1.schemas import ChatRequest, ChatResponse
 from app.core.config import get_settings
+from app.core.history import record_turn
+from app.core.message_writer import message_writer
+from app.core.summarizer import update_summary
 from app.core.llm_services import process_message
 from app.db.session import get_db
 
@@ -20,23 +23,27 @@ async def send_message(
     """
     try:
         # Process the message using LLM service
+        trace = {}
         response = await process_message(
             request.message,
             sender_id=request.sender,
             db=db,
-            settings=settings
+            settings=settings,
+            trace=trace
         )
         
-        # Save message history in background
-        background_tasks.add_task(
-            db.messages.insert_one,
-            {
-                "sender": request.sender,
-                "message": request.message,
-                "response": response,
-                "timestamp": request.timestamp
-            }
-        )
+        record_turn(request.sender, request.message, response, request.timestamp)
+        
+        # Buffered and written in batches; waits only when the buffer is full
+        await message_writer.write(db, {
+            "sender": request.sender,
+            "message": request.message,
+            "response": response,
+            "timestamp": request.timestamp,
+            **trace
+        })
+        # Fold turns that left the recent window into the summary
+        background_tasks.add_task(update_summary, request.sender, db)
         
         return {"response": response}
     except Exception as e:
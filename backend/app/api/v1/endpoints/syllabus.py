@@ -1,16 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
 from typing import List, Optional, Dict, Any
-from datetime import datetime
 import logging
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from app.models.syllabus import (
-    SyllabusDocument, SyllabusVersion, SyllabusCourse,
-    CourseMeta, FieldChange, SyllabusSummaryResponse
-)
+from app.models.syllabus import SyllabusCourse, SyllabusSummaryResponse
 from app.db.session import get_db
 from app.core.utils import detect_changes
+from app.core.syllabus_search import search_syllabi
+from app.core.versions import create_version
 
 logger = logging.getLogger(__name__)
 
@@ -23,27 +21,27 @@ async def get_syllabi(
     semester: Optional[str] = None,
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Get all syllabi with optional filters."""
+    """
+    Get all syllabi with optional filters.
+
+    search matches course names (English and Hebrew) and course ids by word,
+    word prefix or substring, through the indexed keys of app.core.syllabus_search;
+    results are ranked best match first.
+    """
     query = {}
-    
-    # Build search query
-    if search:
-        query["$or"] = [
-            {"metadata.name": {"$regex": search, "$options": "i"}},
-            {"metadata.heb_name": {"$regex": search, "$options": "i"}},
-            {"course_id": {"$regex": search, "$options": "i"}}
-        ]
-    
     if year:
         query["metadata.year"] = year
     
     if semester:
         query["metadata.semester"] = semester
     
-    syllabi = []
-    cursor = db.syllabi.find(query)
+    if search:
+        docs = await search_syllabi(db, search, filters=query)
+    else:
+        docs = [doc async for doc in db.syllabi.find(query)]
     
-    async for doc in cursor:
+    syllabi = []
+    for doc in docs:
         syllabi.append(SyllabusSummaryResponse(
             id=str(doc["_id"]),
             name=doc["metadata"]["name"],
@@ -134,61 +132,18 @@ async def update_syllabus(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid syllabus ID format")
     
-    # Get current syllabus
-    syllabus_doc = await db.syllabi.find_one({"_id": oid})
-    if not syllabus_doc:
-        raise HTTPException(status_code=404, detail="Syllabus not found")
-    
-    # Get current version data
-    current_version_doc = await db.syllabus_versions.find_one({
-        "syllabus_id": str(oid),
-        "version": syllabus_doc["current_version"]
-    })
+    try:
+        result = await create_version(db, str(oid), syllabus_data, created_by="user", change_summary=change_summary)  # TODO: Get created_by from auth context
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
-    if not current_version_doc:
-        raise HTTPException(status_code=500, detail="Current version data not found")
-    
-    # Detect changes
-    changes = detect_changes(current_version_doc["data"], syllabus_data.model_dump())
-    
-    if not changes:
-        return {"message": "No changes detected", "version": syllabus_doc["current_version"]}
-    
-    # Create new version
-    new_version_number = syllabus_doc["current_version"] + 1
-    new_version = SyllabusVersion(
-        syllabus_id=str(oid),
-        version=new_version_number,
-        data=syllabus_data,
-        created_at=datetime.utcnow(),
-        created_by="user",  # TODO: Get from auth context
-        change_summary=change_summary or f"Updated {len(changes)} fields",
-        changes=changes
-    )
-    
-    # Insert new version
-    await db.syllabus_versions.insert_one(
-        new_version.model_dump(by_alias=True, exclude={'id'})
-    )
-    
-    # Update syllabus document
-    await db.syllabi.update_one(
-        {"_id": oid},
-        {
-            "$set": {
-                "current_version": new_version_number,
-                "metadata.name": syllabus_data.name,
-                "metadata.heb_name": syllabus_data.heb_name,
-                "metadata.year": syllabus_data.year,
-                "metadata.semester": syllabus_data.semester
-            }
-        }
-    )
+    if not result["changes"]:
+        return {"message": "No changes detected", "version": result["version"]}
     
     return {
         "message": "Syllabus updated successfully",
-        "version": new_version_number,
-        "changes": len(changes)
+        "version": result["version"],
+        "changes": result["changes"]
     }
 
 @router.get("/{syllabus_id}/diff/{version1}/{version2}")
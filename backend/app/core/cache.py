@@ -0,0 +1,134 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.lexical_index import normalize_text
+
+
+class TTLCache:
+    """
+    In-process LRU cache with a per-entry time to live.
+
+    Entries can carry tags (e.g. a syllabus id) so that every entry derived from
+    a piece of data can be dropped at once when that data changes.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Like get(), but without touching the LRU order or the hit/miss counters."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: Any, tags: Iterable[str] = ()) -> None:
+        if key in self._entries:
+            self._remove(key)
+        tags = tuple(tags)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Remove every entry carrying `tag`. Returns the number of entries removed."""
+        keys = self._tags.pop(tag, set())
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def _remove(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0
+        }
+
+
+# --- Answer cache for the naive QA path ---
+
+answer_cache = TTLCache(settings.ANSWER_CACHE_MAX_ENTRIES, settings.ANSWER_CACHE_TTL_SECONDS)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a student question so trivially different phrasings share a key."""
+    text = normalize_text(query)
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def make_answer_key(
+    user_query: str,
+    syllabus_versions: Dict[str, int],
+    model_name: str,
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    system_prompt: str,
+    current_date: str,
+    user_prompt_hash: str = ""
+) -> str:
+    """
+    Build the answer cache key.
+
+    The current date is part of the key because the user prompt includes it,
+    so "when is the next exam?" is not served across days. user_prompt_hash is
+    the content hash of the user prompt template, so editing it invalidates.
+    """
+    payload = {
+        "query": normalize_query(user_query),
+        "syllabi": sorted(syllabus_versions.items()),
+        "model": model_name,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        "user_prompt": user_prompt_hash,
+        "date": current_date
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
@@ -0,0 +1,206 @@
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, Deque, List, Optional
+
+from app.core.config import settings
+from app.core import llm_client
+
+logger = logging.getLogger(__name__)
+
+# Appended to the system prompt of every tier except the last one
+_CONFIDENCE_INSTRUCTIONS = (
+    "\n\nRespond with a JSON object of the form "
+    '{"answer": "<your answer to the user>", "confidence": <number between 0 and 1>}. '
+    "confidence is how sure you are that the answer is fully supported by the context; "
+    "use a low value if the context is missing, ambiguous or contradictory."
+)
+
+
+@dataclass
+class CascadeTier:
+    """One model in the cascade, cheapest first."""
+    model: str
+    max_tokens: int = 1500
+    temperature: Optional[float] = None
+    reasoning_effort: Optional[str] = None
+
+    @classmethod
+    def from_setting(cls, value: Dict[str, Any]) -> "CascadeTier":
+        return cls(**value)
+
+
+@dataclass
+class CascadeResult:
+    answer: str
+    model: str
+    tier: int
+    confidence: Optional[float] = None
+    escalations: List[str] = field(default_factory=list)  # reasons, one per skipped tier
+
+
+class _TierStats:
+    def __init__(self):
+        self.calls = 0
+        self.accepted = 0
+        self.escalated = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=500)
+
+    def as_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "accepted": self.accepted,
+            "escalated": self.escalated,
+            "errors": self.errors,
+            "escalation_rate": self.escalated / self.calls if self.calls else 0.0,
+            "avg_latency_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p95_latency_seconds": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else 0.0
+        }
+
+
+_tier_stats: Dict[str, _TierStats] = {}
+
+
+def _stats_for(tier: int, model: str) -> _TierStats:
+    key = f"{tier}:{model}"
+    if key not in _tier_stats:
+        _tier_stats[key] = _TierStats()
+    return _tier_stats[key]
+
+
+def get_tiers() -> List[CascadeTier]:
+    return [CascadeTier.from_setting(tier) for tier in settings.CHAT_CASCADE_TIERS]
+
+
+def parse_confidence(content: str) -> Optional[Dict[str, Any]]:
+    """Parse the {"answer", "confidence"} object, tolerating code fences around it."""
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):]
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("answer"), str):
+        return None
+    try:
+        parsed["confidence"] = float(parsed.get("confidence"))
+    except (TypeError, ValueError):
+        return None
+    return parsed
+
+
+def _completion_params(tier: CascadeTier, messages: List[Dict[str, str]], temperature: float) -> Dict[str, Any]:
+    params: Dict[str, Any] = {
+        "model": tier.model,
+        "messages": messages,
+        "temperature": tier.temperature if tier.temperature is not None else temperature,
+        "max_tokens": tier.max_tokens
+    }
+    if tier.reasoning_effort:
+        params["reasoning_effort"] = tier.reasoning_effort
+    return params
+
+
+async def cascade_completion(
+    system_prompt: str,
+    user_query: str,
+    tiers: Optional[List[CascadeTier]] = None,
+    min_confidence: Optional[float] = None,
+    temperature: float = 0.5,
+    kind: str = "generation",
+    history: Optional[List[Dict[str, str]]] = None,
+    api_key: Optional[str] = None
+) -> CascadeResult:
+    """
+    Answer with the cheapest tier that is confident enough.
+
+    Every tier but the last answers in a structured {"answer", "confidence"}
+    form. Its answer is accepted when the confidence reaches `min_confidence`;
+    a lower confidence, an unparseable reply or an error escalates to the next
+    tier. The last tier answers in plain text and is always accepted.
+
+    Args:
+        system_prompt: System prompt including the retrieved context.
+        user_query: The student's question.
+        tiers: Models to try in order, defaults to settings.CHAT_CASCADE_TIERS.
+        min_confidence: Defaults to settings.CASCADE_MIN_CONFIDENCE.
+        temperature: Used for tiers that do not set their own.
+        kind: Call kind for the completion cache and scheduler.
+        history: Earlier conversation messages, sent between the system
+            prompt and the query.
+        api_key: Passed to every tier's call when given.
+
+    Raises:
+        Exception: Whatever the last tier raised, if it failed.
+    """
+    tiers = tiers or get_tiers()
+    if min_confidence is None:
+        min_confidence = settings.CASCADE_MIN_CONFIDENCE
+    escalations: List[str] = []
+
+    for i, tier in enumerate(tiers):
+        is_last = i == len(tiers) - 1
+        stats = _stats_for(i, tier.model)
+        stats.calls += 1
+        messages = [
+            {"role": "system", "content": system_prompt if is_last else system_prompt + _CONFIDENCE_INSTRUCTIONS},
+            *(history or []),
+            {"role": "user", "content": user_query}
+        ]
+        params = _completion_params(tier, messages, temperature)
+        if api_key:
+            params["api_key"] = api_key
+        if not is_last:
+            params["response_format"] = {"type": "json_object"}
+
+        started = time.monotonic()
+        try:
+            response = await llm_client.acompletion(kind=kind, **params)
+        except Exception as e:
+            stats.errors += 1
+            if is_last:
+                raise
+            logger.warning(f"Cascade tier {i} ({tier.model}) failed, escalating: {e}")
+            stats.escalated += 1
+            escalations.append(f"{tier.model}: error")
+            continue
+        finally:
+            stats.latencies.append(time.monotonic() - started)
+
+        content = (response.choices[0].message.content or "").strip()
+        if is_last:
+            stats.accepted += 1
+            return CascadeResult(answer=content, model=tier.model, tier=i, escalations=escalations)
+
+        parsed = parse_confidence(content)
+        if parsed is None:
+            reason = "unparseable"
+        elif parsed["confidence"] < min_confidence:
+            reason = f"confidence {parsed['confidence']:.2f}"
+        else:
+            stats.accepted += 1
+            return CascadeResult(
+                answer=parsed["answer"].strip(),
+                model=tier.model,
+                tier=i,
+                confidence=parsed["confidence"],
+                escalations=escalations
+            )
+        stats.escalated += 1
+        escalations.append(f"{tier.model}: {reason}")
+        logger.info(f"Cascade tier {i} ({tier.model}) escalating ({reason})")
+
+    raise ValueError("Cascade has no tiers configured")
+
+
+def get_cascade_stats() -> Dict[str, Any]:
+    return {
+        "min_confidence": settings.CASCADE_MIN_CONFIDENCE,
+        "tiers": {key: stats.as_dict() for key, stats in _tier_stats.items()}
+    }
@@ -1,5 +1,5 @@
 import os
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from functools import lru_cache
 from pydantic_settings import BaseSettings
 from pydantic import computed_field
@@ -35,6 +35,117 @@ class Settings(BaseSettings):
     RETRIEVAL_LLM_MODEL: Optional[str] = "gpt-3.5-turbo"
     GENERATION_LLM_MODEL: str = "gpt-4"
     
+    # Retrieval settings
+    RETRIEVAL_MODE: str = "bm25"  # "bm25" (local, default), "vector" or "llm" (a CHAT_RETRIEVAL_MODEL call per course)
+    RETRIEVAL_TOP_K: int = 5
+    EMBEDDING_MODEL: str = "hashing"  # "hashing[-dim]" (local) or a litellm embedding model
+    CHAT_SPECULATIVE_GENERATION: bool = False  # "llm" mode: generate on BM25 context while LLM retrieval runs
+
+    # Course routing settings
+    ROUTING_TABLE_TTL_SECONDS: int = 300  # courses and subscriptions are reloaded this often
+    ROUTING_MAX_COURSES: int = 3  # courses a single question is answered from
+    ROUTING_MIN_KEYWORD_LENGTH: int = 4  # shorter name words (and prefix-stripped fragments) are too ambiguous
+
+    # Syllabus search settings
+    SYLLABUS_SEARCH_MAX_RESULTS: int = 50
+    SYLLABUS_SEARCH_MAX_CANDIDATES: int = 1000  # best-ranked matches fetched and checked for substring false positives
+    
+    # Token budget settings
+    DEFAULT_CONTEXT_WINDOW: int = 128000  # for models litellm has no metadata for
+    TOKEN_BUDGET_MARGIN: int = 512
+    
+    # Answer cache settings
+    ANSWER_CACHE_MAX_ENTRIES: int = 1024
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    
+    # Conversation history settings
+    CONVERSATION_HISTORY_LENGTH: int = 10  # turns passed to the chat model
+    CONVERSATION_CACHE_MAX_SENDERS: int = 10000
+    CONVERSATION_CACHE_TTL_SECONDS: int = 900
+    CONVERSATION_SUMMARY_ENABLED: bool = True  # older turns are sent as a rolling summary
+    CONVERSATION_RECENT_TURNS: int = 3  # turns always sent verbatim
+    CONVERSATION_SUMMARY_MIN_TURNS: int = 2  # older turns folded into the summary per update
+    CONVERSATION_SUMMARY_MODEL: str = "gpt-4o-mini"
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 300
+
+    # Message persistence settings
+    MESSAGE_WRITE_BATCH_SIZE: int = 100  # messages per insert_many
+    MESSAGE_WRITE_FLUSH_SECONDS: float = 1.0  # longest a message waits in the buffer
+    MESSAGE_WRITE_BUFFER_SIZE: int = 5000  # beyond this, requests wait for the flusher
+    MESSAGE_WRITE_MAX_RETRIES: int = 3
+
+    # LLM completion cache settings
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = ".cache/llm_completions.sqlite3"
+    LLM_CACHE_MAX_ENTRIES: int = 5000
+    LLM_CACHE_MAX_TEMPERATURE: Optional[float] = 0.2  # sampled completions above this are not cached (None caches all)
+    LLM_CACHE_TTLS: Dict[str, int] = {  # seconds per call kind, 0 disables caching for that kind
+        "structuring": 30 * 24 * 3600,
+        "retrieval": 24 * 3600,
+        "answer": 3600,
+        "generation": 3600,
+        "chat": 600,
+        "summary": 0,
+        "default": 3600
+    }
+    
+    # LLM scheduler settings
+    LLM_DEFAULT_CONCURRENCY: int = 8  # concurrent calls per model
+    LLM_MODEL_LIMITS: Dict[str, Dict[str, int]] = {}  # model -> {"concurrency": n, "tokens_per_minute": n}
+    
+    # LLM resilience settings
+    LLM_MAX_RETRIES: int = 3  # per model, for rate limits, timeouts and 5xx
+    LLM_RETRY_BASE_DELAY: float = 0.5  # seconds, doubled per attempt with full jitter
+    LLM_RETRY_MAX_DELAY: float = 8.0
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # consecutive failures before a model's circuit opens
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = 30.0
+    LLM_FALLBACK_MODELS: Dict[str, List[str]] = {  # tried in order when a model fails or its circuit is open
+        "gpt-4.1": ["gpt-4o"],
+        "gpt-4o-mini": ["gpt-4.1-mini"],
+        "o4-mini": ["gpt-4.1"]
+    }
+    LLM_DEADLINES: Dict[str, float] = {  # seconds per call kind, including retries
+        "chat": 30,
+        "generation": 30,
+        "retrieval": 20,
+        "answer": 180,
+        "structuring": 900,
+        "summary": 60,
+        "default": 60
+    }
+    
+    # LLM hedging settings
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_MODELS: Dict[str, str] = {"gpt-4o-mini": "gpt-4.1-mini"}  # primary -> secondary model
+    LLM_HEDGE_DEFAULT_DELAY: float = 2.0  # seconds, until enough latency samples exist
+    LLM_HEDGE_MIN_DELAY: float = 0.3
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    
+    # Model cascade settings
+    CHAT_CASCADE_TIERS: List[Dict[str, Any]] = [  # cheapest first, see app.core.cascade.CascadeTier
+        {"model": "gpt-4o-mini", "max_tokens": 1500},
+        {"model": "gpt-4.1", "max_tokens": 1500}
+    ]
+    CASCADE_MIN_CONFIDENCE: float = 0.7  # below this the next tier is tried
+    CHAT_RETRIEVAL_MODEL: str = "gpt-4.1"
+    NAIVE_REASONING_EFFORT: Optional[str] = "high"  # reasoning_effort for reasoning models in naive answering
+    NAIVE_REASONING_MAX_TOKENS: int = 30000
+    
+    # Syllabus ingestion settings
+    INGESTION_MODEL: str = "gpt-4o"
+    INGESTION_PAGES_PER_BATCH: int = 5  # PDFs longer than this are structured in page batches
+    INGESTION_MAX_CONCURRENCY: int = 8  # batches in flight per document (also bounded by LLM_MODEL_LIMITS)
+    INGESTION_MAX_RETRIES: int = 2  # per page, shared by its batch and the page-by-page retry (replaces LLM_MAX_RETRIES)
+    INGESTION_BATCH_MAX_TOKENS: int = 8000
+    INGESTION_TEXT_CHUNK_CHARS: int = 12000  # batch size for documents without pages (DOCX, text)
+    EXTRACTION_WORKERS: int = 4  # threads for local PDF/DOCX text extraction
+    EXTRACTION_MIN_PAGE_CHARS: int = 20  # pages with less extracted text are treated as scanned
+    INGESTION_WORKERS: int = 2  # background ingestion jobs run at a time
+    INGESTION_JOB_POLL_SECONDS: float = 5.0
+    INGESTION_JOB_LEASE_SECONDS: int = 600  # a running job without a heartbeat for this long is claimed again
+    INGESTION_JOB_MAX_ATTEMPTS: int = 3
+    INGESTION_MAX_UPLOAD_BYTES: int = 15 * 1024 * 1024  # jobs store the file in Mongo (16 MB document limit)
+    
     # WhatsApp API settings
     WHATSAPP_API_URL: Optional[str] = None
     WHATSAPP_API_TOKEN: Optional[str] = None
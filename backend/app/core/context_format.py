@@ -0,0 +1,160 @@
+"""
+Compact, token-efficient rendering of a syllabus version for LLM prompts.
+
+Compared with yaml.dump of the raw version data it drops empty and null
+fields, flattens calendar time slots into one line each and replaces
+instructor names repeated across the schedule with short codes listed once.
+The rendering is computed when a version is written and stored on the
+syllabus_versions document (llm_context).
+
+Run `python -m app.core.context_format` to compare it against the YAML dump
+for the bundled courses.
+"""
+import asyncio
+from collections import Counter
+from typing import Dict, Any, List
+
+import yaml
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+CONTEXT_FORMAT = "compact-v1"
+
+_HEADER_FIELDS = ("id", "name", "heb_name", "year", "semester")
+_HANDLED_FIELDS = set(_HEADER_FIELDS) | {"description", "personnel", "assignments", "tests", "schedule"}
+
+
+def prune(value: Any) -> Any:
+    """Recursively drop None, empty strings and empty containers."""
+    if isinstance(value, dict):
+        pruned = {k: prune(v) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        pruned = [prune(v) for v in value]
+        return [v for v in pruned if v not in (None, "", [], {})]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def _line(*parts: Any) -> str:
+    return " | ".join(str(p) for p in parts if p not in (None, "", []))
+
+
+def _instructor_codes(course: Dict[str, Any]) -> Dict[str, str]:
+    counts: Counter = Counter()
+    for entry in (course.get("schedule") or {}).get("calendar_entries") or []:
+        for slot in entry.get("time_slots") or []:
+            counts.update(slot.get("instructors") or [])
+    repeated = [name for name, count in counts.most_common() if count > 1]
+    return {name: f"P{i + 1}" for i, name in enumerate(repeated)}
+
+
+def render_compact_context(course_data: Dict[str, Any]) -> str:
+    """Render the `data` of a syllabus version in the compact LLM context format."""
+    course = prune(course_data)
+    lines: List[str] = [_line(*(course.get(f) for f in _HEADER_FIELDS))]
+
+    for key, text in (course.get("description") or {}).items():
+        lines.append(f"description.{key}: {text}")
+
+    personnel = course.get("personnel") or {}
+    for role, people in personnel.items():
+        people = people if isinstance(people, list) else [people]
+        names = list(dict.fromkeys(_line(p.get("name"), p.get("email")) for p in people if p))
+        if names:
+            lines.append(f"{role}: {'; '.join(names)}")
+
+    rest = {k: v for k, v in course.items() if k not in _HANDLED_FIELDS}
+    if rest:
+        lines.append(yaml.dump(rest, allow_unicode=True, sort_keys=False, width=10000, default_flow_style=None, Dumper=yaml.SafeDumper).strip())
+
+    if course.get("assignments"):
+        lines.append("assignments:")
+        for a in course["assignments"]:
+            lines.append("- " + _line(a.get("name"), _line(a.get("due_date"), a.get("due_time")), a.get("submission_method"), a.get("details")))
+
+    if course.get("tests"):
+        lines.append("tests:")
+        for t in course["tests"]:
+            moadim = "; ".join(_line(m.get("moad_name"), m.get("date"), m.get("time"), m.get("location")) for m in t.get("moadim") or [])
+            lines.append("- " + _line(t.get("name"), t.get("test_type"), t.get("notes"), moadim))
+
+    schedule = course.get("schedule") or {}
+    if schedule.get("general_notes"):
+        lines.append(f"schedule notes: {schedule['general_notes']}")
+    codes = _instructor_codes(course)
+    if codes:
+        lines.append("instructors: " + "; ".join(f"{code}={name}" for name, code in codes.items()))
+    if schedule.get("calendar_entries"):
+        lines.append("schedule (date day | time | subject | type | location | instructors | groups | details):")
+        for entry in schedule["calendar_entries"]:
+            day = " ".join(d for d in (entry.get("date"), entry.get("day_of_week_heb")) if d)
+            if entry.get("daily_notes"):
+                lines.append(f"{day} | note: {entry['daily_notes']}")
+            for slot in entry.get("time_slots") or []:
+                instructors = ",".join(codes.get(name, name) for name in slot.get("instructors") or [])
+                resources = "; ".join(_line(r.get("title"), r.get("url")) for r in slot.get("resources") or [])
+                lines.append(_line(
+                    day,
+                    "-".join(t for t in (slot.get("start_time"), slot.get("end_time")) if t),
+                    slot.get("subject"),
+                    slot.get("activity_type"),
+                    slot.get("location"),
+                    instructors,
+                    ",".join(slot.get("attending_groups") or []),
+                    slot.get("details"),
+                    resources
+                ))
+
+    return "\n".join(lines)
+
+
+async def ensure_llm_context(db: AsyncIOMotorDatabase, version_doc: Dict[str, Any]) -> str:
+    """
+    Return the stored compact context of a syllabus_versions document, rendering
+    and storing it first for versions written before the current format existed.
+    """
+    llm_context = version_doc.get("llm_context")
+    if llm_context and version_doc.get("llm_context_format") == CONTEXT_FORMAT:
+        return llm_context
+    llm_context = await asyncio.to_thread(render_compact_context, version_doc["data"])
+    await db.syllabus_versions.update_one(
+        {"_id": version_doc["_id"]},
+        {"$set": {"llm_context": llm_context, "llm_context_format": CONTEXT_FORMAT}}
+    )
+    version_doc["llm_context"] = llm_context
+    version_doc["llm_context_format"] = CONTEXT_FORMAT
+    return llm_context
+
+
+def _benchmark() -> None:
+    import litellm
+
+    from app.db.init_data import YAMLS_DIR
+    from app.models.syllabus import SyllabusCourse
+
+    print(f"{'course':<16}{'yaml bytes':>12}{'compact':>10}{'yaml tok':>10}{'compact':>10}{'saved':>8}")
+    totals = [0, 0, 0, 0]
+    for path in sorted(YAMLS_DIR.glob("*.yaml")):
+        with open(path, "r", encoding="utf-8") as f:
+            course = yaml.safe_load(f)["courses"][0]
+        try:
+            # Same shape as the stored version data, including unset fields
+            course = SyllabusCourse(**course).model_dump()
+        except ValueError:
+            pass
+        yaml_text = yaml.dump({"courses": [course]}, allow_unicode=True, sort_keys=False, Dumper=yaml.SafeDumper)
+        compact_text = render_compact_context(course)
+        row = [
+            len(yaml_text.encode("utf-8")),
+            len(compact_text.encode("utf-8")),
+            litellm.token_counter(model="gpt-4o", text=yaml_text),
+            litellm.token_counter(model="gpt-4o", text=compact_text),
+        ]
+        totals = [t + r for t, r in zip(totals, row)]
+        print(f"{path.stem:<16}{row[0]:>12}{row[1]:>10}{row[2]:>10}{row[3]:>10}{1 - row[3] / row[2]:>8.0%}")
+    print(f"{'total':<16}{totals[0]:>12}{totals[1]:>10}{totals[2]:>10}{totals[3]:>10}{1 - totals[3] / totals[2]:>8.0%}")
+
+
+if __name__ == "__main__":
+    _benchmark()
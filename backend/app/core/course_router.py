@@ -0,0 +1,214 @@
+"""
+Routing of chat questions to courses.
+
+Senders subscribe to courses (the `subscriptions` collection: sender, the
+course ids they take and their student group per course). A question goes to
+the courses it names, matched by keywords from the course names, `heb_name`
+and course id; failing that to the sender's subscribed courses; failing that
+to the newest syllabus. A subscribed sender's question only leaves their
+courses when it names another course outright (its id, or at least half the
+words of its name): a single shared word such as "examination" does not.
+
+Courses and subscriptions are held in an in-process routing table, so routing
+costs no query per message. The table is reloaded after
+ROUTING_TABLE_TTL_SECONDS, and at once when a syllabus version or a
+subscription changes in this process (invalidate()).
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.lexical_index import tokenize, words
+
+logger = logging.getLogger(__name__)
+
+# Words common in course names and in questions alike; they never route a question on their own
+_GENERIC_TERMS = set(tokenize(
+    "and the for with of in to course program year semester introduction basic general clinical medical "
+    "קורס מבוא תוכנית שנתי שנה סמסטר כללית כללי רפואית רפואי של עם"
+))
+
+
+@dataclass
+class CourseEntry:
+    course_id: str
+    syllabus_id: str
+    version: int
+    name: str
+    heb_name: str
+    keywords: Set[str] = field(default_factory=set)
+    id_terms: Set[str] = field(default_factory=set)
+    # The significant words of the English and of the Hebrew name, each word as its set of forms
+    name_words: List[List[Set[str]]] = field(default_factory=list)
+
+
+@dataclass
+class Route:
+    courses: List[CourseEntry]
+    groups: Dict[str, str]  # course_id -> the sender's student group
+    reason: str  # "keywords", "subscription" or "default"
+
+
+def _name_words(name: str) -> List[Set[str]]:
+    """The significant words of a course name, each with its prefix-stripped Hebrew forms."""
+    name_words = []
+    for word in words(name):
+        forms = set(tokenize(word))
+        if forms & _GENERIC_TERMS:
+            continue
+        forms = {
+            term for term in forms
+            if len(term) >= settings.ROUTING_MIN_KEYWORD_LENGTH and not term.isdigit()
+        }
+        if forms:
+            name_words.append(forms)
+    return name_words
+
+
+def _course_entry(course_id: str, syllabus_id: str, version: int, name: str, heb_name: str) -> CourseEntry:
+    name_words = [_name_words(name), _name_words(heb_name)]
+    # Ids are tokenized like questions, so "0102-2314" matches whatever its separators
+    id_terms = set(tokenize(course_id))
+    return CourseEntry(
+        course_id=course_id,
+        syllabus_id=syllabus_id,
+        version=version,
+        name=name,
+        heb_name=heb_name,
+        keywords=set().union(*(forms for words_of_name in name_words for forms in words_of_name)) | id_terms,
+        id_terms=id_terms,
+        name_words=name_words
+    )
+
+
+class RoutingTable:
+    def __init__(self):
+        self.courses: Dict[str, CourseEntry] = {}
+        self.subscriptions: Dict[str, Dict[str, Optional[str]]] = {}  # sender -> {course_id: group}
+        self.keyword_index: Dict[str, Set[str]] = {}  # term -> course ids
+        self.newest: Optional[str] = None
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self.loads = 0
+        self.stats = {"keywords": 0, "subscription": 0, "default": 0}
+
+    def invalidate(self) -> None:
+        self.loaded_at = 0.0
+
+    async def ensure_loaded(self, db: AsyncIOMotorDatabase) -> None:
+        if time.monotonic() - self.loaded_at < settings.ROUTING_TABLE_TTL_SECONDS:
+            return
+        async with self._lock:
+            if time.monotonic() - self.loaded_at < settings.ROUTING_TABLE_TTL_SECONDS:
+                return
+            await self._load(db)
+
+    async def _load(self, db: AsyncIOMotorDatabase) -> None:
+        started = time.perf_counter()
+        courses: Dict[str, CourseEntry] = {}
+        newest = None
+        async for doc in db.syllabi.find({}, {"course_id": 1, "current_version": 1, "metadata": 1}).sort("_id", 1):
+            meta = doc.get("metadata") or {}
+            course_id = doc.get("course_id") or str(doc["_id"])
+            courses[course_id] = _course_entry(
+                course_id, str(doc["_id"]), doc["current_version"], meta.get("name") or "", meta.get("heb_name") or ""
+            )
+            newest = course_id
+
+        # Only terms that single out one course route a question ("clinical", "מבוא" ... do not)
+        frequency = Counter(term for course in courses.values() for term in course.keywords)
+        keyword_index: Dict[str, Set[str]] = {}
+        for course in courses.values():
+            course.keywords = {term for term in course.keywords if frequency[term] == 1}
+            for term in course.keywords:
+                keyword_index.setdefault(term, set()).add(course.course_id)
+
+        subscriptions: Dict[str, Dict[str, Optional[str]]] = {}
+        async for doc in db.subscriptions.find({}, {"_id": 0, "sender": 1, "courses": 1}):
+            subscriptions[doc["sender"]] = {c["course_id"]: c.get("group") for c in doc.get("courses") or []}
+
+        self.courses, self.keyword_index, self.subscriptions, self.newest = courses, keyword_index, subscriptions, newest
+        self.loaded_at = time.monotonic()
+        self.loads += 1
+        logger.info(
+            f"Loaded routing table: {len(courses)} courses, {len(keyword_index)} keywords, "
+            f"{len(subscriptions)} subscribers in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def match_keywords(self, query: str) -> List[str]:
+        """Course ids named in the query, most keyword hits first."""
+        hits: Counter = Counter()
+        for term in set(tokenize(query)):
+            for course_id in self.keyword_index.get(term, ()):
+                hits[course_id] += 1
+        return [course_id for course_id, _ in hits.most_common()]
+
+    @staticmethod
+    def names_course(course: CourseEntry, terms: Set[str]) -> bool:
+        """Whether query terms name a course outright: its id, or at least half the words of one of its names."""
+        if course.id_terms & course.keywords & terms:
+            return True
+        for name_words in course.name_words:
+            hits = sum(1 for forms in name_words if forms & terms)
+            if hits and hits * 2 >= len(name_words):
+                return True
+        return False
+
+    def route(self, sender_id: str, query: str) -> Route:
+        subscribed = self.subscriptions.get(sender_id, {})
+        named = self.match_keywords(query)
+        if subscribed:
+            # Any keyword picks among the sender's own courses; leaving them takes naming another course outright
+            terms = set(tokenize(query))
+            own = [course_id for course_id in named if course_id in subscribed]
+            other = [course_id for course_id in named if course_id not in subscribed and self.names_course(self.courses[course_id], terms)]
+            if own or other:
+                course_ids, reason = own or other, "keywords"
+            else:
+                course_ids, reason = [course_id for course_id in subscribed if course_id in self.courses], "subscription"
+        elif named:
+            course_ids, reason = named, "keywords"
+        else:
+            course_ids, reason = [self.newest] if self.newest else [], "default"
+        course_ids = course_ids[:settings.ROUTING_MAX_COURSES]
+        self.stats[reason] += 1
+        return Route(
+            courses=[self.courses[course_id] for course_id in course_ids if course_id in self.courses],
+            groups={course_id: subscribed[course_id] for course_id in course_ids if subscribed.get(course_id)},
+            reason=reason
+        )
+
+
+routing_table = RoutingTable()
+
+
+async def route_question(db: AsyncIOMotorDatabase, sender_id: str, query: str) -> Route:
+    await routing_table.ensure_loaded(db)
+    return routing_table.route(sender_id, query)
+
+
+async def set_subscription(db: AsyncIOMotorDatabase, sender_id: str, courses: List[Dict[str, Any]]) -> None:
+    """Replace a sender's courses: [{"course_id": ..., "group": ...}]."""
+    await db.subscriptions.update_one(
+        {"sender": sender_id},
+        {"$set": {"courses": courses, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    routing_table.invalidate()
+
+
+def get_routing_stats() -> Dict[str, Any]:
+    return {
+        "courses": len(routing_table.courses),
+        "subscribers": len(routing_table.subscriptions),
+        "keywords": len(routing_table.keyword_index),
+        "loads": routing_table.loads,
+        "routes": dict(routing_table.stats)
+    }
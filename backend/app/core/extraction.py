@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import io
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PDF_MIME_TYPE = "application/pdf"
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Column gaps in layout-mode PDF text become cell separators
+_COLUMN_GAP_RE = re.compile(r"[ \t]{3,}")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+_executor = ThreadPoolExecutor(max_workers=settings.EXTRACTION_WORKERS, thread_name_prefix="extract")
+_extractions = TTLCache(max_entries=256, ttl_seconds=24 * 3600)
+
+
+@dataclass
+class ExtractedPage:
+    number: int  # 1-based
+    text: str
+
+    @property
+    def has_text(self) -> bool:
+        """False for scanned pages without a usable text layer."""
+        return len(self.text.strip()) >= settings.EXTRACTION_MIN_PAGE_CHARS
+
+
+@dataclass
+class ExtractedDocument:
+    sha256: str
+    mime_type: str
+    pages: List[ExtractedPage] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(page.text for page in self.pages if page.text)
+
+    @property
+    def scanned_pages(self) -> List[int]:
+        return [page.number for page in self.pages if not page.has_text]
+
+
+def _clean(text: str) -> str:
+    lines = [_COLUMN_GAP_RE.sub(" | ", line.rstrip()) for line in text.splitlines()]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def extract_pdf_pages(file_content: bytes) -> List[ExtractedPage]:
+    """Text of each PDF page; layout mode keeps table columns apart."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(file_content))
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text(extraction_mode="layout")
+        except Exception as e:
+            logger.warning(f"Could not extract text from PDF page {number}: {e}")
+            text = ""
+        pages.append(ExtractedPage(number, _clean(text)))
+    return pages
+
+
+def extract_docx_text(file_content: bytes) -> str:
+    """Paragraphs and tables of a DOCX body, in document order; table rows as 'cell | cell'."""
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = Document(io.BytesIO(file_content))
+    blocks = []
+    for child in document.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            text = Paragraph(child, document).text.strip()
+            if text:
+                blocks.append(text)
+        elif tag == "tbl":
+            rows = []
+            for row in Table(child, document).rows:
+                # Merged cells repeat across the row; keep each once
+                cells = list(dict.fromkeys(cell.text.strip() for cell in row.cells))
+                if any(cells):
+                    rows.append(" | ".join(cells))
+            if rows:
+                blocks.append("\n".join(rows))
+    return "\n".join(blocks)
+
+
+def _extract(file_content: bytes, mime_type: str, sha256: str) -> Optional[ExtractedDocument]:
+    if mime_type == PDF_MIME_TYPE:
+        return ExtractedDocument(sha256, mime_type, extract_pdf_pages(file_content))
+    if mime_type == DOCX_MIME_TYPE:
+        return ExtractedDocument(sha256, mime_type, [ExtractedPage(1, extract_docx_text(file_content))])
+    if mime_type.startswith("text/"):
+        return ExtractedDocument(sha256, mime_type, [ExtractedPage(1, file_content.decode("utf-8", errors="replace"))])
+    return None
+
+
+async def extract_document(file_content: bytes, mime_type: str) -> Optional[ExtractedDocument]:
+    """
+    Extract the text of a PDF, DOCX or text file locally, in the extraction thread pool.
+    Results are cached by content hash, so re-uploads of the same file are free.
+
+    Returns:
+        The extracted document, or None for unsupported types and unreadable files.
+    """
+    sha256 = hashlib.sha256(file_content).hexdigest()
+    key = f"{sha256}:{mime_type}"
+    cached = _extractions.get(key)
+    if cached is not None:
+        return cached
+    try:
+        document = await asyncio.get_running_loop().run_in_executor(_executor, _extract, file_content, mime_type, sha256)
+    except Exception as e:
+        logger.error(f"Local extraction failed for {mime_type} file {sha256[:12]}: {e}")
+        return None
+    if document is not None:
+        logger.info(
+            f"Extracted {len(document.text)} characters from {len(document.pages)} page(s) of {sha256[:12]}"
+            + (f", scanned pages: {document.scanned_pages}" if document.scanned_pages else "")
+        )
+        _extractions.set(key, document)
+    return document
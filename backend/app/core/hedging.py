@@ -0,0 +1,183 @@
+"""
+Hedged LLM requests.
+
+If the primary model has not produced its first token (or, for non-streaming
+calls, its response) within a delay derived from its recent p95 latency, the
+same request is sent to a secondary model. Whichever answers first wins and
+the other call is cancelled.
+
+Hedging is for tail latency only: a primary that fails within the delay, or
+that fails with a non-retryable error, raises to the caller, whose retries
+and fallbacks (app.core.resilience) decide what happens next.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Deque, Optional, Tuple
+
+from app.core.config import settings
+from app.core.resilience import is_retryable
+
+logger = logging.getLogger(__name__)
+
+CompletionFn = Callable[..., Awaitable[Any]]
+
+
+class LatencyTracker:
+    """Recent first-token latencies per model."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        if model not in self._samples:
+            self._samples[model] = deque(maxlen=self.window)
+        self._samples[model].append(seconds)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        samples = sorted(self._samples.get(model, ()))
+        if not samples:
+            return None
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait for the primary before hedging: its p95, once enough samples exist."""
+        if len(self._samples.get(model, ())) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return settings.LLM_HEDGE_DEFAULT_DELAY
+        return max(self.percentile(model, 0.95), settings.LLM_HEDGE_MIN_DELAY)
+
+
+latency_tracker = LatencyTracker()
+_stats = {"calls": 0, "hedged": 0, "secondary_wins": 0}
+
+
+async def _prepend(first: Any, stream: Any) -> AsyncIterator[Any]:
+    yield first
+    async for chunk in stream:
+        yield chunk
+
+
+async def _attempt(completion_fn: CompletionFn, params: Dict[str, Any], tracker: LatencyTracker) -> Tuple[Any, Any]:
+    """
+    Run one call up to its first token. Returns (response or stream, first chunk).
+
+    The call's own first-token latency, from its own start, is recorded for its
+    model. A losing call cancelled before its first token records the time it
+    had waited: it would have taken at least that long, and leaving it out
+    would bias the model's p95 (and with it the hedge delay) low.
+    """
+    started = time.monotonic()
+    try:
+        response = await completion_fn(**params)
+        first = None
+        if params.get("stream"):
+            try:
+                first = await response.__anext__()
+            except BaseException:
+                await _close(response)
+                raise
+    except asyncio.CancelledError:
+        tracker.record(params["model"], time.monotonic() - started)
+        raise
+    tracker.record(params["model"], time.monotonic() - started)
+    return response, first
+
+
+async def _close(stream: Any) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception as e:
+            logger.debug(f"Error closing cancelled hedge stream: {e}")
+
+
+async def _cancel(task: asyncio.Task) -> None:
+    """Cancel a losing attempt and release whatever it already holds."""
+    if not task.done():
+        task.cancel()
+    try:
+        response, _ = await task
+    except BaseException:
+        return
+    await _close(response)
+
+
+async def hedged_call(
+    params: Dict[str, Any],
+    secondary_model: str,
+    completion_fn: CompletionFn,
+    delay: Optional[float] = None,
+    tracker: LatencyTracker = latency_tracker
+) -> Any:
+    """
+    Call completion_fn(**params), hedging to `secondary_model` if the primary is slow.
+
+    Args:
+        params: Completion parameters for the primary model (stream=True is supported).
+        secondary_model: Model that receives the duplicate request.
+        completion_fn: The completion function, e.g. litellm.acompletion.
+        delay: Seconds before hedging, defaults to the primary's p95 first-token latency.
+        tracker: Where each attempt's first-token latency is recorded.
+
+    Returns:
+        The winning response, or a stream whose first chunk has already arrived.
+
+    Raises:
+        Exception: The primary's error if it failed before the hedge, failed
+            with a non-retryable error, or both attempts failed.
+    """
+    primary_model = params["model"]
+    if delay is None:
+        delay = tracker.hedge_delay(primary_model)
+    _stats["calls"] += 1
+
+    primary = asyncio.ensure_future(_attempt(completion_fn, params, tracker))
+    pending = {primary}
+    winner: Optional[asyncio.Task] = None
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            # Answered or failed within the delay: errors are for the caller's retries, not the secondary
+            winner = primary
+        else:
+            _stats["hedged"] += 1
+            logger.info(f"{primary_model} gave no first token after {delay:.2f}s, hedging to {secondary_model}")
+            secondary = asyncio.ensure_future(_attempt(completion_fn, {**params, "model": secondary_model}, tracker))
+            pending = {primary, secondary}
+
+        while winner is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Prefer the primary when both finish together; skip attempts that failed
+            for task in sorted(done, key=lambda t: t is not primary):
+                if task.exception() is None:
+                    winner = task
+                    break
+            if winner is None and primary in done and not is_retryable(primary.exception()):
+                # The request itself was rejected: the secondary would fail the same way
+                winner = primary
+        if winner is None:
+            # Both failed: surface the primary's error
+            winner = primary
+    finally:
+        for task in pending:
+            await _cancel(task)
+
+    if winner is not primary:
+        _stats["secondary_wins"] += 1
+    response, first = winner.result()
+    if params.get("stream"):
+        return _prepend(first, response)
+    return response
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "p95_first_token_seconds": {
+            model: latency_tracker.percentile(model, 0.95) for model in latency_tracker._samples
+        }
+    }
+
@@ -0,0 +1,82 @@
+"""
+Recent conversation history per sender.
+
+The last CONVERSATION_HISTORY_LENGTH turns of each active sender are kept in
+an in-process ring buffer (a bounded deque), so building the history of a hot
+conversation needs no database round-trip. Buffers are updated when a turn is
+recorded, evicted least-recently-used beyond CONVERSATION_CACHE_MAX_SENDERS,
+and expire after CONVERSATION_CACHE_TTL_SECONDS, which bounds staleness when
+another process answered the same sender. A miss loads the buffer from the
+messages collection using the (sender, timestamp) index, merged with the
+sender's turns still waiting in the message writer's buffer.
+"""
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, Deque, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.message_writer import message_writer
+
+logger = logging.getLogger(__name__)
+
+conversation_cache = TTLCache(settings.CONVERSATION_CACHE_MAX_SENDERS, settings.CONVERSATION_CACHE_TTL_SECONDS)
+
+
+def _naive_utc(timestamp: datetime) -> datetime:
+    # Mongo returns naive UTC datetimes; keep buffered turns comparable with loaded ones
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _turn_key(turn: Dict[str, Any]) -> tuple:
+    # Mongo stores datetimes to the millisecond
+    timestamp = turn.get("timestamp")
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+    return turn.get("message"), timestamp
+
+
+async def _load_history(sender_id: str, db: AsyncIOMotorDatabase) -> Deque[Dict[str, Any]]:
+    limit = settings.CONVERSATION_HISTORY_LENGTH
+    # Taken before the read: a turn flushed meanwhile is then in one or the other
+    pending = message_writer.pending_for(sender_id)
+    history = await db.messages.find(
+        {"sender": sender_id},
+        {"_id": 0, "message": 1, "response": 1, "timestamp": 1}
+    ).sort("timestamp", -1).limit(limit).to_list(limit)
+    # Reverse to get chronological order
+    history.reverse()
+
+    loaded = {_turn_key(turn) for turn in history}
+    for doc in pending:
+        turn = {"message": doc.get("message"), "response": doc.get("response"), "timestamp": _naive_utc(doc["timestamp"])}
+        if _turn_key(turn) not in loaded:
+            history.append(turn)
+    if pending:
+        history.sort(key=lambda turn: turn["timestamp"])
+    return deque(history, maxlen=limit)
+
+
+async def get_conversation_history(sender_id: str, db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+    """Get recent conversation history for a user, oldest turn first."""
+    buffer = conversation_cache.get(sender_id)
+    if buffer is None:
+        buffer = await _load_history(sender_id, db)
+        conversation_cache.set(sender_id, buffer)
+    return list(buffer)
+
+
+def record_turn(sender_id: str, message: str, response: str, timestamp: datetime) -> None:
+    """
+    Append a turn to the sender's buffer, if it is cached. Call it when the
+    turn is answered, before the message is persisted, so the next turn sees
+    it even if the database write is still pending.
+    """
+    buffer = conversation_cache.peek(sender_id)
+    if buffer is not None:
+        buffer.append({"message": message, "response": response, "timestamp": _naive_utc(timestamp)})
@@ -0,0 +1,265 @@
+import asyncio
+import inspect
+import io
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Union
+
+from app.core.config import settings
+from app.core.extraction import PDF_MIME_TYPE, ExtractedDocument, ExtractedPage, extract_document
+from app.core.lexical_index import normalize_text
+from app.core.llm_services import process_syllabus_with_llm
+from app.core.resilience import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# Called with (pages done, total pages) after each batch finishes
+ProgressCallback = Callable[[int, int], Union[None, Awaitable[None]]]
+
+
+@dataclass
+class PageBatch:
+    """A run of pages structured in one LLM call, as extracted text or as a PDF for vision."""
+    first_page: int  # 1-based, inclusive
+    last_page: int
+    content: bytes
+    mime_type: str = PDF_MIME_TYPE
+
+    @property
+    def pages(self) -> int:
+        return self.last_page - self.first_page + 1
+
+
+def count_pdf_pages(file_content: bytes) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(io.BytesIO(file_content)).pages)
+
+
+def split_pdf(file_content: bytes, pages_per_batch: int, first_page: int = 1, last_page: Optional[int] = None) -> List[PageBatch]:
+    """Split (a page range of) a PDF into standalone PDFs of at most pages_per_batch pages."""
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(file_content))
+    last_page = last_page or len(reader.pages)
+    batches = []
+    for start in range(first_page, last_page + 1, pages_per_batch):
+        end = min(start + pages_per_batch - 1, last_page)
+        writer = PdfWriter()
+        for page_number in range(start, end + 1):
+            writer.add_page(reader.pages[page_number - 1])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        batches.append(PageBatch(start, end, buffer.getvalue()))
+    return batches
+
+
+def _text_batch(pages: List[ExtractedPage]) -> PageBatch:
+    if len(pages) == 1:
+        text = pages[0].text
+    else:
+        text = "\n\n".join(f"[page {page.number}]\n{page.text}" for page in pages)
+    return PageBatch(pages[0].number, pages[-1].number, text.encode("utf-8"), "text/plain")
+
+
+def _chunk_text(text: str, max_chars: int) -> List[ExtractedPage]:
+    """Split text without pages (DOCX, plain text) into chunks at line boundaries."""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in text.splitlines():
+        if current and size + len(line) > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [ExtractedPage(number, chunk) for number, chunk in enumerate(chunks, start=1)]
+
+
+def plan_batches(document: ExtractedDocument, file_content: bytes, pages_per_batch: int) -> List[PageBatch]:
+    """
+    Group pages into batches. Pages with a text layer are sent as text; only
+    runs of scanned pages are cut out of the PDF for the vision model.
+    """
+    if document.mime_type != PDF_MIME_TYPE:
+        return [_text_batch([chunk]) for chunk in _chunk_text(document.text, settings.INGESTION_TEXT_CHUNK_CHARS)]
+
+    batches: List[PageBatch] = []
+    run: List[ExtractedPage] = []
+
+    def flush() -> None:
+        if not run:
+            return
+        if run[0].has_text:
+            batches.append(_text_batch(run))
+        else:
+            batches.extend(split_pdf(file_content, len(run), run[0].number, run[-1].number))
+        run.clear()
+
+    for page in document.pages:
+        if run and (page.has_text != run[0].has_text or len(run) >= pages_per_batch):
+            flush()
+        run.append(page)
+    flush()
+    return batches
+
+
+def _single_pages(batch: PageBatch, document: Optional[ExtractedDocument], file_content: bytes) -> List[PageBatch]:
+    """The pages of a failed batch as batches of their own."""
+    if batch.mime_type == PDF_MIME_TYPE:
+        return split_pdf(file_content, 1, batch.first_page, batch.last_page)
+    return [_text_batch([page]) for page in document.pages[batch.first_page - 1:batch.last_page]]
+
+
+def merge_sections(batches: List[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    """
+    Merge the sections of consecutive page batches in document order.
+
+    Sections with the same (normalized) label are combined, since a section
+    such as the schedule often continues across a batch boundary. Content that
+    is already contained in the combined section is dropped, so pages that
+    were structured twice (e.g. retried) do not duplicate text.
+    """
+    merged: List[Dict[str, str]] = []
+    by_label: Dict[str, Dict[str, str]] = {}
+    for sections in batches:
+        for section in sections:
+            label = str(section.get("label") or "").strip()
+            content = str(section.get("content") or "").strip()
+            if not label and not content:
+                continue
+            key = " ".join(normalize_text(label).split()) or "general information"
+            existing = by_label.get(key)
+            if existing is None:
+                entry = {"label": label or "General Information", "content": content}
+                by_label[key] = entry
+                merged.append(entry)
+            elif content in existing["content"]:
+                continue
+            elif existing["content"] in content:
+                existing["content"] = content
+            else:
+                existing["content"] = f"{existing['content']}\n{content}"
+    return merged
+
+
+async def _report(progress: Optional[ProgressCallback], done: int, total: int) -> None:
+    if progress is None:
+        return
+    result = progress(done, total)
+    if inspect.isawaitable(result):
+        await result
+
+
+async def structure_document(
+        file_content: bytes,
+        filename: str,
+        mime_type: str,
+        model: Optional[str] = None,
+        pages_per_batch: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> Optional[List[Dict[str, str]]]:
+    """
+    Structure a syllabus into [{label, content}] sections.
+
+    Text and tables are first extracted locally (see app.core.extraction).
+    The document is then cut into page batches: pages with a text layer are
+    sent as text, and only scanned pages go to the vision model as PDF. The
+    batches are structured concurrently (at most max_concurrency at a time)
+    and merged in page order. A failed multi-page batch is retried page by
+    page, so one bad page does not lose its neighbours. Images go to the
+    vision model in one call.
+
+    Args:
+        max_retries: Retry budget of each page, covering both failed LLM calls
+            and unusable output. The batch attempt counts against it, and the
+            LLM client does not retry on top of it.
+        progress: Called with (pages done, total pages) as batches finish.
+
+    Returns:
+        The merged sections, or None if no batch could be structured.
+    """
+    model = model or settings.INGESTION_MODEL
+    pages_per_batch = pages_per_batch or settings.INGESTION_PAGES_PER_BATCH
+    max_concurrency = max_concurrency or settings.INGESTION_MAX_CONCURRENCY
+    max_retries = settings.INGESTION_MAX_RETRIES if max_retries is None else max_retries
+
+    started = time.perf_counter()
+    document = await extract_document(file_content, mime_type)
+    if document is None:
+        batches = [PageBatch(1, 1, file_content, mime_type)]
+    elif mime_type == PDF_MIME_TYPE:
+        batches = await asyncio.to_thread(plan_batches, document, file_content, pages_per_batch)
+    else:
+        batches = plan_batches(document, file_content, pages_per_batch)
+        # Chunks of a document without pages stand in for its pages
+        document = ExtractedDocument(document.sha256, document.mime_type, [
+            ExtractedPage(batch.first_page, batch.content.decode("utf-8")) for batch in batches
+        ])
+    total_pages = batches[-1].last_page if batches else 0
+    if not total_pages:
+        logger.error(f"No content to structure in {filename}")
+        return None
+    vision_pages = sum(batch.pages for batch in batches if batch.mime_type != "text/plain")
+    logger.info(
+        f"Structuring {filename}: {total_pages} pages in {len(batches)} batches "
+        f"({vision_pages} pages via vision), {max_concurrency} at a time"
+    )
+    limit = asyncio.Semaphore(max_concurrency)
+    pages_done = 0
+    failed_pages: List[int] = []
+
+    async def structure(batch: PageBatch, attempts: int) -> Optional[List[Dict[str, str]]]:
+        label = f"{filename} (pages {batch.first_page}-{batch.last_page})"
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(backoff_delay(attempt - 1))
+            async with limit:
+                # Responses that fail to parse are never cached, so a retry is a fresh completion
+                sections = await process_syllabus_with_llm(
+                    batch.content, label, batch.mime_type,
+                    model=model,
+                    max_tokens=settings.INGESTION_BATCH_MAX_TOKENS,
+                    max_retries=0
+                )
+            if sections is not None:
+                return sections
+            logger.warning(f"Structuring {label} failed (attempt {attempt + 1}/{attempts})")
+        return None
+
+    async def run(batch: PageBatch) -> List[Dict[str, str]]:
+        nonlocal pages_done
+        if batch.pages == 1:
+            sections = await structure(batch, max_retries + 1)
+        else:
+            sections = await structure(batch, 1)
+        if sections is None and batch.pages > 1:
+            # Isolate the failing page(s): each page spends the rest of its budget on its own
+            single_pages = await asyncio.to_thread(_single_pages, batch, document, file_content)
+            results = await asyncio.gather(*(structure(page, max_retries) for page in single_pages))
+            sections = []
+            for page, page_sections in zip(single_pages, results):
+                if page_sections is None:
+                    failed_pages.append(page.first_page)
+                else:
+                    sections.extend(page_sections)
+        elif sections is None:
+            failed_pages.append(batch.first_page)
+        pages_done += batch.pages
+        await _report(progress, pages_done, total_pages)
+        return sections or []
+
+    results = await asyncio.gather(*(run(batch) for batch in batches))
+    merged = merge_sections(results)
+    logger.info(
+        f"Structured {filename} into {len(merged)} sections in {time.perf_counter() - started:.1f}s"
+        + (f", failed pages: {sorted(failed_pages)}" if failed_pages else "")
+    )
+    if len(failed_pages) == total_pages:
+        return None
+    return merged
@@ -0,0 +1,288 @@
+"""
+Background syllabus ingestion jobs.
+
+An upload is stored as a job in the `ingestion_jobs` collection and returns
+at once; a small pool of workers claims queued jobs and runs extraction,
+structuring and version creation, recording the status and duration of each
+stage on the job. Jobs live in Mongo, so a restart loses nothing: a job
+whose worker stopped heart-beating is claimed again once its lease expires.
+
+Job lifecycle: queued -> running -> succeeded | failed.
+"""
+import asyncio
+import logging
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, Any, Awaitable, Callable, List, Optional
+
+from bson import Binary, ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.core.extraction import extract_document
+from app.core.ingestion import structure_document
+from app.core.timings import StageTimer
+from app.core.versions import create_syllabus, create_version
+from app.models.syllabus import SyllabusCourse
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("extraction", "structuring", "version")
+
+# Course fields required to create a new syllabus from an upload
+COURSE_FIELDS = ("course_id", "name", "heb_name", "year", "semester")
+
+
+class IngestionError(Exception):
+    """Raised when a job cannot complete; the message is stored on the job."""
+    pass
+
+
+async def enqueue_job(
+        db: AsyncIOMotorDatabase,
+        file_content: bytes,
+        filename: str,
+        mime_type: str,
+        syllabus_id: Optional[str] = None,
+        course: Optional[Dict[str, str]] = None,
+        change_summary: Optional[str] = None
+    ) -> str:
+    """
+    Queue a file for ingestion, as a new version of syllabus_id or, without
+    one, as a new syllabus described by course (see COURSE_FIELDS).
+
+    Returns:
+        The job id.
+    """
+    now = datetime.utcnow()
+    result = await db.ingestion_jobs.insert_one({
+        "status": "queued",
+        "filename": filename,
+        "mime_type": mime_type,
+        "size": len(file_content),
+        "file": Binary(file_content),
+        "syllabus_id": syllabus_id,
+        "course": course,
+        "change_summary": change_summary,
+        "stages": {name: {"status": "pending"} for name in STAGES},
+        "progress": {"pages_done": 0, "total_pages": None},
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now
+    })
+    ingestion_workers.notify()
+    logger.info(f"Queued ingestion job {result.inserted_id} for {filename} ({len(file_content)} bytes)")
+    return str(result.inserted_id)
+
+
+def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+    job = {k: v for k, v in job.items() if k not in ("file", "lease_until")}
+    job["id"] = str(job.pop("_id"))
+    return job
+
+
+async def get_job(db: AsyncIOMotorDatabase, job_id: str) -> Optional[Dict[str, Any]]:
+    job = await db.ingestion_jobs.find_one({"_id": ObjectId(job_id)}, {"file": 0})
+    return _public(job) if job else None
+
+
+async def list_jobs(db: AsyncIOMotorDatabase, status: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    query = {"status": status} if status else {}
+    cursor = db.ingestion_jobs.find(query, {"file": 0}).sort("created_at", -1).limit(limit)
+    return [_public(job) async for job in cursor]
+
+
+class IngestionWorkerPool:
+    """
+    Runs ingestion jobs in at most settings.INGESTION_WORKERS concurrent workers.
+
+    Workers wait on an event set by enqueue_job, and poll every
+    INGESTION_JOB_POLL_SECONDS for jobs queued by other processes or whose
+    lease expired.
+    """
+
+    def __init__(self):
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.tasks: List[asyncio.Task] = []
+        self.wakeup = asyncio.Event()
+        self.stats = {"succeeded": 0, "failed": 0, "reclaimed": 0}
+
+    async def start(self, db: AsyncIOMotorDatabase, workers: Optional[int] = None) -> None:
+        self.db = db
+        await db.ingestion_jobs.create_index([("status", 1), ("created_at", 1)])
+        workers = workers or settings.INGESTION_WORKERS
+        host = socket.gethostname()
+        self.tasks = [asyncio.create_task(self._work(f"{host}-{i}")) for i in range(workers)]
+        logger.info(f"Started {workers} ingestion workers")
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def notify(self) -> None:
+        self.wakeup.set()
+
+    async def _claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await self.db.ingestion_jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker,
+                    "lease_until": now + timedelta(seconds=settings.INGESTION_JOB_LEASE_SECONDS),
+                    "started_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _work(self, worker: str) -> None:
+        while True:
+            # Cleared before claiming, so a job queued meanwhile is not missed
+            self.wakeup.clear()
+            try:
+                job = await self._claim(worker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion worker {worker} could not claim a job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), settings.INGESTION_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if job["attempts"] > 1:
+                self.stats["reclaimed"] += 1
+            await self._run(job, worker)
+
+    async def _update(self, job_id: ObjectId, fields: Dict[str, Any], unset: Optional[Dict[str, Any]] = None) -> None:
+        now = datetime.utcnow()
+        update: Dict[str, Any] = {"$set": {
+            **fields,
+            "updated_at": now,
+            "lease_until": now + timedelta(seconds=settings.INGESTION_JOB_LEASE_SECONDS)
+        }}
+        if unset:
+            update["$unset"] = unset
+        await self.db.ingestion_jobs.update_one({"_id": job_id}, update)
+
+    async def _heartbeat(self, job_id: ObjectId) -> None:
+        while True:
+            await asyncio.sleep(settings.INGESTION_JOB_LEASE_SECONDS / 3)
+            await self._update(job_id, {})
+
+    async def _run(self, job: Dict[str, Any], worker: str) -> None:
+        job_id = job["_id"]
+        if job["attempts"] > settings.INGESTION_JOB_MAX_ATTEMPTS:
+            await self._finish(job_id, "failed", error=f"Gave up after {job['attempts'] - 1} attempts")
+            return
+        logger.info(f"Worker {worker} running ingestion job {job_id} ({job['filename']}, attempt {job['attempts']})")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await self._process(job)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so the next start picks it up
+            await asyncio.shield(self.db.ingestion_jobs.update_one(
+                {"_id": job_id}, {"$set": {"status": "queued", "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}}
+            ))
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            await self._finish(job_id, "failed", error=str(e))
+        else:
+            await self._finish(job_id, "succeeded", result=result)
+        finally:
+            heartbeat.cancel()
+
+    async def _finish(self, job_id: ObjectId, status: str, **fields: Any) -> None:
+        self.stats[status] += 1
+        # The uploaded file is only needed until the job is done
+        await self._update(job_id, {"status": status, "finished_at": datetime.utcnow(), **fields}, unset={"file": ""})
+
+    async def _process(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        job_id = job["_id"]
+        timer = StageTimer("ingestion")
+
+        async def run_stage(name: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+            await self._update(job_id, {f"stages.{name}": {"status": "running", "started_at": datetime.utcnow()}})
+            try:
+                async with timer.stage(name):
+                    value = await fn()
+            except asyncio.CancelledError:
+                # Shutting down: the job is handed back and the stage runs again when it is next claimed
+                await asyncio.shield(self._update(job_id, {f"stages.{name}": {"status": "pending"}}))
+                raise
+            except Exception as e:
+                await self._update(job_id, {
+                    f"stages.{name}.status": "failed",
+                    f"stages.{name}.seconds": round(timer.stages[name], 3),
+                    f"stages.{name}.error": str(e)
+                })
+                raise
+            await self._update(job_id, {f"stages.{name}.status": "done", f"stages.{name}.seconds": round(timer.stages[name], 3)})
+            return value
+
+        file_content = bytes(job["file"])
+
+        async def extraction():
+            # Cached by content hash, so structure_document does not extract again
+            document = await extract_document(file_content, job["mime_type"])
+            if document is not None:
+                await self._update(job_id, {"progress.total_pages": len(document.pages), "scanned_pages": document.scanned_pages})
+
+        async def progress(done: int, total: int) -> None:
+            await self._update(job_id, {"progress": {"pages_done": done, "total_pages": total}})
+
+        async def structuring():
+            sections = await structure_document(file_content, job["filename"], job["mime_type"], progress=progress)
+            if not sections:
+                raise IngestionError(f"Could not structure {job['filename']}")
+            return sections
+
+        await run_stage("extraction", extraction)
+        sections = await run_stage("structuring", structuring)
+        result = await run_stage("version", lambda: self._save_version(job, sections))
+        timer.finish()
+        return {**result, "sections": len(sections)}
+
+    async def _save_version(self, job: Dict[str, Any], sections: List[Dict[str, str]]) -> Dict[str, Any]:
+        change_summary = job.get("change_summary") or f"Structured from {job['filename']}"
+        if job.get("syllabus_id"):
+            syllabus_id = job["syllabus_id"]
+            syllabus_doc = await self.db.syllabi.find_one({"_id": ObjectId(syllabus_id)}, {"current_version": 1})
+            if not syllabus_doc:
+                raise IngestionError(f"Syllabus {syllabus_id} not found")
+            version_doc = await self.db.syllabus_versions.find_one(
+                {"syllabus_id": syllabus_id, "version": syllabus_doc["current_version"]}, {"data": 1}
+            )
+            if not version_doc:
+                raise IngestionError(f"Current version data not found for syllabus {syllabus_id}")
+            course = SyllabusCourse(**{**version_doc["data"], "document_sections": sections})
+            result = await create_version(self.db, syllabus_id, course, created_by="ingestion", change_summary=change_summary)
+            return {"syllabus_id": syllabus_id, **result}
+
+        meta = job["course"]
+        course = SyllabusCourse(
+            id=meta["course_id"], name=meta["name"], heb_name=meta["heb_name"],
+            year=meta["year"], semester=meta["semester"], document_sections=sections
+        )
+        syllabus_id = await create_syllabus(self.db, course, created_by="ingestion", change_summary=change_summary)
+        return {"syllabus_id": syllabus_id, "version": 1}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"workers": len(self.tasks), **self.stats}
+
+
+ingestion_workers = IngestionWorkerPool()
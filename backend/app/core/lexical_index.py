@@ -0,0 +1,127 @@
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.sections import build_sections
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_HEBREW_FINALS = str.maketrans("ךםןףץ", "כמנפצ")
+# Single-letter prefixes that attach to Hebrew words (ו, ה, ב, ל, מ, ש, כ)
+_HEBREW_PREFIXES = set("והבלמשכ")
+
+
+def _is_hebrew(token: str) -> bool:
+    return "\u0590" <= token[0] <= "\u05ff"
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop niqqud/diacritics and fold Hebrew final letters."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.translate(_HEBREW_FINALS)
+
+
+def words(text: str) -> List[str]:
+    """Split text into normalized words, without the prefix-stripped forms tokenize() adds."""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into index terms.
+
+    Hebrew tokens that start with common attached prefixes (up to two, as in
+    "ובבחינה") also emit the un-prefixed forms, so "הבחינה", "בבחינה" and
+    "ובבחינה" all match "בחינה".
+    """
+    terms: List[str] = []
+    for token in words(text):
+        terms.append(token)
+        if len(token) > 3 and _is_hebrew(token) and token[0] in _HEBREW_PREFIXES:
+            terms.append(token[1:])
+            if len(token) > 4 and token[1] in _HEBREW_PREFIXES:
+                terms.append(token[2:])
+    return terms
+
+
+class BM25Index:
+    """In-memory inverted index over syllabus sections scored with Okapi BM25."""
+
+    def __init__(self, sections: List[Dict[str, str]], k1: float = 1.5, b: float = 0.75):
+        self.sections = sections
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+
+        for doc_id, section in enumerate(sections):
+            terms = tokenize(f"{section.get('label', '')}\n{section.get('content', '')}")
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        n_docs = len(sections)
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[Dict[str, str], float]]:
+        """
+        Score all sections against the query.
+
+        Args:
+            query: Free text query (Hebrew or English).
+            top_k: Maximum number of sections to return.
+
+        Returns:
+            A list of (section, score) tuples sorted by descending score.
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in docs:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_doc_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.sections[doc_id], score) for doc_id, score in ranked]
+
+
+# syllabus_id -> (version, index)
+_indexes: Dict[str, Tuple[int, BM25Index]] = {}
+
+
+def rebuild_index(syllabus_id: str, version: int, course_data: Dict[str, Any]) -> BM25Index:
+    """Build the index for a syllabus version and replace any older one."""
+    index = BM25Index(build_sections(course_data))
+    _indexes[syllabus_id] = (version, index)
+    logger.info(f"Built BM25 index for syllabus {syllabus_id} v{version} ({len(index.sections)} sections)")
+    return index
+
+
+def get_index(syllabus_id: str, version: int, course_data: Optional[Dict[str, Any]] = None) -> Optional[BM25Index]:
+    """
+    Return the index for a syllabus version, building it if course_data is given
+    and the cached index is missing or belongs to another version.
+    """
+    cached = _indexes.get(syllabus_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    if course_data is None:
+        return None
+    return rebuild_index(syllabus_id, version, course_data)
+
+
+def clear_indexes() -> None:
+    """Drop all cached indexes. Useful for development/testing."""
+    _indexes.clear()
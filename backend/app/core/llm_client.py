@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, Callable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.hedging import hedged_call
+from app.core.llm_scheduler import Priority, llm_scheduler
+from app.core.resilience import call_with_resilience
+
+logger = logging.getLogger(__name__)
+
+# Parameters that do not change the completion and must not split the cache
+_NON_SEMANTIC_PARAMS = {"api_key", "api_base", "timeout", "metadata", "num_retries"}
+
+
+def make_completion_key(params: Dict[str, Any]) -> str:
+    """Hash the canonicalized completion parameters (model, messages, sampling options)."""
+    canonical = {k: v for k, v in params.items() if k not in _NON_SEMANTIC_PARAMS and v is not None}
+    payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionStore:
+    """
+    Bounded SQLite store of serialized completions, keyed by content hash.
+
+    Each entry carries the kind of call that produced it (structuring,
+    retrieval, ...) so TTLs can differ per kind. When the store grows past
+    max_entries the least recently used entries are dropped.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, response TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions(accessed_at)")
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response, expires_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, kind: str, response: Dict[str, Any], ttl_seconds: int) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, kind, response, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(response, ensure_ascii=False, default=str), now + ttl_seconds, now)
+            )
+            conn.execute(
+                "DELETE FROM completions WHERE key IN ("
+                " SELECT key FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM completions")
+            conn.commit()
+
+
+completion_store = CompletionStore(settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_ENTRIES)
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "rejected": 0}
+
+
+def _ttl_for(kind: str) -> int:
+    return settings.LLM_CACHE_TTLS.get(kind, settings.LLM_CACHE_TTLS.get("default", 0))
+
+
+def _should_cache(kind: str, params: Dict[str, Any], use_cache: Optional[bool]) -> bool:
+    if use_cache is False or not settings.LLM_CACHE_ENABLED or params.get("stream"):
+        return False
+    if _ttl_for(kind) <= 0:
+        return False
+    if use_cache is None and settings.LLM_CACHE_MAX_TEMPERATURE is not None:
+        # Sampling above the threshold is treated as intentionally non-deterministic
+        return (params.get("temperature") or 0.0) <= settings.LLM_CACHE_MAX_TEMPERATURE
+    return True
+
+
+# Scheduler priority per call kind; anything else is treated as student chat
+_KIND_PRIORITY = {
+    "structuring": Priority.INGESTION,
+    "answer": Priority.ADMIN,
+    "summary": Priority.ADMIN,
+}
+
+
+def _estimate_tokens(params: Dict[str, Any]) -> int:
+    """Cheap prompt plus output estimate for TPM accounting (~4 characters per token)."""
+    prompt_chars = len(json.dumps(params.get("messages", []), ensure_ascii=False, default=str))
+    return prompt_chars // 4 + (params.get("max_tokens") or 0)
+
+
+async def _scheduled_stream(priority: Priority, params: Dict[str, Any]) -> AsyncIterator[Any]:
+    """
+    Open a stream inside a scheduler slot and hold the slot for the stream's lifetime.
+
+    The first step only acquires the slot and opens the stream (see
+    _scheduled_completion), so connection errors surface before any chunk is
+    consumed. The slot is released when the stream is exhausted, fails, is
+    closed with aclose(), or is dropped: the event loop then closes the
+    generator, which runs the `async with` exit.
+    """
+    import litellm
+
+    async with llm_scheduler.slot(params["model"], priority, _estimate_tokens(params)):
+        stream = await litellm.acompletion(**params)
+        try:
+            yield None
+            async for chunk in stream:
+                yield chunk
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+async def _scheduled_completion(priority: Priority, params: Dict[str, Any]) -> Any:
+    if params.get("stream"):
+        stream = _scheduled_stream(priority, params)
+        # Acquire the slot and open the stream now, inside the caller's retries
+        await stream.__anext__()
+        return stream
+
+    import litellm
+
+    async with llm_scheduler.slot(params["model"], priority, _estimate_tokens(params)):
+        return await litellm.acompletion(**params)
+
+
+async def _attempt(priority: Priority, params: Dict[str, Any], hedge: Optional[bool]) -> Tuple[Any, str]:
+    """One resilience attempt. Returns (response, the model that produced it)."""
+    secondary_model = settings.LLM_HEDGE_MODELS.get(params.get("model"))
+    if hedge is None:
+        hedge = settings.LLM_HEDGING_ENABLED
+    if not hedge or not secondary_model:
+        return await _scheduled_completion(priority, params), params["model"]
+
+    models_by_response: Dict[int, str] = {}
+
+    async def hedge_attempt(**attempt_params: Any) -> Any:
+        # Each attempt is admitted through the scheduler on its own model
+        response = await _scheduled_completion(priority, attempt_params)
+        models_by_response[id(response)] = attempt_params["model"]
+        return response
+
+    response = await hedged_call(params, secondary_model, hedge_attempt)
+    return response, models_by_response.get(id(response), params["model"])
+
+
+async def _completion(
+    kind: str, priority: Priority, params: Dict[str, Any], hedge: Optional[bool], max_retries: Optional[int]
+) -> Tuple[Any, str]:
+    """Returns (response, the model that produced it), which differs from params["model"] after a fallback or hedge."""
+    return await call_with_resilience(
+        lambda attempt_params: _attempt(priority, attempt_params, hedge),
+        params,
+        kind=kind,
+        max_retries=max_retries
+    )
+
+
+async def acompletion(
+    kind: str = "default",
+    use_cache: Optional[bool] = None,
+    priority: Optional[Priority] = None,
+    hedge: Optional[bool] = None,
+    cache_if: Optional[Callable[[Any], bool]] = None,
+    max_retries: Optional[int] = None,
+    **params: Any
+) -> Any:
+    """
+    Drop-in wrapper around litellm.acompletion that serves repeats from the completion
+    cache and admits the remaining calls through the per-model LLM scheduler, with
+    retries, circuit breaking and model fallback (see app.core.resilience).
+
+    Args:
+        kind: Call-site category, used to pick the TTL from settings.LLM_CACHE_TTLS,
+            the deadline from settings.LLM_DEADLINES and the default scheduler priority.
+        use_cache: True/False to force or bypass the cache; None applies the
+            temperature policy from settings.LLM_CACHE_MAX_TEMPERATURE.
+        priority: Overrides the scheduler priority derived from `kind`.
+        hedge: True/False to force or disable hedging to the secondary model in
+            settings.LLM_HEDGE_MODELS; None follows settings.LLM_HEDGING_ENABLED.
+        cache_if: If given, a response is only cached, and a cached one only
+            served, when cache_if(response) is true, e.g. when it parses; a bad
+            response is then never replayed.
+        max_retries: Overrides settings.LLM_MAX_RETRIES for this call.
+        **params: Passed through to litellm.acompletion.
+
+    Returns:
+        The litellm response (streams are never cached).
+    """
+    if priority is None:
+        priority = _KIND_PRIORITY.get(kind, Priority.CHAT)
+
+    if not _should_cache(kind, params, use_cache):
+        _stats["bypassed"] += 1
+        response, _ = await _completion(kind, priority, params, hedge, max_retries)
+        return response
+
+    key = make_completion_key(params)
+    try:
+        cached = await asyncio.to_thread(completion_store.get, key)
+    except sqlite3.Error as e:
+        logger.warning(f"Completion cache read failed: {e}")
+        cached = None
+    if cached is not None:
+        from litellm import ModelResponse
+
+        response = ModelResponse(**cached)
+        # Entries written before cache_if applied to them may not pass it
+        if cache_if is None or cache_if(response):
+            _stats["hits"] += 1
+            logger.debug(f"Completion cache hit ({kind}) for {params.get('model')}")
+            return response
+
+    _stats["misses"] += 1
+    response, model = await _completion(kind, priority, params, hedge, max_retries)
+    if cache_if is not None and not cache_if(response):
+        _stats["rejected"] += 1
+        return response
+    if model != params["model"]:
+        # A fallback or hedged model answered: cache it as that model's answer, not the requested one's
+        key = make_completion_key({**params, "model": model})
+    try:
+        await asyncio.to_thread(completion_store.set, key, kind, response.model_dump(), _ttl_for(kind))
+    except sqlite3.Error as e:
+        logger.warning(f"Completion cache write failed: {e}")
+    return response
+
+
+def get_completion_cache_stats() -> Dict[str, Any]:
+    return dict(_stats)
@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, Any, AsyncIterator, Deque, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+    CHAT = 0
+    ADMIN = 1
+    INGESTION = 2
+
+
+class _ModelQueue:
+    """Concurrency slots, token-per-minute window and waiting requests for one model."""
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: Optional[int]):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future, int]] = []  # heap of (priority, seq, future, tokens)
+        self.token_log: Deque[Tuple[float, int]] = deque()  # (timestamp, tokens) in the last minute
+        self.wait_times: Dict[int, Deque[float]] = {p: deque(maxlen=500) for p in Priority}
+        self.served: Dict[int, int] = {p: 0 for p in Priority}
+        self.retry_timer: Optional[asyncio.TimerHandle] = None
+
+    def tokens_in_window(self, now: float) -> int:
+        while self.token_log and now - self.token_log[0][0] >= 60:
+            self.token_log.popleft()
+        return sum(tokens for _, tokens in self.token_log)
+
+    def can_start(self, tokens: int, now: float) -> bool:
+        if self.in_flight >= self.max_concurrency:
+            return False
+        if self.tokens_per_minute is None:
+            return True
+        used = self.tokens_in_window(now)
+        # A single request larger than the whole limit may still run on an idle window
+        return used + tokens <= self.tokens_per_minute or used == 0
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM provider.
+
+    Each model gets a bounded number of concurrent calls and an optional
+    token-per-minute budget. Requests wait in a priority queue, so student chat
+    is admitted before admin tests, and admin tests before ingestion.
+    """
+
+    def __init__(self, default_concurrency: int, model_limits: Dict[str, Dict[str, int]]):
+        self.default_concurrency = default_concurrency
+        self.model_limits = model_limits
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            limits = self.model_limits.get(model, {})
+            queue = _ModelQueue(
+                limits.get("concurrency", self.default_concurrency),
+                limits.get("tokens_per_minute")
+            )
+            self._queues[model] = queue
+        return queue
+
+    def _on_retry_timer(self, model: str) -> None:
+        self._queue(model).retry_timer = None
+        self._dispatch(model)
+
+    def _dispatch(self, model: str) -> None:
+        queue = self._queue(model)
+        now = time.monotonic()
+        while queue.waiters:
+            _, _, future, tokens = queue.waiters[0]
+            if future.done():  # cancelled while waiting
+                heapq.heappop(queue.waiters)
+                continue
+            if not queue.can_start(tokens, now):
+                break
+            heapq.heappop(queue.waiters)
+            queue.in_flight += 1
+            queue.token_log.append((now, tokens))
+            future.set_result(None)
+
+        if queue.waiters and queue.in_flight < queue.max_concurrency and queue.token_log and queue.retry_timer is None:
+            # Blocked on the token window: retry when its oldest entry expires
+            delay = max(60 - (now - queue.token_log[0][0]), 0.05)
+            queue.retry_timer = asyncio.get_running_loop().call_later(delay, self._on_retry_timer, model)
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: Priority = Priority.CHAT, estimated_tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Wait for an admission slot for `model`, hold it for the duration of the call.
+
+        Args:
+            model: Model name, each model has its own limits.
+            priority: Queue priority of the caller.
+            estimated_tokens: Prompt plus expected output tokens, charged to the TPM window.
+        """
+        queue = self._queue(model)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiters, (int(priority), next(self._seq), future, estimated_tokens))
+        enqueued_at = time.monotonic()
+        self._dispatch(model)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled: give the slot back
+                queue.in_flight -= 1
+                self._dispatch(model)
+            raise
+
+        waited = time.monotonic() - enqueued_at
+        queue.wait_times[int(priority)].append(waited)
+        queue.served[int(priority)] += 1
+        if waited > 1:
+            logger.info(f"LLM call to {model} ({priority.name}) waited {waited:.2f}s for a slot")
+        try:
+            yield
+        finally:
+            queue.in_flight -= 1
+            self._dispatch(model)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        result = {}
+        for model, queue in self._queues.items():
+            depth = {p.name: 0 for p in Priority}
+            for priority, _, future, _ in queue.waiters:
+                if not future.done():
+                    depth[Priority(priority).name] += 1
+            result[model] = {
+                "in_flight": queue.in_flight,
+                "max_concurrency": queue.max_concurrency,
+                "tokens_per_minute": queue.tokens_per_minute,
+                "tokens_in_window": queue.tokens_in_window(now),
+                "queue_depth": depth,
+                "served": {Priority(p).name: n for p, n in queue.served.items()},
+                "avg_wait_seconds": {
+                    Priority(p).name: (sum(w) / len(w) if w else 0.0) for p, w in queue.wait_times.items()
+                },
+                "max_wait_seconds": {
+                    Priority(p).name: (max(w) if w else 0.0) for p, w in queue.wait_times.items()
+                }
+            }
+        return result
+
+
+llm_scheduler = LLMScheduler(settings.LLM_DEFAULT_CONCURRENCY, settings.LLM_MODEL_LIMITS)
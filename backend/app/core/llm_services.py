@@ -1,24 +1,34 @@
 from datetime import datetime
-import litellm
+import asyncio
+import hashlib
 import os
 import json
 import logging
-from typing import Dict, Any, Optional, List, Union
+import re
+import time
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Optional, List, Tuple, TypeVar
 import base64
-from pathlib import Path
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from dataclasses import dataclass, field
 from functools import lru_cache
-import re
 
-from app.core.config import Settings
+from app.core.config import Settings, settings
+from app.core.course_router import Route, route_question
+from app.core import lexical_index, llm_client, token_budget, vector_index
+from app.core.cascade import cascade_completion
+from app.core.extraction import DOCX_MIME_TYPE, extract_document
+from app.core.history import get_conversation_history
+from app.core.summarizer import get_summary, prompt_turns
+from app.core.cache import answer_cache, make_answer_key, normalize_query
+from app.core.singleflight import chat_singleflight
+from app.core.prompt_registry import CompiledPrompt, PromptLoadError, prompt_registry
+from app.core.sections import build_sections, format_sections
+from app.core.timings import StageTimer
+from app.core.versions import get_version_doc
 
 logger = logging.getLogger(__name__)
-PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
-_prompt_cache: Dict[str, str] = {}
 
-class PromptLoadError(Exception):
-    """Custom exception for prompt loading errors."""
-    pass
+T = TypeVar("T")
 
 def load_prompt(
     filename: str, 
@@ -27,12 +37,13 @@ def load_prompt(
     fallback_content: Optional[str] = None
 ) -> str:
     """
-    Loads a prompt from the prompts directory with caching and validation.
+    Loads a prompt from the prompts directory through the prompt registry,
+    which re-reads the file only when its mtime changes.
     
     Args:
         filename: Name of the prompt file
-        use_cache: Whether to use cached version if available
-            validate: Whether to validate prompt content
+        use_cache: Whether to use the compiled version if the file is unchanged
+        validate: Whether to validate prompt content
         fallback_content: Content to return if file not found (instead of error)
     
     Returns:
@@ -41,54 +52,21 @@ def load_prompt(
     Raises:
         PromptLoadError: If file not found and no fallback provided
     """
-    # Check cache first
-    if use_cache and filename in _prompt_cache:
-        logger.debug(f"Using cached prompt: {filename}")
-        return _prompt_cache[filename]
-    
-    prompt_path = PROMPTS_DIR / filename
-    
+    return _get_compiled_prompt(filename, use_cache, validate, fallback_content).content
+
+def _get_compiled_prompt(
+    filename: str,
+    use_cache: bool = True,
+    validate: bool = True,
+    fallback_content: Optional[str] = None
+) -> CompiledPrompt:
     try:
-        if not prompt_path.exists():
-            if fallback_content is not None:
-                logger.warning(f"Prompt file not found: {filename}, using fallback")
-                return fallback_content
-            
-            available_files = list(PROMPTS_DIR.glob("*.txt")) if PROMPTS_DIR.exists() else []
-            raise PromptLoadError(
-                f"Prompt file not found: {filename}. "
-                f"Available files: {[f.name for f in available_files]}"
-            )
-        
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-        
-        # Validate prompt content
-        if validate:
-            _validate_prompt_content(content, filename)
-        
-        # Cache the prompt
-        if use_cache:
-            _prompt_cache[filename] = content
-            
-        logger.debug(f"Successfully loaded prompt: {filename}")
-        return content
-        
-    except (IOError, OSError) as e:
-        if fallback_content is not None:
-            logger.warning(f"Error loading prompt {filename}: {e}, using fallback")
-            return fallback_content
-        raise PromptLoadError(f"Error loading prompt {filename}: {e}")
-
-def _validate_prompt_content(content: str, filename: str) -> None:
-    """Validate prompt content for common issues."""
-    if not content:
-        raise PromptLoadError(f"Prompt file {filename} is empty")
-    
-    # Check for placeholder patterns that might need replacement
-    placeholders = re.findall(r'\{\{([^}]+)\}\}', content)
-    if placeholders:
-        logger.debug(f"Prompt {filename} contains placeholders: {placeholders}")
+        return prompt_registry.get(filename, validate=validate, force_reload=not use_cache)
+    except PromptLoadError as e:
+        if fallback_content is None:
+            raise
+        logger.warning(f"{e}, using fallback")
+        return CompiledPrompt(filename, fallback_content)
 
 def load_prompt_template(
     filename: str, 
@@ -96,32 +74,25 @@ def load_prompt_template(
     **kwargs
 ) -> str:
     """
-    Load a prompt template and substitute variables.
+    Load a prompt template and substitute variables in a single pass.
     
     Args:
         filename: Name of the prompt file
         variables: Dict of variables to substitute
-        **kwargs: Additional variables passed as keyword arguments
+        **kwargs: Passed to load_prompt (use_cache, validate, fallback_content)
     
     Returns:
         Prompt with variables substituted
     """
-    content = load_prompt(filename, **kwargs)
-    
-    if variables:
-        all_vars = {**variables, **kwargs}
-        
-        # Replace {{variable}} patterns
-        for key, value in all_vars.items():
-            placeholder = f"{{{{{key}}}}}"
-            content = content.replace(placeholder, str(value))
-    
-    return content
+    return _get_compiled_prompt(filename, **kwargs).render(variables)
+
+def get_prompt_hash(filename: str) -> str:
+    """Stable content hash of a prompt file, for cache keys."""
+    return prompt_registry.content_hash(filename)
 
 def clear_prompt_cache() -> None:
     """Clear the prompt cache. Useful for development/testing."""
-    global _prompt_cache
-    _prompt_cache.clear()
+    prompt_registry.clear()
     logger.info("Prompt cache cleared")
 
 def preload_prompts() -> None:
@@ -140,8 +111,40 @@ def preload_prompts() -> None:
         except PromptLoadError as e:
             logger.warning(f"Could not preload prompt {prompt_file}: {e}")
 
+@lru_cache(maxsize=256)
+def model_supports_reasoning(model_name: str) -> bool:
+    """litellm.supports_reasoning, cached: it walks litellm's model map on every call."""
+    import litellm
+
+    try:
+        return litellm.supports_reasoning(model_name)
+    except Exception as e:
+        logger.debug(f"Could not resolve reasoning support for {model_name}: {e}")
+        return False
+
 # --- LLM Interaction Functions --- 
 
+def parse_structured_sections(response_content: Optional[str]) -> Optional[List[Dict[str, str]]]:
+    """
+    Sections from a structuring response: a JSON list of {"label", "content"}
+    objects, or a single such object. None if the response is not one.
+    """
+    try:
+        structured_data = json.loads(response_content)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    if isinstance(structured_data, list) and all(isinstance(item, dict) and 'label' in item and 'content' in item for item in structured_data):
+        return structured_data
+    # Fallback: a single object with the right keys
+    if isinstance(structured_data, dict) and 'label' in structured_data and 'content' in structured_data:
+        return [structured_data]
+    return None
+
+def _is_complete_structuring(response: Any) -> bool:
+    """Whether a structuring response may be cached: not truncated, and parses."""
+    choice = response.choices[0]
+    return choice.finish_reason != "length" and parse_structured_sections(choice.message.content) is not None
+
 async def process_syllabus_with_llm(
         file_content: bytes,
         filename: str,
@@ -150,7 +153,9 @@ async def process_syllabus_with_llm(
         temperature: float = 1.0,
         max_tokens: int = 3000,
         response_format: str = "json_object",
-        prompt_filename: str = "syllabus_structuring.txt"
+        prompt_filename: str = "syllabus_structuring.txt",
+        use_cache: bool = True,
+        max_retries: Optional[int] = None
     ) -> Optional[List[Dict[str, str]]]:
     """
     Uses an LLM (like o4-mini with vision) to parse and structure syllabus content.
@@ -159,13 +164,20 @@ async def process_syllabus_with_llm(
         file_content: Raw bytes of the syllabus file.
         filename: Original name of the file.
         mime_type: Mime type of the file (e.g., 'application/pdf', 'image/jpeg').
+        use_cache: Passed to llm_client.acompletion. Structuring is cached at any
+            temperature, so re-uploading a document reuses its sections; False
+            forces a fresh completion.
+        max_retries: Retries of rate limits, timeouts and 5xx; None uses
+            settings.LLM_MAX_RETRIES.
 
     Returns:
         A list of structured sections [{"label": ..., "content": ...}] or None if failed.
     """
     # TODO: Refactor the entire thing to rely on litellm functions and be relyable and based of response format, acceptable meme type and check them against the available params on litellm model documentation.
-    structuring_prompt = load_prompt("syllabus_structuring.txt")
-    if not structuring_prompt:
+    try:
+        structuring_prompt = load_prompt(prompt_filename or "syllabus_structuring.txt")
+    except PromptLoadError as e:
+        logger.error(f"Could not load structuring prompt: {e}")
         return None
 
     messages = [
@@ -178,11 +190,6 @@ async def process_syllabus_with_llm(
             "content": [] # Content will be added based on mime_type
         }
     ]
-    if prompt_filename:
-        with open(PROMPTS_DIR / prompt_filename, 'r') as f:
-            structuring_prompt = f.read()
-    else:
-        structuring_prompt = load_prompt("syllabus_structuring.txt")
 
     # TODO: Add a tool to the llm that will allow it to search the file for the relevant information.
     # Prepare content for multimodal input if necessary
@@ -202,90 +209,107 @@ async def process_syllabus_with_llm(
                 }
             }
         ]
-    elif mime_type.startswith('text/') or mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-         # For DOCX, we might need to extract text first if model doesn't handle it
-         # For now, assume we pass raw text or the model handles it.
-         # A robust solution would extract text from DOCX here.
-         try:
-             # Simple text assumption for now
-             text_content = file_content.decode('utf-8')
-             messages[1]["content"] = [
-                 {
-                    "type": "text",
-                    "text": f"Please analyze the following syllabus document ({filename}):\n\n```\n{text_content}\n```"
-                 }
-            ]
-         except UnicodeDecodeError:
-             logger.error(f"Could not decode file {filename} as text. DOCX/other binary handling needed.")
+    elif mime_type.startswith('text/') or mime_type == DOCX_MIME_TYPE:
+         # DOCX (and text) is read locally: paragraphs and tables as plain text
+         document = await extract_document(file_content, mime_type)
+         if document is None:
+             logger.error(f"Could not extract text from {filename} ({mime_type}).")
              return None
+         messages[1]["content"] = [
+             {
+                "type": "text",
+                "text": f"Please analyze the following syllabus document ({filename}):\n\n```\n{document.text}\n```"
+             }
+        ]
     else:
         logger.warning(f"Unsupported mime_type for LLM processing: {mime_type}")
         return None
 
     try:
         logger.info(f"Sending syllabus {filename} to {model} for structuring.")
-        response = await litellm.acompletion(
+        response = await llm_client.acompletion(
+            kind="structuring",
             model=model,
             messages=messages,
-            temperature=1, # Lower temp for structured output
-            max_tokens=3000, # Adjust based on expected output size
-            response_format={"type": "json_object"} # Request JSON output if model supports it
+            temperature=temperature,
+            max_tokens=max_tokens, # Large documents are split into page batches, see app.core.ingestion
+            response_format={"type": response_format}, # Request JSON output if model supports it
+            use_cache=use_cache,
+            max_retries=max_retries,
+            # Truncated or unparseable output is never cached, so a retry asks the model again
+            cache_if=_is_complete_structuring
         )
         
         # Extract JSON content
         response_content = response.choices[0].message.content
+        if response.choices[0].finish_reason == "length":
+            logger.warning(f"Structuring output for {filename} hit max_tokens={max_tokens} and is truncated")
         logger.debug(f"Raw LLM structuring response: {response_content}")
         
-        structured_data = json.loads(response_content)
-        
-        # --- Validation with Fallback --- 
-        # 1. Check if it's the expected list format
-        if isinstance(structured_data, list) and all(isinstance(item, dict) and 'label' in item and 'content' in item for item in structured_data):
-            logger.info(f"Successfully parsed structured list for {filename}.")
-            return structured_data
-        # 2. Fallback: Check if it's a single dictionary with the correct keys
-        elif isinstance(structured_data, dict) and 'label' in structured_data and 'content' in structured_data:
-            logger.warning(f"LLM output for {filename} was a single object, not a list. Wrapping it.")
-            return [structured_data] # Wrap the single object in a list
-        # 3. If neither format matches, log error
-        else:
-            logger.error(f"LLM output for {filename} was not in the expected list or single object format.")
+        sections = parse_structured_sections(response_content)
+        if sections is None:
+            logger.error(f"LLM output for {filename} was not a JSON list of sections or a single section. Response: {response_content}")
             return None
+        logger.info(f"Successfully parsed {len(sections)} structured sections for {filename}.")
+        return sections
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON response from LLM for {filename}: {e}. Response: {response_content}")
-        return None
     except Exception as e:
         logger.error(f"Error calling LiteLLM for structuring {filename}: {e}")
         return None
 
-async def retrieve_relevant_sections(
+def parse_section_ids(response_text: str, known_ids: List[str]) -> List[str]:
+    """
+    Read the section ids from a retrieval response, keeping only known ids in
+    the order given. Falls back to scanning the text for known ids when the
+    response is not the expected JSON.
+    """
+    try:
+        parsed = json.loads(response_text)
+        ids = parsed.get("section_ids", []) if isinstance(parsed, dict) else parsed
+        if not isinstance(ids, list):
+            raise ValueError("section_ids is not a list")
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning(f"Retrieval response is not a JSON id list ({e}), scanning it for section ids")
+        ids = re.findall(r"[\w\-]+", response_text)
+    known = set(known_ids)
+    return list(dict.fromkeys(str(i) for i in ids if str(i) in known))
+
+async def select_relevant_sections(
         user_query: str,
         syllabus_sections: List[Dict[str, str]],
-        model: str = "gpt-4.1",
+        model: Optional[str] = None,
         temperature: float = 0.1,
-        max_tokens: int = 1000
-    ) -> Optional[str]:
+        max_tokens: int = 200
+    ) -> Optional[List[Dict[str, str]]]:
     """
     Uses a smaller LLM to identify relevant sections based on a user query.
+    The model only returns the ids of the relevant sections, so output tokens
+    do not grow with the section sizes.
 
     Args:
         user_query: The student's question.
-        syllabus_sections: The list of structured sections from the syllabus.
+        syllabus_sections: The list of structured sections from the syllabus,
+            as returned by build_sections (with stable ids).
 
     Returns:
-        The concatenated content of the relevant sections, or None.
+        The relevant sections, most relevant first (empty if none are), or
+        None if retrieval failed.
     """
-    model = "gpt-4.1" # As requested
-    retrieval_prompt_template = load_prompt("section_retrieval.txt")
-    if not retrieval_prompt_template:
-        return None
-
+    model = model or settings.CHAT_RETRIEVAL_MODEL
     # Format sections for the prompt
-    sections_json_str = json.dumps(syllabus_sections, indent=2)
+    sections_json_str = json.dumps(syllabus_sections, ensure_ascii=False, separators=(",", ":"))
     
-    prompt = retrieval_prompt_template.replace("{{USER_QUERY}}", user_query)
-    prompt = prompt.replace("{{SYLLABUS_SECTIONS_JSON}}", sections_json_str)
+    try:
+        prompt = load_prompt_template(
+            "section_retrieval.txt",
+            variables={
+                "USER_QUERY": user_query,
+                "SYLLABUS_SECTIONS_JSON": sections_json_str
+            }
+        )
+    except PromptLoadError as e:
+        logger.error(f"Could not load retrieval prompt: {e}")
+        return None
 
     messages = [
         {"role": "system", "content": "You are an AI assistant helping to find relevant information in syllabus sections."}, # Can refine this later
@@ -294,39 +318,71 @@ async def retrieve_relevant_sections(
 
     try:
         logger.info(f"Sending query and sections to {model} for retrieval.")
-        response = await litellm.acompletion(
+        response = await llm_client.acompletion(
+            kind="retrieval",
             model=model,
             messages=messages,
-            temperature=0.1, # Low temp for focused retrieval
-            max_tokens=1000 # Adjust based on expected max content size
+            temperature=temperature, # Low temp for focused retrieval
+            max_tokens=max_tokens, # Only ids come back
+            response_format={"type": "json_object"}
         )
 
-        response_text = response.choices[0].message.content.strip()
+        response_text = (response.choices[0].message.content or "").strip()
         logger.debug(f"Raw LLM retrieval response: {response_text}")
 
-        # Check if the model indicated no relevant info
-        if "no relevant information found" in response_text.lower():
-            return None
-        else:
-            return response_text # Return the identified relevant content
+        sections_by_id = {section["id"]: section for section in syllabus_sections}
+        section_ids = parse_section_ids(response_text, list(sections_by_id))
+        usage = getattr(response, "usage", None)
+        logger.info(
+            f"Retrieval selected {len(section_ids)} of {len(syllabus_sections)} sections "
+            f"({getattr(usage, 'completion_tokens', '?')} output tokens): {section_ids}"
+        )
+        return [sections_by_id[i] for i in section_ids]
 
     except Exception as e:
         logger.error(f"Error calling LiteLLM for retrieval: {e}")
         return None
 
-async def answer_question_naively_streamed(
+async def retrieve_relevant_sections(
+        user_query: str,
+        syllabus_sections: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.1,
+        max_tokens: int = 200
+    ) -> Optional[str]:
+    """
+    LLM section selection (see select_relevant_sections) with the context
+    assembled from the selected sections.
+
+    Returns:
+        The concatenated content of the relevant sections, or None.
+    """
+    selected = await select_relevant_sections(user_query, syllabus_sections, model, temperature, max_tokens)
+    if not selected:
+        return None
+    return format_sections(selected)
+
+async def stream_answer_naively(
     user_query: str, 
     full_syllabus_content: str,
     model_name: str = "o4-mini",
     system_prompt_override: Optional[str] = None,
     temperature: Optional[float] = 1.0, 
-    max_tokens: Optional[int] = 200     
-) -> str:
+    max_tokens: Optional[int] = 200,
+    syllabus_versions: Optional[Dict[str, int]] = None
+) -> AsyncIterator[str]:
     """
     Answers a question naively based on the full syllabus content, using a specific persona,
     allowing overrides for system prompt, temperature, max_tokens, and model.
-    Streams the response and returns the complete answer.
+    Yields the answer text as it arrives from the model. Reasoning models are not
+    streamed and yield their answer as a single chunk; errors yield an apology.
+
+    When syllabus_versions ({syllabus_id: current_version}) describes the content,
+    answers are served from and stored in the answer cache once complete.
     """
+    import litellm
+
+    current_date = datetime.now().strftime("%Y-%m-%d")
     
     try:
         default_system_message_template = load_prompt_template(
@@ -337,18 +393,19 @@ async def answer_question_naively_streamed(
             }
         )
         
-        user_prompt_template = load_prompt_template(
+        user_prompt = _get_compiled_prompt(
             "naive_question_answering_user.txt",
-            variables={
-                "USER_QUERY": user_query,
-                "CURRENT_DATE": datetime.now().strftime("%Y-%m-%d")
-            },
             fallback_content="היי, אני זקוק לעזרתך בשאלה הבאה, התאריך היום הוא {{CURRENT_DATE}}\nהשאלה שלי היא: {{USER_QUERY}}"
         )
+        user_prompt_template = user_prompt.render({
+            "USER_QUERY": user_query,
+            "CURRENT_DATE": current_date
+        })
 
     except PromptLoadError as e:
         logger.error(f"Critical error loading prompts: {e}")
-        return "Error: Could not load required prompt templates."
+        yield "Error: Could not load required prompt templates."
+        return
     
     effective_system_prompt = (
         system_prompt_override or 
@@ -361,208 +418,542 @@ async def answer_question_naively_streamed(
         {"role": "user", "content": user_prompt_template}
     ]
 
+    cache_key = None
+    if syllabus_versions:
+        cache_key = make_answer_key(
+            user_query, syllabus_versions, model_name, temperature, max_tokens,
+            effective_system_prompt, current_date,
+            user_prompt_hash=user_prompt.content_hash
+        )
+        cached_answer = answer_cache.get(cache_key)
+        if cached_answer is not None:
+            logger.info(f"Answer cache hit for query: '{user_query[:50]}...'")
+            yield cached_answer
+            return
+
     full_response = ""
     try:
         logger.info(f"Generating naive answer using {model_name} with temp={temperature}, max_tokens={max_tokens} for query: '{user_query[:50]}...'")
         
-        if litellm.supports_reasoning(model_name):
-            response_stream = await litellm.acompletion(
+        if model_supports_reasoning(model_name):
+            reasoning_params = {"reasoning_effort": settings.NAIVE_REASONING_EFFORT} if settings.NAIVE_REASONING_EFFORT else {}
+            response = await llm_client.acompletion(
+                kind="answer",
                 model=model_name,
                 messages=messages,
                 stream=False,
                 temperature=temperature,
-                max_tokens=30000,
-                reasoning_effort="high"
+                max_tokens=settings.NAIVE_REASONING_MAX_TOKENS,
+                **reasoning_params
             )
-            full_response = response_stream.choices[0].message.content
+            full_response = response.choices[0].message.content or ""
             logger.info(f"Full response: {full_response}")
-            return full_response
+            if full_response:
+                yield full_response
         else:
-            response_stream = await litellm.acompletion(
+            response_stream = await llm_client.acompletion(
+                kind="answer",
                 model=model_name,
                 messages=messages,
                 stream=True,
                 temperature=temperature,
                 max_tokens=max_tokens,
             )
-        
-        async for chunk in response_stream:
-            delta = chunk.choices[0].delta
-            content = delta.get("content", None)
-            if content:
-                full_response += content
-        
-        return full_response
+            async for chunk in response_stream:
+                delta = chunk.choices[0].delta
+                content = delta.get("content", None)
+                if content:
+                    full_response += content
+                    yield content
 
     except litellm.exceptions.ContextWindowExceededError as e:
         logger.error(f"Context window exceeded for model {model_name} during naive answering.")
         logger.error(f"Provided syllabus content length: {len(full_syllabus_content)} characters.")
         logger.error(f"Error details: {e}")
-        return "התנצלות, קובץ הנתונים גדול מדי לעיבוד בבת אחת. לא ניתן לענות על השאלה."
+        yield "התנצלות, קובץ הנתונים גדול מדי לעיבוד בבת אחת. לא ניתן לענות על השאלה."
+        return
     
     except Exception as e:
         logger.error(f"Error during naive answer generation with {model_name}: {e}")
-        return "התנצלות, אירעה שגיאה בעת יצירת התשובה."
+        yield "התנצלות, אירעה שגיאה בעת יצירת התשובה."
+        return
+
+    if cache_key and full_response:
+        answer_cache.set(cache_key, full_response, tags=syllabus_versions.keys())
 
-async def process_chat_message(user_id: str, user_query: str, platform: str, db: Any) -> str:
+def naive_answer_reserved_tokens(
+    model_name: str,
+    user_query: str,
+    system_prompt_override: Optional[str] = None,
+    max_tokens: Optional[int] = 200
+) -> int:
+    """
+    Tokens a naive answer needs besides the syllabus content: the system and user
+    prompt templates, the query and the output budget.
+    """
+    if system_prompt_override:
+        system_template, system_key = system_prompt_override, None
+    else:
+        compiled = _get_compiled_prompt("naive_question_answering_system.txt", fallback_content="You are a helpful AI assistant.")
+        system_template, system_key = compiled.content, f"prompt:{compiled.content_hash}"
+    user_template = load_prompt("naive_question_answering_user.txt", fallback_content="")
+    output_tokens = settings.NAIVE_REASONING_MAX_TOKENS if model_supports_reasoning(model_name) else (max_tokens or 0)
+    return (
+        token_budget.count_tokens(model_name, system_template, system_key)
+        + token_budget.count_tokens(model_name, user_template + user_query)
+        + output_tokens
+    )
+
+async def answer_question_naively_streamed(
+    user_query: str, 
+    full_syllabus_content: str,
+    model_name: str = "o4-mini",
+    system_prompt_override: Optional[str] = None,
+    temperature: Optional[float] = 1.0, 
+    max_tokens: Optional[int] = 200,
+    syllabus_versions: Optional[Dict[str, int]] = None
+) -> str:
+    """
+    Answers a question naively based on the full syllabus content.
+    Consumes stream_answer_naively and returns the complete answer.
+    """
+    parts = []
+    async for delta in stream_answer_naively(
+        user_query,
+        full_syllabus_content,
+        model_name=model_name,
+        system_prompt_override=system_prompt_override,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        syllabus_versions=syllabus_versions
+    ):
+        parts.append(delta)
+    return "".join(parts)
+
+async def _load_routed_versions(db: Any, sender_id: str, query: str) -> Tuple[Route, List[Dict[str, Any]]]:
+    """The route of the question and the current version documents of its courses."""
+    route = await route_question(db, sender_id, query)
+    version_docs = await asyncio.gather(*(get_version_doc(db, course.syllabus_id, course.version) for course in route.courses))
+    return route, [version_doc for version_doc in version_docs if version_doc and version_doc.get("data")]
+
+def retrieve_sections_lexical(
+        user_query: str,
+        syllabus_id: str,
+        version: int,
+        course_data: Dict[str, Any],
+        top_k: int = 5
+    ) -> Optional[str]:
+    """
+    Retrieves the top-k sections from the in-process BM25 index of a syllabus version.
+
+    Returns:
+        The concatenated content of the matching sections, or None.
+    """
+    index = lexical_index.get_index(syllabus_id, version, course_data)
+    results = index.search(user_query, top_k=top_k) if index else []
+    if not results:
+        return None
+    return format_sections([section for section, _ in results])
+
+async def process_chat_message(
+        user_id: str,
+        user_query: str,
+        platform: str,
+        db: Any,
+        retrieval_mode: Optional[str] = None,
+        speculative: Optional[bool] = None
+    ) -> str:
     """
     Orchestrates the retrieval and generation for an incoming chat message.
     (Placeholder - Needs full implementation)
+
+    Args:
+        retrieval_mode: "llm" (LLM section selection), "bm25" (local lexical index)
+            or "vector" (embedding search).
+            Defaults to settings.RETRIEVAL_MODE.
+        speculative: In "llm" mode, start generating on the BM25 context while
+            LLM retrieval runs. Defaults to settings.CHAT_SPECULATIVE_GENERATION.
     """
     logger.info(f"Processing message from {user_id} on {platform}: '{user_query}'")
+    retrieval_mode = retrieval_mode or settings.RETRIEVAL_MODE
+    if speculative is None:
+        speculative = settings.CHAT_SPECULATIVE_GENERATION
+    timer = StageTimer("chat_message")
     
-    # 1. Identify the relevant syllabus for the user/context (How? TBD)
-    #    For now, assume we just use the *first* syllabus found.
-    #    A real system needs mapping (user -> course -> syllabus)
-    syllabus_doc = await db.syllabus.find_one({}, sort=[('_id', -1)]) # Get latest syllabus for demo
-    if not syllabus_doc or not syllabus_doc.get('versions'):
+    # 1. Route the question to the sender's course(s) or the course it names
+    async with timer.stage("syllabus_lookup"):
+        route, version_docs = await _load_routed_versions(db, user_id, user_query)
+    if not version_docs:
         return "Sorry, I don't have any syllabus information available right now."
-        
-    latest_version_data = syllabus_doc['versions'][-1]
-    sections = latest_version_data.get('structured_data')
-    if not sections:
-         return "Sorry, the syllabus data seems incomplete."
+    logger.info(f"Routed to {', '.join(course.course_id for course in route.courses)} ({route.reason})")
+    student_note = "\n".join(f"The student is in group {group} of {course_id}." for course_id, group in route.groups.items())
+
+    # Students often send the same question at the same time (e.g. after an
+    # announcement): identical questions over the same syllabus versions share one run
+    versions_key = ",".join(f"{doc['syllabus_id']}:{doc['version']}" for doc in version_docs)
+    flight_key = f"{versions_key}:{retrieval_mode}:{normalize_query(user_query)}:{student_note}"
+    async def answer() -> str:
+        # The run is timed on its own: a coalesced caller's timer only records its wait
+        run_timer = StageTimer("chat_message_answer")
+        if len(version_docs) == 1:
+            return await _answer_from_syllabus(user_query, version_docs[0], retrieval_mode, db, speculative, run_timer, student_note)
+        return await _answer_from_courses(user_query, version_docs, retrieval_mode, db, run_timer, student_note)
+    try:
+        async with timer.stage("answer"):
+            return await chat_singleflight.do(flight_key, answer)
+    finally:
+        timer.finish()
+
+async def _retrieve_context(
+        user_query: str,
+        version_doc: Dict[str, Any],
+        retrieval_mode: str,
+        db: Any,
+        sections: List[Dict[str, str]]
+    ) -> Optional[str]:
+    if retrieval_mode == "bm25":
+        return retrieve_sections_lexical(
+            user_query,
+            version_doc["syllabus_id"],
+            version_doc["version"],
+            version_doc["data"],
+            top_k=settings.RETRIEVAL_TOP_K
+        )
+    if retrieval_mode == "vector":
+        return await retrieve_sections_vector(user_query, version_doc, db)
+    return await retrieve_relevant_sections(user_query, sections)
 
-    # 2. Call Retrieval LLM
-    retrieved_context = await retrieve_relevant_sections(user_query, sections)
+def _course_context(version_doc: Dict[str, Any], context: str) -> str:
+    course = version_doc["data"]
+    return f"Course: {course.get('heb_name') or course.get('name')}\n{context}"
+
+async def _retrieve_course_contexts(
+        user_query: str,
+        version_docs: List[Dict[str, Any]],
+        retrieval_mode: str,
+        db: Any
+    ) -> List[str]:
+    """Retrieval in each course concurrently; returns the non-empty contexts, each headed by its course name."""
+    async def course_context(version_doc: Dict[str, Any]) -> Optional[str]:
+        sections = build_sections(version_doc["data"]) if retrieval_mode not in ("bm25", "vector") else []
+        if retrieval_mode not in ("bm25", "vector") and not sections:
+            return None
+        context = await _retrieve_context(user_query, version_doc, retrieval_mode, db, sections)
+        return _course_context(version_doc, context) if context else None
+
+    return [context for context in await asyncio.gather(*(course_context(doc) for doc in version_docs)) if context]
+
+async def _answer_from_syllabus(
+        user_query: str,
+        version_doc: Dict[str, Any],
+        retrieval_mode: str,
+        db: Any,
+        speculative: bool,
+        timer: StageTimer,
+        student_note: str = ""
+    ) -> str:
+    """Retrieval and generation over one syllabus version."""
+    # 2. Retrieve relevant sections
+    sections = build_sections(version_doc["data"]) if retrieval_mode not in ("bm25", "vector") else []
+    if retrieval_mode not in ("bm25", "vector") and not sections:
+        return "Sorry, the syllabus data seems incomplete."
+    if sections and speculative:
+        return await _answer_speculatively(
+            user_query, version_doc, sections, timer,
+            lambda context: _generate_answer(user_query, context, student_note)
+        )
+
+    async with timer.stage("retrieval"):
+        retrieved_context = await _retrieve_context(user_query, version_doc, retrieval_mode, db, sections)
 
     if not retrieved_context:
         return "I couldn't find specific information about that in the syllabus."
 
-    # 3. Call Generation LLM
-    generation_model = "gpt-4o-mini" # Use o4-mini for generation too, or configure separately
+    # 3. Call Generation LLM, cheapest model first
+    async with timer.stage("generation"):
+        return await _generate_answer(user_query, retrieved_context, student_note)
+
+async def _answer_from_courses(
+        user_query: str,
+        version_docs: List[Dict[str, Any]],
+        retrieval_mode: str,
+        db: Any,
+        timer: StageTimer,
+        student_note: str = ""
+    ) -> str:
+    """Retrieval in each routed course concurrently, then one generation over the combined context."""
+    async with timer.stage("retrieval"):
+        contexts = await _retrieve_course_contexts(user_query, version_docs, retrieval_mode, db)
+
+    if not contexts:
+        return "I couldn't find specific information about that in the syllabus."
+
+    async with timer.stage("generation"):
+        return await _generate_answer(user_query, "\n\n".join(contexts), student_note)
+
+_speculation_stats = {"accepted": 0, "discarded": 0}
+
+async def _answer_speculatively(
+        user_query: str,
+        version_doc: Dict[str, Any],
+        sections: List[Dict[str, str]],
+        timer: StageTimer,
+        generate: Callable[[Optional[str]], Awaitable[T]]
+    ) -> T:
+    """
+    Runs LLM retrieval and, concurrently, generation on the BM25 top-k context.
+
+    The speculative answer is kept when every section LLM retrieval selected
+    is part of the BM25 context; otherwise it is cancelled and the answer is
+    generated again from the selected sections. LLM retrieval stays the
+    authority on whether the syllabus covers the question at all.
+
+    Args:
+        generate: Produces the answer from a retrieved context, or from None
+            when the syllabus does not cover the question.
+    """
+    index = lexical_index.get_index(version_doc["syllabus_id"], version_doc["version"], version_doc["data"])
+    lexical_sections = [section for section, _ in index.search(user_query, top_k=settings.RETRIEVAL_TOP_K)] if index else []
+
+    started = time.perf_counter()
+    retrieval = asyncio.ensure_future(select_relevant_sections(user_query, sections))
+    speculation = asyncio.ensure_future(generate(format_sections(lexical_sections))) if lexical_sections else None
+    try:
+        selected = await retrieval
+        timer.add("retrieval", time.perf_counter() - started)
+
+        if selected is None and speculation is not None:
+            # Retrieval failed: the lexical context is better than no answer
+            selected = lexical_sections
+
+        lexical_ids = {section["id"] for section in lexical_sections}
+        if selected and speculation is not None and all(section["id"] in lexical_ids for section in selected):
+            _speculation_stats["accepted"] += 1
+            answer = await speculation
+            timer.add("generation", time.perf_counter() - started)
+            return answer
+
+        if speculation is not None:
+            _speculation_stats["discarded"] += 1
+            speculation.cancel()
+        async with timer.stage("generation"):
+            return await generate(format_sections(selected) if selected else None)
+    finally:
+        for task in (retrieval, speculation):
+            if task is not None and not task.done():
+                task.cancel()
+
+async def _generate_answer(user_query: str, retrieved_context: Optional[str], student_note: str = "") -> str:
+    if not retrieved_context:
+        return "I couldn't find specific information about that in the syllabus."
     system_prompt = "You are a helpful assistant answering questions based *only* on the provided syllabus context. Be concise and accurate. Context:\n---\n{context}\n---"
-    
-    messages = [
-        {"role": "system", "content": system_prompt.format(context=retrieved_context)},
-        {"role": "user", "content": user_query}
-    ]
+    if student_note:
+        system_prompt += "\n" + student_note.replace("{", "{{").replace("}", "}}")
     
     try:
-        logger.info(f"Sending query and context to {generation_model} for final generation.")
-        response = await litellm.acompletion(
-            model=generation_model,
-            messages=messages,
-            temperature=0.5,
-            max_tokens=1500
+        result = await cascade_completion(
+            system_prompt.format(context=retrieved_context),
+            user_query,
+            temperature=0.5
         )
-        final_answer = response.choices[0].message.content.strip()
+        logger.info(f"Answered by {result.model} (tier {result.tier}, confidence {result.confidence}, escalations {result.escalations})")
         
         # 4. Store conversation turn (Needs implementation)
-        # await store_message_turn(user_id, platform, user_query, retrieved_context, final_answer, db)
+        # await store_message_turn(user_id, platform, user_query, retrieved_context, result.answer, db)
         
-        return final_answer
+        return result.answer
         
     except Exception as e:
         logger.error(f"Error during final generation: {e}")
         return "Sorry, I encountered an error generating the final response."
 
+def get_speculation_stats() -> Dict[str, int]:
+    return dict(_speculation_stats)
+
+@dataclass
+class ChatAnswer:
+    """One answer run of process_message, possibly shared by coalesced callers."""
+    text: str
+    model: str
+    context: Optional[str] = None
+    stages: Dict[str, float] = field(default_factory=dict)  # the run's own stage durations, in seconds
+
+def _chat_flight_key(
+        message: str,
+        version_docs: List[Dict[str, Any]],
+        retrieval_mode: str,
+        summary: Optional[str],
+        history: List[Dict[str, str]]
+    ) -> str:
+    """Everything the answer depends on: the question, the syllabus versions and the conversation so far."""
+    payload = {
+        "query": normalize_query(message),
+        "versions": [f"{doc['syllabus_id']}:{doc['version']}" for doc in version_docs],
+        "retrieval_mode": retrieval_mode,
+        "summary": summary,
+        "history": history
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def chat_system_message(relevant_content: Optional[str], summary: Optional[str]) -> str:
+    """The chat system prompt: the persona, the retrieved context and the conversation summary."""
+    system_message = "You are Gil, an AI assistant for education. "
+    if relevant_content:
+        system_message += f"Based on the curriculum: {relevant_content}"
+    if summary:
+        system_message += f"\n\nSummary of the earlier conversation with this student: {summary}"
+    return system_message
+
+def chat_history_messages(turns: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Stored turns as alternating user and assistant chat messages."""
+    history = []
+    for msg in turns:
+        history.append({"role": "user", "content": msg["message"]})
+        if "response" in msg:
+            history.append({"role": "assistant", "content": msg["response"]})
+    return history
+
+async def _generate_reply(
+        message: str,
+        relevant_content: Optional[str],
+        summary: Optional[str],
+        history: List[Dict[str, str]],
+        settings: Settings
+    ) -> ChatAnswer:
+    # Construct system message with context (retrieved chunks)
+    system_message = chat_system_message(relevant_content, summary)
+    
+    # Generate with the cheapest model tier that is confident enough
+    result = await cascade_completion(
+        system_message,
+        message,
+        temperature=0.7,
+        kind="chat",
+        history=history,
+        api_key=settings.OPENAI_API_KEY
+    )
+    logger.info(f"Answered by {result.model} (tier {result.tier}, confidence {result.confidence}, escalations {result.escalations})")
+    return ChatAnswer(result.answer, result.model, relevant_content)
+
+async def _answer_message(
+        message: str,
+        version_docs: List[Dict[str, Any]],
+        db: AsyncIOMotorDatabase,
+        settings: Settings,
+        summary: Optional[str],
+        history: List[Dict[str, str]]
+    ) -> ChatAnswer:
+    """
+    Retrieval and generation for one chat turn, timed on a timer of its own.
+
+    With LLM retrieval over a single course and CHAT_SPECULATIVE_GENERATION,
+    generation starts on the BM25 context while the retrieval model runs
+    (see _answer_speculatively).
+    """
+    timer = StageTimer("message_answer")
+    generate = lambda context: _generate_reply(message, context, summary, history, settings)
+    
+    if settings.RETRIEVAL_MODE == "llm" and settings.CHAT_SPECULATIVE_GENERATION and len(version_docs) == 1:
+        version_doc = version_docs[0]
+        sections = build_sections(version_doc["data"])
+        if sections:
+            answer = await _answer_speculatively(
+                message, version_doc, sections, timer,
+                lambda context: generate(_course_context(version_doc, context) if context else None)
+            )
+            answer.stages = dict(timer.stages)
+            return answer
+    
+    # --- Retrieval Stage ---
+    relevant_content = None
+    if version_docs:
+        async with timer.stage("retrieval"):
+            contexts = await _retrieve_course_contexts(message, version_docs, settings.RETRIEVAL_MODE, db)
+            relevant_content = "\n\n".join(contexts) or None
+    
+    # --- Generation Stage --- 
+    async with timer.stage("generation"):
+        answer = await generate(relevant_content)
+    answer.stages = dict(timer.stages)
+    return answer
+
 async def process_message(
     message: str,
     sender_id: str,
     db: AsyncIOMotorDatabase,
-    settings: Settings
+    settings: Settings,
+    trace: Optional[Dict[str, Any]] = None
 ) -> str:
     """
     Process an incoming message using LLM and return response.
     
+    Identical questions in flight at the same time (e.g. right after an
+    announcement), over the same syllabus versions and conversation state,
+    share one retrieval and generation run.
+    
     Args:
         message: The message text
         sender_id: Unique ID of the message sender
         db: Database connection
         settings: Application settings
+        trace: If given, filled with the model, the retrieval context and the
+            stage timings of this turn (for the stored message)
         
     Returns:
         Response text to be sent back to the user
     """
-    # TODO: Refactor based on docs/docs.md - Implement Two-Stage LLM Process
-    # 1. Retrieval Stage: Use a smaller/cheaper LLM or embedding search 
-    #    to find relevant text chunks from the parsed syllabus 
-    #    (which should be stored in MongoDB after upload).
-    # 2. Generation Stage: Pass the original query + retrieved context 
-    #    to the main generation LLM (e.g., settings.GENERATION_LLM_MODEL).
-    
+    timer = StageTimer("message")
+    answer: Optional[ChatAnswer] = None
     try:
-        # Configure OpenAI API key (adjust if using different APIs for retrieval/generation)
-        openai.api_key = settings.OPENAI_API_KEY # Assuming OpenAI for generation for now
-        
-        # Get conversation history
-        conversation_history = await get_conversation_history(sender_id, db)
-        
-        # --- Retrieval Stage (Placeholder) ---
-        # Replace get_relevant_syllabus_content with the actual retrieval logic
-        # relevant_chunks = await retrieve_relevant_chunks(message, db, settings)
-        relevant_content = await get_relevant_syllabus_content(message, db) # Keep existing simple search for now
-        
-        # --- Generation Stage --- 
-        # Construct system message with context (retrieved chunks)
-        system_message = "You are Gil, an AI assistant for education. "
-        if relevant_content:
-            system_message += f"Based on the curriculum: {relevant_content}"
-        
-        # Create messages for API call
-        messages = [
-            {"role": "system", "content": system_message}
-        ]
-        
-        # Add conversation history
-        for msg in conversation_history:
-            messages.append({"role": "user", "content": msg["message"]})
-            if "response" in msg:
-                messages.append({"role": "assistant", "content": msg["response"]})
+        # History and syllabus lookups are independent: run them concurrently
+        async with timer.stage("lookup"):
+            conversation_history, summary_doc, (_, version_docs) = await asyncio.gather(
+                get_conversation_history(sender_id, db),
+                get_summary(sender_id, db),
+                _load_routed_versions(db, sender_id, message)
+            )
+        summary = summary_doc.get("summary") if settings.CONVERSATION_SUMMARY_ENABLED else None
         
-        # Add current message
-        messages.append({"role": "user", "content": message})
+        # Add the turns the summary does not cover yet
+        history = chat_history_messages(prompt_turns(conversation_history, summary_doc))
         
-        # Call OpenAI API (or the configured Generation LLM API)
-        response = await openai.ChatCompletion.acreate(
-            model=settings.GENERATION_LLM_MODEL, # Use the generation model
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
-        )
+        flight_key = _chat_flight_key(message, version_docs, settings.RETRIEVAL_MODE, summary, history)
+        # A coalesced caller times only its own wait here
+        async with timer.stage("answer"):
+            answer = await chat_singleflight.do(
+                flight_key,
+                lambda: _answer_message(message, version_docs, db, settings, summary, history)
+            )
         
-        # Extract and return response text
-        response_text = response.choices[0].message.content.strip()
-        return response_text
+        if trace is not None:
+            trace.update(model=answer.model, retrieval_context=answer.context)
+        return answer.text
         
     except Exception as e:
         logger.error(f"Error in process_message: {str(e)}")
         return "I'm sorry, I encountered an error processing your message. Please try again later."
+    finally:
+        stages = timer.finish()
+        if trace is not None:
+            # The run's retrieval and generation, then this caller's own lookup, wait and total
+            run_stages = answer.stages if answer is not None else {}
+            trace["timings_ms"] = {stage: round(seconds * 1000) for stage, seconds in {**run_stages, **stages}.items()}
+
+async def retrieve_sections_vector(user_query: str, version_doc: Dict[str, Any], db: AsyncIOMotorDatabase) -> Optional[str]:
+    """
+    Retrieves the top-k sections of a syllabus version from its vector index.
 
-async def get_conversation_history(sender_id: str, db: AsyncIOMotorDatabase) -> list:
-    """Get recent conversation history for a user."""
-    history = await db.messages.find(
-        {"sender": sender_id}
-    ).sort("timestamp", -1).limit(10).to_list(10)
-    
-    # Reverse to get chronological order
-    history.reverse()
-    return history
-
-async def get_relevant_syllabus_content(message: str, db: AsyncIOMotorDatabase) -> Optional[str]:
-    """Find relevant syllabus content based on the message.
-       *** This is a placeholder - Replace with actual retrieval logic (embeddings/LLM). ***
+    Returns:
+        The concatenated content of the matching sections, or None.
     """
-    # Simple keyword-based search for now
-    # In a real implementation, this would use vector embeddings and semantic search
-    keywords = message.lower().split()
-    
-    pipeline = [
-        {"$match": {"$text": {"$search": " ".join(keywords)}}},
-        {"$limit": 1}
-    ]
-    
-    results = await db.syllabus.aggregate(pipeline).to_list(1)
-    
-    if results:
-        # Format the content
-        syllabus = results[0]
-        content_summary = f"Title: {syllabus['title']}\nDescription: {syllabus['description']}\n"
-        
-        for item in syllabus["content"][:3]:  # Limit to first 3 topics
-            content_summary += f"Topic: {item['topic']}\n"
-        
-        return content_summary
-    
-    return None 
\ No newline at end of file
+    results = await vector_index.search_syllabus(
+        db,
+        user_query,
+        version_doc["syllabus_id"],
+        version_doc["version"],
+        version_doc["data"],
+        top_k=settings.RETRIEVAL_TOP_K
+    )
+    if not results:
+        return None
+    return format_sections([section for section, _ in results])
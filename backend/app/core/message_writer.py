@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.resilience import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MessageWriter:
+    """
+    Write-behind buffer for chat message documents.
+
+    write() enqueues a document and returns; a single flusher task inserts
+    them with unordered insert_many once MESSAGE_WRITE_BATCH_SIZE documents
+    are buffered or MESSAGE_WRITE_FLUSH_SECONDS passed since the first one.
+    The buffer holds at most MESSAGE_WRITE_BUFFER_SIZE documents: when it is
+    full, write() waits for the flusher (backpressure) instead of growing.
+    stop() flushes everything still buffered. Documents not yet written are
+    listed per sender by pending_for(), so readers can merge them in.
+    """
+
+    def __init__(self):
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.pending: Dict[str, List[Dict[str, Any]]] = {}  # sender -> documents not yet written
+        self.stats = {"written": 0, "batches": 0, "dropped": 0, "retries": 0, "backpressure_waits": 0}
+
+    def start(self, db: AsyncIOMotorDatabase) -> None:
+        self.db = db
+        self.queue = asyncio.Queue(maxsize=settings.MESSAGE_WRITE_BUFFER_SIZE)
+        self.task = asyncio.create_task(self._run())
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def write(self, db: AsyncIOMotorDatabase, doc: Dict[str, Any]) -> None:
+        """Buffer a document for the messages collection, starting the flusher on first use."""
+        if not self.running:
+            self.start(db)
+        if self.queue.full():
+            self.stats["backpressure_waits"] += 1
+        self.pending.setdefault(doc.get("sender"), []).append(doc)
+        await self.queue.put(doc)
+
+    def pending_for(self, sender_id: str) -> List[Dict[str, Any]]:
+        """The sender's documents buffered or being written, oldest first."""
+        return list(self.pending.get(sender_id, ()))
+
+    async def stop(self) -> None:
+        """Flush the buffer and stop the flusher."""
+        if not self.running:
+            return
+        await self.queue.put(_STOP)
+        await self.task
+        self.task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + settings.MESSAGE_WRITE_FLUSH_SECONDS
+            while len(batch) < settings.MESSAGE_WRITE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    doc = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if doc is _STOP:
+                    stopping = True
+                    break
+                batch.append(doc)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            await self._write(batch)
+        finally:
+            # Written or dropped, the batch is no longer pending
+            flushed = {id(doc) for doc in batch}
+            for sender in {doc.get("sender") for doc in batch}:
+                remaining = [doc for doc in self.pending.get(sender, ()) if id(doc) not in flushed]
+                if remaining:
+                    self.pending[sender] = remaining
+                else:
+                    self.pending.pop(sender, None)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        from pymongo.errors import BulkWriteError
+
+        started = time.perf_counter()
+        for attempt in range(settings.MESSAGE_WRITE_MAX_RETRIES + 1):
+            try:
+                await self.db.messages.insert_many(batch, ordered=False)
+                written = len(batch)
+                break
+            except BulkWriteError as e:
+                # Duplicate keys are documents a failed attempt already wrote
+                errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+                written = len(batch) - len(errors)
+                if errors:
+                    self.stats["dropped"] += len(errors)
+                    logger.error(f"Failed to write {len(errors)} of {len(batch)} messages: {errors[0].get('errmsg')}")
+                break
+            except Exception as e:
+                if attempt == settings.MESSAGE_WRITE_MAX_RETRIES:
+                    self.stats["dropped"] += len(batch)
+                    logger.error(f"Dropping {len(batch)} messages after {attempt + 1} failed writes: {e}")
+                    return
+                self.stats["retries"] += 1
+                await asyncio.sleep(backoff_delay(attempt))
+        self.stats["written"] += written
+        self.stats["batches"] += 1
+        logger.debug(f"Wrote {written} messages in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "buffered": self.queue.qsize() if self.queue else 0,
+            "mean_batch_size": (self.stats["written"] / batches) if batches else 0.0
+        }
+
+
+message_writer = MessageWriter()
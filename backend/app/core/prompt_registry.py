@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
+_PLACEHOLDER_RE = re.compile(r"\{\{([^}]+)\}\}")
+
+
+class PromptLoadError(Exception):
+    """Custom exception for prompt loading errors."""
+    pass
+
+
+class CompiledPrompt:
+    """
+    A prompt template parsed once into literal and placeholder segments.
+
+    Rendering is a single join over the segments instead of one str.replace
+    pass per variable over the (possibly syllabus-sized) text. Placeholders
+    without a value are left as {{NAME}}, like the previous replace-based code.
+    """
+
+    def __init__(self, name: str, content: str, mtime: Optional[float] = None):
+        self.name = name
+        self.content = content
+        self.mtime = mtime
+        self.content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        self.segments: List[Tuple[bool, str]] = []  # (is_placeholder, literal text or variable name)
+        position = 0
+        for match in _PLACEHOLDER_RE.finditer(content):
+            if match.start() > position:
+                self.segments.append((False, content[position:match.start()]))
+            self.segments.append((True, match.group(1)))
+            position = match.end()
+        if position < len(content):
+            self.segments.append((False, content[position:]))
+        self.placeholders = sorted({value for is_var, value in self.segments if is_var})
+
+    def render(self, variables: Optional[Dict[str, Any]] = None) -> str:
+        if not variables:
+            return self.content
+        return "".join(
+            (str(variables[value]) if value in variables else f"{{{{{value}}}}}") if is_var else value
+            for is_var, value in self.segments
+        )
+
+
+class PromptRegistry:
+    """
+    Compiled prompts from the prompts directory, reloaded when a file's mtime changes.
+    """
+
+    def __init__(self, prompts_dir: Path = PROMPTS_DIR):
+        self.prompts_dir = prompts_dir
+        self._prompts: Dict[str, CompiledPrompt] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str, validate: bool = True, force_reload: bool = False) -> CompiledPrompt:
+        """
+        Return the compiled prompt, re-reading the file only if it changed on disk.
+
+        Raises:
+            PromptLoadError: If the file is missing, unreadable or (when validating) empty.
+        """
+        prompt_path = self.prompts_dir / filename
+        try:
+            mtime = prompt_path.stat().st_mtime
+        except FileNotFoundError:
+            available_files = list(self.prompts_dir.glob("*.txt")) if self.prompts_dir.exists() else []
+            raise PromptLoadError(
+                f"Prompt file not found: {filename}. "
+                f"Available files: {[f.name for f in available_files]}"
+            )
+        except OSError as e:
+            raise PromptLoadError(f"Error loading prompt {filename}: {e}")
+
+        cached = self._prompts.get(filename)
+        if cached is not None and cached.mtime == mtime and not force_reload:
+            return cached
+
+        with self._lock:
+            try:
+                with open(prompt_path, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+            except OSError as e:
+                raise PromptLoadError(f"Error loading prompt {filename}: {e}")
+
+            if validate and not content:
+                raise PromptLoadError(f"Prompt file {filename} is empty")
+
+            compiled = CompiledPrompt(filename, content, mtime)
+            if compiled.placeholders:
+                logger.debug(f"Prompt {filename} contains placeholders: {compiled.placeholders}")
+            if cached is not None:
+                logger.info(f"Prompt {filename} changed on disk, reloaded")
+            self._prompts[filename] = compiled
+            return compiled
+
+    def render(self, filename: str, variables: Optional[Dict[str, Any]] = None) -> str:
+        return self.get(filename).render(variables)
+
+    def content_hash(self, filename: str) -> str:
+        """Stable hash of the prompt file content, for cache keys."""
+        return self.get(filename).content_hash
+
+    def clear(self) -> None:
+        self._prompts.clear()
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import random
+import time
+from functools import lru_cache
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple, Type
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def _retryable_errors() -> Tuple[Type[BaseException], ...]:
+    """
+    Transient provider errors worth retrying; everything else (bad request, auth,
+    context window, content policy, ...) fails the same way on every attempt.
+    """
+    from litellm import exceptions
+
+    return (
+        exceptions.RateLimitError,
+        exceptions.Timeout,
+        exceptions.APIConnectionError,
+        exceptions.ServiceUnavailableError,
+        exceptions.InternalServerError,
+        asyncio.TimeoutError,
+    )
+
+
+class CircuitOpenError(Exception):
+    """Raised when every candidate model's circuit is open."""
+    pass
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the call's deadline leaves no time for another attempt."""
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    from litellm.exceptions import ContextWindowExceededError
+
+    if isinstance(error, ContextWindowExceededError):
+        return False
+    return isinstance(error, _retryable_errors())
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    After `failure_threshold` consecutive retryable failures the circuit opens
+    and calls fail fast for `recovery_seconds`. Then a single probe call is let
+    through (half-open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give back a half-open probe that ended without a verdict (e.g. a non-retryable error)."""
+        self.probe_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_stats = {"calls": 0, "retries": 0, "fallbacks": 0, "deadline_exceeded": 0, "circuit_rejections": 0}
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RECOVERY_SECONDS)
+        _breakers[model] = breaker
+    return breaker
+
+
+def _deadline_for(kind: str) -> Optional[float]:
+    return settings.LLM_DEADLINES.get(kind, settings.LLM_DEADLINES.get("default"))
+
+
+async def call_with_resilience(
+    call_fn: Callable[[Dict[str, Any]], Awaitable[Any]],
+    params: Dict[str, Any],
+    kind: str = "default",
+    deadline_seconds: Optional[float] = None,
+    max_retries: Optional[int] = None
+) -> Any:
+    """
+    Call call_fn(params) with retries, circuit breaking and model fallback.
+
+    Retryable errors are retried on the same model with jittered exponential
+    backoff, up to max_retries (settings.LLM_MAX_RETRIES) times, as long as the deadline
+    leaves room for the wait and another attempt. A model whose circuit is
+    open, or that keeps failing, is replaced by the next model in
+    settings.LLM_FALLBACK_MODELS. Non-retryable errors are raised immediately.
+
+    Args:
+        call_fn: Performs one attempt with the given parameters.
+        params: Completion parameters, params["model"] is the preferred model.
+        kind: Call kind, selects the deadline from settings.LLM_DEADLINES.
+        deadline_seconds: Overrides the deadline for this call.
+        max_retries: Overrides settings.LLM_MAX_RETRIES for this call, e.g. 0
+            for callers that retry on their own budget.
+
+    Raises:
+        CircuitOpenError: Every candidate model's circuit is open.
+        DeadlineExceededError: The deadline ran out before a successful attempt.
+    """
+    _stats["calls"] += 1
+    if max_retries is None:
+        max_retries = settings.LLM_MAX_RETRIES
+    if deadline_seconds is None:
+        deadline_seconds = _deadline_for(kind)
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    models: List[str] = [params["model"]] + settings.LLM_FALLBACK_MODELS.get(params["model"], [])
+    last_error: Optional[BaseException] = None
+
+    for i, model in enumerate(models):
+        breaker = get_breaker(model)
+        if not breaker.allow():
+            _stats["circuit_rejections"] += 1
+            logger.warning(f"Circuit for {model} is open, skipping")
+            continue
+        if i > 0:
+            _stats["fallbacks"] += 1
+            logger.warning(f"Falling back from {params['model']} to {model}")
+
+        for attempt in range(max_retries + 1):
+            attempt_params = {**params, "model": model}
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    breaker.release()
+                    _stats["deadline_exceeded"] += 1
+                    raise DeadlineExceededError(f"Deadline of {deadline_seconds}s exceeded calling {params['model']}") from last_error
+                attempt_params["timeout"] = min(params.get("timeout") or remaining, remaining)
+            try:
+                result = await call_fn(attempt_params)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.release()
+                    raise
+                last_error = e
+                breaker.record_failure()
+                if breaker.state == "open":
+                    logger.warning(f"Circuit for {model} opened after {breaker.consecutive_failures} failures: {e}")
+                    break
+                delay = backoff_delay(attempt)
+                if attempt == max_retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                    logger.warning(f"{model} failed ({type(e).__name__}), no retries left")
+                    break
+                _stats["retries"] += 1
+                logger.info(f"{model} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                if not breaker.allow():
+                    break
+                continue
+            breaker.record_success()
+            return result
+
+    if last_error is not None:
+        raise last_error
+    raise CircuitOpenError(f"Circuits open for {', '.join(models)}")
+
+
+def get_resilience_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "circuits": {
+            model: {
+                "state": breaker.state,
+                "consecutive_failures": breaker.consecutive_failures,
+                "times_opened": breaker.times_opened,
+                "rejected": breaker.rejected
+            }
+            for model, breaker in _breakers.items()
+        }
+    }
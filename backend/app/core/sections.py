@@ -0,0 +1,109 @@
+from typing import Dict, Any, List, Optional
+
+
+def _join(parts: List[Optional[str]], sep: str = "\n") -> str:
+    """Join the non-empty parts of a section body."""
+    return sep.join(str(p).strip() for p in parts if p not in (None, "") and str(p).strip())
+
+
+def _labeled(label: str, value: Any) -> Optional[str]:
+    if value in (None, "", []):
+        return None
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value if v)
+    return f"{label}: {value}"
+
+
+def build_sections(course: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Split a SyllabusCourse document into retrievable sections.
+
+    Each section has a stable "id" (derived from the field and its position or
+    date, not from its text), a human readable "label" and the "content" text.
+    The same list is used by the lexical index, the vector index and the LLM
+    retrieval prompt, so ids are comparable across retrieval modes.
+
+    Args:
+        course: The `data` field of a syllabus_versions document.
+
+    Returns:
+        A list of {"id", "label", "content"} dicts, skipping empty fields.
+    """
+    sections: List[Dict[str, str]] = []
+    seen_ids: Dict[str, int] = {}
+    course_name = course.get("heb_name") or course.get("name") or ""
+
+    def add(section_id: str, label: str, content: str) -> None:
+        if content:
+            # The same date can appear in several calendar entries
+            if section_id in seen_ids:
+                seen_ids[section_id] += 1
+                section_id = f"{section_id}-{seen_ids[section_id]}"
+            else:
+                seen_ids[section_id] = 0
+            sections.append({
+                "id": section_id,
+                "label": f"{course_name} - {label}" if course_name else label,
+                "content": content,
+            })
+
+    description = course.get("description") or {}
+    add("description", "Description", _join([
+        description.get("he"), description.get("en"), description.get("goal"),
+        _labeled("Location", course.get("general_location")),
+        _labeled("Days and times", course.get("general_day_time_info")),
+    ]))
+    add("requirements", "Requirements", course.get("requirements") or "")
+    add("grading_policy", "Grading policy", course.get("grading_policy") or "")
+    add("course_notes", "Course notes", course.get("course_notes") or "")
+
+    for i, assignment in enumerate(course.get("assignments") or []):
+        add(f"assignment-{i}", f"Assignment: {assignment.get('name') or i + 1}", _join([
+            assignment.get("name"),
+            _labeled("Due date", assignment.get("due_date")),
+            _labeled("Due time", assignment.get("due_time")),
+            _labeled("Submission", assignment.get("submission_method")),
+            assignment.get("details"),
+        ]))
+
+    for i, test in enumerate(course.get("tests") or []):
+        moadim = [
+            _join([m.get("moad_name"), m.get("date"), m.get("time"), m.get("location")], sep=" ")
+            for m in test.get("moadim") or []
+        ]
+        add(f"test-{i}", f"Test: {test.get('name') or i + 1}", _join([
+            test.get("name"),
+            _labeled("Type", test.get("test_type")),
+            test.get("notes"),
+            *moadim,
+        ]))
+
+    schedule = course.get("schedule") or {}
+    add("schedule-notes", "Schedule notes", schedule.get("general_notes") or "")
+    for entry_index, entry in enumerate(schedule.get("calendar_entries") or []):
+        date = entry.get("date") or f"entry{entry_index}"
+        day = _join([entry.get("date"), entry.get("day_of_week_heb"), entry.get("day_of_week_en")], sep=" ")
+        if entry.get("daily_notes") and not entry.get("time_slots"):
+            add(f"slot-{date}-notes", f"Schedule {day}", _join([day, entry.get("daily_notes")]))
+        for slot_index, slot in enumerate(entry.get("time_slots") or []):
+            time_range = "-".join(t for t in (slot.get("start_time"), slot.get("end_time")) if t)
+            add(f"slot-{date}-{slot_index}", f"Schedule {day} {time_range}".strip(), _join([
+                _join([day, time_range], sep=" "),
+                slot.get("subject"),
+                _labeled("Activity", slot.get("activity_type")),
+                _labeled("Location", slot.get("location")),
+                _labeled("Instructors", slot.get("instructors")),
+                _labeled("Groups", slot.get("attending_groups")),
+                slot.get("details"),
+                entry.get("daily_notes"),
+            ]))
+
+    for i, section in enumerate(course.get("document_sections") or []):
+        add(f"document-{i}", section.get("label") or f"Document section {i + 1}", section.get("content") or "")
+
+    return sections
+
+
+def format_sections(sections: List[Dict[str, str]]) -> str:
+    """Assemble retrieved sections into the context passed to generation."""
+    return "\n\n".join(f"{section['label']}\n{section['content']}" for section in sections)
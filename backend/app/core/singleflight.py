@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key starts the work as a task; callers arriving while
+    it runs await the same task instead of starting their own. The task is
+    shielded, so a caller that disconnects does not cancel it for the others.
+    """
+
+    def __init__(self, max_tracked_keys: int = 1000):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._key_stats: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        self.max_tracked_keys = max_tracked_keys
+        self.executions = 0
+        self.coalesced = 0
+
+    def _record(self, key: str, leader: bool) -> None:
+        stats = self._key_stats.pop(key, None) or {"executions": 0, "waiters": 0}
+        stats["executions" if leader else "waiters"] += 1
+        self._key_stats[key] = stats
+        while len(self._key_stats) > self.max_tracked_keys:
+            self._key_stats.popitem(last=False)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() for `key`, or wait for the run already in flight for it."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.executions += 1
+            self._record(key, leader=True)
+        else:
+            self.coalesced += 1
+            self._record(key, leader=False)
+            logger.debug(f"Coalesced request onto in-flight call for key: {key[:80]}")
+        return await asyncio.shield(task)
+
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        busiest = sorted(self._key_stats.items(), key=lambda item: item[1]["waiters"], reverse=True)[:top]
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "top_keys": [{"key": key, **stats} for key, stats in busiest if stats["waiters"]]
+        }
+
+
+chat_singleflight = SingleFlight()
@@ -0,0 +1,249 @@
+"""
+Rolling conversation summaries.
+
+Instead of replaying every prior turn, the chat prompt carries a stored
+per-sender summary of the older turns plus the last CONVERSATION_RECENT_TURNS
+turns verbatim. After each response the turns that left the recent window are
+folded into the summary in the background (update_summary), in batches of
+CONVERSATION_SUMMARY_MIN_TURNS, so the prompt stays bounded however long the
+conversation runs. Turns not yet folded in are still sent verbatim.
+
+Run `python -m app.core.summarizer` to compare chat prompt sizes (and, with
+--live, chat-turn latency) with and without summarization over a simulated
+conversation.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core import llm_client
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.history import get_conversation_history
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = "conversation_summary.txt"
+
+summary_cache = TTLCache(settings.CONVERSATION_CACHE_MAX_SENDERS, settings.CONVERSATION_CACHE_TTL_SECONDS)
+_updating: Set[str] = set()
+_stats = {"updates": 0, "turns_folded": 0, "errors": 0}
+
+
+async def get_summary(sender_id: str, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """The sender's stored summary, {} if there is none yet."""
+    summary_doc = summary_cache.get(sender_id)
+    if summary_doc is None:
+        summary_doc = await db.conversation_summaries.find_one(
+            {"sender": sender_id},
+            {"_id": 0, "summary": 1, "through": 1}
+        ) or {}
+        summary_cache.set(sender_id, summary_doc)
+    return summary_doc
+
+
+def _after(turn: Dict[str, Any], through: Optional[datetime]) -> bool:
+    timestamp = turn.get("timestamp")
+    return through is None or (timestamp is not None and timestamp > through)
+
+
+def split_history(history: List[Dict[str, Any]], summary_doc: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Returns:
+        (older turns not yet in the summary, the last CONVERSATION_RECENT_TURNS turns)
+    """
+    cut = max(len(history) - settings.CONVERSATION_RECENT_TURNS, 0)
+    older, recent = history[:cut], history[cut:]
+    through = summary_doc.get("through")
+    return [turn for turn in older if _after(turn, through)], recent
+
+
+def prompt_turns(history: List[Dict[str, Any]], summary_doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The turns to replay verbatim: everything the summary does not cover yet."""
+    if not settings.CONVERSATION_SUMMARY_ENABLED:
+        return history
+    unsummarized, recent = split_history(history, summary_doc)
+    return unsummarized + recent
+
+
+def _format_turns(turns: List[Dict[str, Any]]) -> str:
+    lines = []
+    for turn in turns:
+        lines.append(f"Student: {turn['message']}")
+        if turn.get("response"):
+            lines.append(f"Gil: {turn['response']}")
+    return "\n".join(lines)
+
+
+async def summarize(summary: str, turns: List[Dict[str, Any]]) -> str:
+    """Fold turns into summary with the summary model."""
+    from app.core.llm_services import load_prompt_template
+
+    prompt = load_prompt_template(SUMMARY_PROMPT, {
+        "SUMMARY": summary or "(none)",
+        "TURNS": _format_turns(turns)
+    })
+    response = await llm_client.acompletion(
+        kind="summary",
+        model=settings.CONVERSATION_SUMMARY_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS
+    )
+    return response.choices[0].message.content.strip()
+
+
+async def update_summary(sender_id: str, db: AsyncIOMotorDatabase) -> None:
+    """
+    Fold the turns that left the recent window into the sender's summary.
+    Run after a response has been sent; skipped while an update for the same
+    sender is in progress, since the next turn catches up.
+    """
+    if not settings.CONVERSATION_SUMMARY_ENABLED or sender_id in _updating:
+        return
+    _updating.add(sender_id)
+    try:
+        history, summary_doc = await asyncio.gather(
+            get_conversation_history(sender_id, db),
+            get_summary(sender_id, db)
+        )
+        unsummarized, _ = split_history(history, summary_doc)
+        if len(unsummarized) < settings.CONVERSATION_SUMMARY_MIN_TURNS:
+            return
+        summary = await summarize(summary_doc.get("summary", ""), unsummarized)
+        summary_doc = {"summary": summary, "through": unsummarized[-1].get("timestamp")}
+        await db.conversation_summaries.update_one(
+            {"sender": sender_id},
+            {"$set": {**summary_doc, "updated_at": datetime.utcnow()}, "$inc": {"turns": len(unsummarized)}},
+            upsert=True
+        )
+        summary_cache.set(sender_id, summary_doc)
+        _stats["updates"] += 1
+        _stats["turns_folded"] += len(unsummarized)
+        logger.debug(f"Folded {len(unsummarized)} turns into the summary for {sender_id}")
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.error(f"Could not update the conversation summary for {sender_id}: {e}")
+    finally:
+        _updating.discard(sender_id)
+
+
+def get_summary_stats() -> Dict[str, Any]:
+    return {**_stats, "cache": summary_cache.stats()}
+
+
+async def _measure(turn_count: int, response_chars: int, live: bool) -> None:
+    """
+    Chat prompt tokens per turn of a simulated conversation, sent with the
+    last CONVERSATION_HISTORY_LENGTH turns verbatim ("full") vs the summary
+    plus the turns it does not cover ("summarized"). Each prompt is built as
+    process_message builds it: the system prompt with the BM25 context of the
+    question's course and the summary, the history, then the question.
+
+    Without --live the summary is assumed to use all of
+    CONVERSATION_SUMMARY_MAX_TOKENS (the worst case). With --live it is
+    produced by the summary model, and each turn is also answered through the
+    chat cascade both ways to compare chat-turn latency.
+    """
+    import time
+
+    import yaml
+
+    from app.core.cascade import cascade_completion
+    from app.core.llm_services import chat_history_messages, chat_system_message, retrieve_sections_lexical
+    from app.core.token_budget import count_tokens
+    from app.db.init_data import YAMLS_DIR
+
+    model = settings.CHAT_CASCADE_TIERS[0]["model"]
+    qa_path = Path(__file__).resolve().parents[1] / "db" / "common-questions.json"
+    pairs = json.loads(qa_path.read_text(encoding="utf-8"))["evaluation_qa_pairs"]
+    turns = []
+    for i in range(turn_count):
+        pair = pairs[i % len(pairs)]
+        # Repeat the reference answer to the length of a typical chat reply
+        response = pair["answer"]
+        while len(response) < response_chars:
+            response += " " + pair["answer"]
+        turns.append({"message": pair["question"], "response": response, "timestamp": datetime(2025, 1, 1) + timedelta(minutes=i)})
+
+    courses: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def course_context(pair: Dict[str, Any]) -> Optional[str]:
+        name = pair.get("course", "")
+        if name not in courses:
+            path = YAMLS_DIR / f"{name}.yaml"
+            courses[name] = yaml.safe_load(path.read_text(encoding="utf-8"))["courses"][0] if path.exists() else None
+        if courses[name] is None:
+            return None
+        return retrieve_sections_lexical(pair["question"], name, 1, courses[name], top_k=settings.RETRIEVAL_TOP_K)
+
+    def prompt(context: Optional[str], summary: Optional[str], history: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, str]]]:
+        return chat_system_message(context, summary), chat_history_messages(history)
+
+    def tokens(system: str, history: List[Dict[str, str]], question: str) -> int:
+        return count_tokens(model, system + "".join(message["content"] for message in history) + question)
+
+    async def answer_seconds(system: str, history: List[Dict[str, str]], question: str) -> float:
+        started = time.perf_counter()
+        await cascade_completion(system, question, temperature=0.7, kind="chat", history=history, api_key=settings.OPENAI_API_KEY)
+        return time.perf_counter() - started
+
+    header = f"{'turn':>4}{'full tokens':>13}{'summarized':>12}"
+    print(header + (f"{'full s':>9}{'summarized s':>14}" if live else ""))
+    summary_doc: Dict[str, Any] = {}
+    totals = {"full": 0.0, "summarized": 0.0, "full_s": 0.0, "summarized_s": 0.0}
+    steady_turns = 0
+    summary_seconds: List[float] = []
+    for n in range(1, turn_count + 1):
+        question = turns[n - 1]["message"]
+        context = course_context(pairs[(n - 1) % len(pairs)])
+        history = turns[max(0, n - 1 - settings.CONVERSATION_HISTORY_LENGTH):n - 1]
+        full = prompt(context, None, history)
+        summarized = prompt(context, summary_doc.get("summary"), prompt_turns(history, summary_doc))
+        row = {"full": tokens(*full, question), "summarized": tokens(*summarized, question)}
+        line = f"{n:>4}{row['full']:>13}{row['summarized']:>12}"
+        if live:
+            # Alternate the order so neither variant always runs on a warm connection
+            first, second = (full, summarized) if n % 2 else (summarized, full)
+            first_s, second_s = await answer_seconds(*first, question), await answer_seconds(*second, question)
+            row["full_s"], row["summarized_s"] = (first_s, second_s) if n % 2 else (second_s, first_s)
+            line += f"{row['full_s']:>9.2f}{row['summarized_s']:>14.2f}"
+        print(line)
+        if n > settings.CONVERSATION_HISTORY_LENGTH:
+            for key, value in row.items():
+                totals[key] += value
+            steady_turns += 1
+        unsummarized, _ = split_history(history, summary_doc)
+        if len(unsummarized) >= settings.CONVERSATION_SUMMARY_MIN_TURNS:
+            if live:
+                started = time.perf_counter()
+                summary = await summarize(summary_doc.get("summary", ""), unsummarized)
+                summary_seconds.append(time.perf_counter() - started)
+            else:
+                summary = "x " * settings.CONVERSATION_SUMMARY_MAX_TOKENS
+            summary_doc = {"summary": summary, "through": unsummarized[-1]["timestamp"]}
+
+    if steady_turns:
+        mean = {key: value / steady_turns for key, value in totals.items()}
+        print(f"mean chat prompt tokens after turn {settings.CONVERSATION_HISTORY_LENGTH}: "
+              f"{mean['full']:.0f} -> {mean['summarized']:.0f} ({1 - mean['summarized'] / mean['full']:.0%} fewer)")
+        if live:
+            print(f"mean chat-turn latency: {mean['full_s']:.2f}s -> {mean['summarized_s']:.2f}s")
+    if summary_seconds:
+        print(f"summary updates: {len(summary_seconds)}, mean {sum(summary_seconds) / len(summary_seconds):.2f}s (off the response path)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare chat prompt sizes and latency with and without rolling summaries.")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--response-chars", type=int, default=600, help="simulated length of Gil's replies")
+    parser.add_argument("--live", action="store_true", help="summarize and answer with the real models (needs an API key)")
+    args = parser.parse_args()
+    asyncio.run(_measure(args.turns, args.response_chars, args.live))
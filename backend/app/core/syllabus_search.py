@@ -0,0 +1,171 @@
+"""
+Indexed search over syllabus names and course ids.
+
+Every syllabi document carries a `search` field maintained on write
+(create_syllabus, create_version, the YAML import):
+
+    {"keys": [...], "version": SEARCH_KEYS_VERSION}
+
+`keys` holds, for each normalized term of the English name, the Hebrew name
+and the course id (lexical_index.tokenize: lowercased, niqqud dropped, Hebrew
+final letters folded, attached Hebrew prefixes stripped):
+
+    "t:<term>"     the term itself
+    "p:<prefix>"   every prefix of the term (edge n-grams)
+    "g:<trigram>"  every trigram of the term
+
+A multikey index on `search.keys` serves all three, so a query word is looked
+up by prefix ("anat" -> "p:anat") or, when it occurs inside a term ("tomy"),
+by the trigrams it is made of. Each query word must match; results are ranked,
+in the query, by how well the words match (exact term > prefix > substring).
+"""
+import logging
+import time
+from typing import Dict, Any, List, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.lexical_index import tokenize, words
+
+logger = logging.getLogger(__name__)
+
+# Bump when the key scheme changes; backfill_search_keys() rebuilds older documents
+SEARCH_KEYS_VERSION = 1
+_MAX_PREFIX_LENGTH = 24
+_SCORES = {"exact": 3, "prefix": 2, "substring": 1}
+
+_stats = {"searches": 0, "candidates": 0, "results": 0, "total_ms": 0.0, "backfilled": 0}
+
+
+def _trigrams(term: str) -> List[str]:
+    return [term[i:i + 3] for i in range(len(term) - 2)]
+
+
+def search_fields(course_id: str, name: str, heb_name: str) -> Dict[str, Any]:
+    """The `search` field of a syllabi document."""
+    keys: Set[str] = set()
+    for term in tokenize(f"{name} {heb_name} {course_id or ''}"):
+        keys.add(f"t:{term}")
+        keys.update(f"p:{term[:i]}" for i in range(1, min(len(term), _MAX_PREFIX_LENGTH) + 1))
+        keys.update(f"g:{gram}" for gram in _trigrams(term))
+    return {"keys": sorted(keys), "version": SEARCH_KEYS_VERSION}
+
+
+def _query_words(query: str) -> List[List[str]]:
+    """Each query word with its prefix-stripped Hebrew forms."""
+    return [list(dict.fromkeys(tokenize(word))) for word in dict.fromkeys(words(query))]
+
+
+def _word_filter(variants: List[str]) -> Dict[str, Any]:
+    clauses: List[Dict[str, Any]] = [{"search.keys": {"$in": [f"p:{v[:_MAX_PREFIX_LENGTH]}" for v in variants]}}]
+    for variant in variants:
+        if len(variant) >= 3:
+            clauses.append({"search.keys": {"$all": [f"g:{gram}" for gram in _trigrams(variant)]}})
+    return {"$or": clauses}
+
+
+def _match(variants: List[str], terms: Set[str]) -> Optional[str]:
+    """How well a query word matches a document's terms: "exact", "prefix", "substring" or None."""
+    best = None
+    for variant in variants:
+        if variant in terms:
+            return "exact"
+        if any(term.startswith(variant) for term in terms):
+            best = "prefix"
+        elif best is None and len(variant) >= 3 and any(variant in term for term in terms):
+            best = "substring"
+    return best
+
+
+def _score_expression(query_words: List[List[str]], query: str) -> Dict[str, Any]:
+    """Mongo expression for a document's rank: _SCORES per query word, plus a boost for the exact course id."""
+    def has_any(keys: List[str]) -> Dict[str, Any]:
+        return {"$gt": [{"$size": {"$setIntersection": ["$search.keys", keys]}}, 0]}
+
+    scores: List[Any] = []
+    for variants in query_words:
+        scores.append({"$switch": {
+            "branches": [
+                {"case": has_any([f"t:{v}" for v in variants]), "then": _SCORES["exact"]},
+                {"case": has_any([f"p:{v[:_MAX_PREFIX_LENGTH]}" for v in variants]), "then": _SCORES["prefix"]}
+            ],
+            "default": _SCORES["substring"]
+        }})
+    scores.append({"$cond": [{"$eq": [{"$toLower": {"$ifNull": ["$course_id", ""]}}, query.strip().lower()]}, 10, 0]})
+    return {"$add": scores}
+
+
+async def search_syllabi(
+        db: AsyncIOMotorDatabase,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+    """
+    Syllabi documents matching every word of query, best matches first.
+
+    Candidates are ranked in the query itself, so the SYLLABUS_SEARCH_MAX_CANDIDATES
+    cap only ever drops the weakest matches. A query without words (empty or
+    punctuation only) matches every syllabus, as no search does.
+
+    Args:
+        filters: Extra equality conditions, e.g. {"metadata.year": "2025"}.
+        limit: Maximum results (SYLLABUS_SEARCH_MAX_RESULTS by default).
+    """
+    query_words = _query_words(query)
+    if not query_words:
+        return [doc async for doc in db.syllabi.find(filters or {})]
+
+    started = time.perf_counter()
+    pipeline = [
+        {"$match": {**(filters or {}), "$and": [_word_filter(variants) for variants in query_words]}},
+        {"$addFields": {"_search_score": _score_expression(query_words, query)}},
+        {"$sort": {"_search_score": -1, "metadata.name": 1}},
+        {"$limit": settings.SYLLABUS_SEARCH_MAX_CANDIDATES}
+    ]
+    results = []
+    candidates = 0
+    async for doc in db.syllabi.aggregate(pipeline):
+        candidates += 1
+        terms = {key[2:] for key in doc["search"]["keys"] if key.startswith("t:")}
+        # Trigram candidates may hold the trigrams without the whole word
+        if any(_match(variants, terms) is None for variants in query_words):
+            continue
+        results.append(doc)
+        if len(results) == (limit or settings.SYLLABUS_SEARCH_MAX_RESULTS):
+            break
+
+    _stats["searches"] += 1
+    _stats["candidates"] += candidates
+    _stats["results"] += len(results)
+    _stats["total_ms"] += (time.perf_counter() - started) * 1000
+    return results
+
+
+async def backfill_search_keys(db: AsyncIOMotorDatabase) -> int:
+    """Add or rebuild the `search` field of syllabi written before it existed or under an older scheme."""
+    updated = 0
+    async for doc in db.syllabi.find(
+        {"search.version": {"$ne": SEARCH_KEYS_VERSION}},
+        {"course_id": 1, "metadata": 1}
+    ):
+        meta = doc.get("metadata") or {}
+        await db.syllabi.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"search": search_fields(doc.get("course_id"), meta.get("name", ""), meta.get("heb_name", ""))}}
+        )
+        updated += 1
+    if updated:
+        _stats["backfilled"] += updated
+        logger.info(f"Backfilled search keys for {updated} syllabi")
+    return updated
+
+
+def get_search_stats() -> Dict[str, Any]:
+    searches = _stats["searches"]
+    return {
+        **_stats,
+        "mean_candidates": (_stats["candidates"] / searches) if searches else 0.0,
+        "mean_ms": (_stats["total_ms"] / searches) if searches else 0.0
+    }
@@ -0,0 +1,63 @@
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Deque, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (pipeline, stage) -> recent durations in seconds
+_samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+
+def record_stage(pipeline: str, stage: str, seconds: float) -> None:
+    key = (pipeline, stage)
+    if key not in _samples:
+        _samples[key] = deque(maxlen=1000)
+    _samples[key].append(seconds)
+
+
+class StageTimer:
+    """
+    Times the stages of one run of a pipeline.
+
+    Stages may overlap (e.g. concurrent lookups); each is timed on its own.
+    Durations are kept on the timer for logging and aggregated per pipeline
+    for get_stage_stats().
+    """
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def stage(self, name: str) -> AsyncIterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = seconds
+        record_stage(self.pipeline, name, seconds)
+
+    def finish(self) -> Dict[str, float]:
+        """Record the total and log all stages in milliseconds."""
+        self.add("total", time.perf_counter() - self.started)
+        logger.info(f"{self.pipeline} stages (ms): " + ", ".join(f"{k}={v * 1000:.0f}" for k, v in self.stages.items()))
+        return self.stages
+
+
+def get_stage_stats() -> Dict[str, Any]:
+    """Count, p50 and p95 per stage, in seconds."""
+    stats: Dict[str, Any] = {}
+    for (pipeline, stage), samples in _samples.items():
+        ordered = sorted(samples)
+        stats.setdefault(pipeline, {})[stage] = {
+            "count": len(ordered),
+            "p50_seconds": ordered[len(ordered) // 2],
+            "p95_seconds": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+        }
+    return stats
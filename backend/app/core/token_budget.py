@@ -0,0 +1,198 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core import lexical_index
+from app.core.sections import build_sections
+
+logger = logging.getLogger(__name__)
+
+# Lower rank is kept first when a syllabus has to be trimmed
+_SECTION_PRIORITY = {
+    "test": 0,
+    "assignment": 1,
+    "requirements": 2,
+    "grading_policy": 2,
+    "description": 3,
+    "course_notes": 4,
+    "schedule-notes": 4,
+    "slot": 5,
+}
+
+# Token counts of syllabus text are immutable per version, so entries never need a short TTL
+_token_counts = TTLCache(max_entries=20000, ttl_seconds=7 * 24 * 3600)
+
+
+@dataclass
+class SyllabusContextPart:
+    """One syllabus in a multi-syllabus context: its full rendering and its source data."""
+    syllabus_id: str
+    version: int
+    text: str
+    course_data: Dict[str, Any]
+    header: str = ""
+    footer: str = ""
+    rendering: str = "yaml"  # identifies how `text` was produced, for the token count cache
+
+
+@dataclass
+class BudgetResult:
+    content: str
+    tokens: int
+    budget: int
+    trimmed_syllabi: List[str] = field(default_factory=list)
+    dropped_sections: int = 0
+
+
+@lru_cache(maxsize=256)
+def get_context_window(model: str) -> int:
+    """Maximum input tokens for a model, from litellm's model map or the configured default."""
+    import litellm
+
+    try:
+        info = litellm.get_model_info(model)
+        return int(info.get("max_input_tokens") or info.get("max_tokens") or settings.DEFAULT_CONTEXT_WINDOW)
+    except Exception:
+        logger.debug(f"No context window known for {model}, using default {settings.DEFAULT_CONTEXT_WINDOW}")
+        return settings.DEFAULT_CONTEXT_WINDOW
+
+
+def count_tokens(model: str, text: str, cache_key: Optional[str] = None) -> int:
+    """
+    Count tokens locally with the model's tokenizer.
+
+    Args:
+        cache_key: Identifies immutable text (e.g. "<syllabus_id>:<version>:yaml")
+            so its count is computed once per model.
+    """
+    if cache_key is not None:
+        key = f"{model}|{cache_key}"
+        cached = _token_counts.get(key)
+        if cached is not None:
+            return cached
+    import litellm
+
+    tokens = litellm.token_counter(model=model, text=text)
+    if cache_key is not None:
+        _token_counts.set(key, tokens)
+    return tokens
+
+
+def _section_rank(section: Dict[str, str], relevant_ids: Dict[str, int], today: date) -> Tuple[int, int, int, str]:
+    section_id = section["id"]
+    if section_id in relevant_ids:
+        return (-1, 0, relevant_ids[section_id], "")
+    kind = section_id.split("-", 1)[0]
+    rank = _SECTION_PRIORITY.get(section_id, _SECTION_PRIORITY.get(kind, 6))
+    if kind == "slot":
+        try:
+            slot_date = date.fromisoformat(section_id[len("slot-"):len("slot-") + 10])
+        except ValueError:
+            return (rank, 2, 0, section_id)
+        # Upcoming schedule first (nearest first), then past slots (most recent first)
+        days = (slot_date - today).days
+        return (rank, 0, days, section_id) if days >= 0 else (rank, 1, -days, section_id)
+    return (rank, 0, 0, section_id)
+
+
+def fit_syllabus_context(
+    model: str,
+    parts: List[SyllabusContextPart],
+    reserved_tokens: int,
+    user_query: Optional[str] = None
+) -> BudgetResult:
+    """
+    Fit one or more syllabi into the model's context window before calling it.
+
+    If the full renderings fit they are used as-is. Otherwise the syllabi are
+    rebuilt from their sections, taking sections round-robin across syllabi in
+    priority order (sections matching the query first, then tests, assignments,
+    requirements, ..., upcoming schedule slots) until the budget is spent.
+
+    Args:
+        model: Model the context is for.
+        parts: The syllabi to include.
+        reserved_tokens: Tokens needed by the prompt template, query and output.
+        user_query: Used to promote lexically relevant sections when trimming.
+    """
+    budget = max(get_context_window(model) - reserved_tokens - settings.TOKEN_BUDGET_MARGIN, 0)
+    full_tokens = sum(
+        count_tokens(model, part.header + part.text + part.footer, f"{part.syllabus_id}:{part.version}:{part.rendering}")
+        for part in parts
+    )
+    if full_tokens <= budget:
+        return BudgetResult(
+            content="\n".join(part.header + part.text + part.footer for part in parts),
+            tokens=full_tokens,
+            budget=budget
+        )
+
+    logger.warning(f"Syllabus context of {full_tokens} tokens exceeds the {budget} token budget of {model}, trimming by priority")
+    today = date.today()
+    queues = []
+    for part in parts:
+        sections = build_sections(part.course_data)
+        relevant_ids: Dict[str, int] = {}
+        if user_query:
+            index = lexical_index.get_index(part.syllabus_id, part.version, part.course_data)
+            for position, (section, _) in enumerate(index.search(user_query, top_k=settings.RETRIEVAL_TOP_K * 2)):
+                relevant_ids[section["id"]] = position
+        sections.sort(key=lambda s: _section_rank(s, relevant_ids, today))
+        queues.append(sections)
+
+    frame_tokens = [count_tokens(model, part.header + part.footer) for part in parts]
+    used = 0
+    selected: List[List[Dict[str, str]]] = [[] for _ in parts]
+    added: List[int] = []  # the syllabus of each selected section, in selection order
+    positions = [0] * len(parts)
+    exhausted = [not queue for queue in queues]
+    while not all(exhausted):
+        for i, part in enumerate(parts):
+            if exhausted[i]:
+                continue
+            section = queues[i][positions[i]]
+            positions[i] += 1
+            exhausted[i] = positions[i] >= len(queues[i])
+            text = f"{section['label']}\n{section['content']}\n\n"
+            tokens = count_tokens(model, text, f"{part.syllabus_id}:{part.version}:{section['id']}")
+            # A syllabus' header and footer are paid for with its first section
+            if not selected[i]:
+                tokens += frame_tokens[i]
+            if used + tokens > budget:
+                continue
+            used += tokens
+            selected[i].append(section)
+            added.append(i)
+
+    def render() -> str:
+        return "\n".join(
+            part.header + "".join(f"{s['label']}\n{s['content']}\n\n" for s in sections) + part.footer
+            for part, sections in zip(parts, selected) if sections
+        )
+
+    # The pieces were counted apart: check the joined text, dropping the last sections taken if it runs over
+    content = render()
+    used = count_tokens(model, content) if content else 0
+    while used > budget and added:
+        selected[added.pop()].pop()
+        content = render()
+        used = count_tokens(model, content) if content else 0
+
+    trimmed = []
+    dropped = 0
+    for part, sections, queue in zip(parts, selected, queues):
+        if len(sections) < len(queue):
+            trimmed.append(part.syllabus_id)
+            dropped += len(queue) - len(sections)
+
+    return BudgetResult(
+        content=content,
+        tokens=used,
+        budget=budget,
+        trimmed_syllabi=trimmed,
+        dropped_sections=dropped
+    )
@@ -1,5 +1,4 @@
 from typing import List, Dict, Any
-from deepdiff import DeepDiff
 
 from app.models.syllabus import FieldChange
 
@@ -14,6 +13,9 @@ def detect_changes(old_data: Dict[str, Any], new_data: Dict[str, Any]) -> List[F
     Returns:
         List of FieldChange objects describing the differences
     """
+    # deepdiff is slow to import and only needed when a syllabus is updated
+    from deepdiff import DeepDiff
+
     changes = []
     
     # Use DeepDiff to find differences
@@ -0,0 +1,215 @@
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from bson import Binary
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.lexical_index import tokenize
+from app.core.sections import build_sections
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class Embedder(ABC):
+    """Base class for embedders. Implementations return L2-normalized float32 rows."""
+
+    name: str = "base"
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as a (len(texts), dim) matrix."""
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic, dependency-free embedder based on signed feature hashing of
+    word terms and character trigrams. Needs no network, so it is used for
+    offline development and tests, and as the default when no embedding model
+    is configured.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        terms = tokenize(text)
+        features = list(terms)
+        for term in terms:
+            padded = f"#{term}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return _normalize_rows(np.stack([self._embed_one(t) for t in texts]))
+
+
+class LiteLLMEmbedder(Embedder):
+    """Embedder backed by any embedding model litellm can call."""
+
+    def __init__(self, model: str, batch_size: int = 64):
+        self.model = model
+        self.name = model
+        self.batch_size = batch_size
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            # The dimension is unknown without a response; an empty index never reads it
+            return np.zeros((0, 0), dtype=np.float32)
+        import litellm
+
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            response = await litellm.aembedding(model=self.model, input=texts[start:start + self.batch_size])
+            rows.extend(item["embedding"] for item in response.data)
+        return _normalize_rows(np.asarray(rows, dtype=np.float32))
+
+
+def get_embedder(name: Optional[str] = None) -> Embedder:
+    """Return the embedder configured by settings.EMBEDDING_MODEL (or `name`)."""
+    name = name or settings.EMBEDDING_MODEL
+    if name == "hashing" or name.startswith("hashing-"):
+        dim = int(name.split("-", 1)[1]) if "-" in name else 512
+        return HashingEmbedder(dim)
+    return LiteLLMEmbedder(name)
+
+
+class VectorIndex:
+    """Dense matrix of section embeddings with batched cosine top-k search."""
+
+    def __init__(self, sections: List[Dict[str, str]], matrix: np.ndarray):
+        self.sections = sections
+        self.matrix = matrix
+
+    def search_many(self, query_matrix: np.ndarray, top_k: int = 5) -> List[List[Tuple[Dict[str, str], float]]]:
+        """Rank sections for each row of query_matrix (rows must be normalized)."""
+        if not self.sections:
+            return [[] for _ in range(len(query_matrix))]
+        k = min(top_k, len(self.sections))
+        scores = query_matrix @ self.matrix.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([(self.sections[i], float(scores[row, i])) for i in ordered])
+        return results
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5) -> List[Tuple[Dict[str, str], float]]:
+        return self.search_many(query_vector.reshape(1, -1), top_k)[0]
+
+
+# (syllabus_id, embedder name) -> (version, index)
+_indexes: Dict[Tuple[str, str], Tuple[int, VectorIndex]] = {}
+
+
+async def _load_vectors(db: AsyncIOMotorDatabase, syllabus_id: str, version: int, embedder: Embedder) -> Optional[Tuple[List[str], np.ndarray]]:
+    doc = await db.syllabus_embeddings.find_one({
+        "syllabus_id": syllabus_id,
+        "version": version,
+        "embedder": embedder.name
+    })
+    if not doc:
+        return None
+    matrix = np.frombuffer(doc["vectors"], dtype=np.float32).reshape(len(doc["section_ids"]), doc["dim"])
+    return doc["section_ids"], matrix
+
+
+async def build_vector_index(
+        db: AsyncIOMotorDatabase,
+        syllabus_id: str,
+        version: int,
+        course_data: Dict[str, Any],
+        embedder: Optional[Embedder] = None
+    ) -> VectorIndex:
+    """
+    Embed the sections of a syllabus version and persist the vectors to
+    syllabus_embeddings, so other workers can load them instead of re-embedding.
+    """
+    embedder = embedder or get_embedder()
+    sections = build_sections(course_data)
+    matrix = await embedder.embed([f"{s['label']}\n{s['content']}" for s in sections])
+    await db.syllabus_embeddings.replace_one(
+        {"syllabus_id": syllabus_id, "version": version, "embedder": embedder.name},
+        {
+            "syllabus_id": syllabus_id,
+            "version": version,
+            "embedder": embedder.name,
+            "dim": int(matrix.shape[1]),
+            "section_ids": [s["id"] for s in sections],
+            "vectors": Binary(matrix.astype(np.float32).tobytes()),
+            "created_at": datetime.utcnow()
+        },
+        upsert=True
+    )
+    index = VectorIndex(sections, matrix)
+    _indexes[(syllabus_id, embedder.name)] = (version, index)
+    logger.info(f"Embedded {len(sections)} sections for syllabus {syllabus_id} v{version} with {embedder.name}")
+    return index
+
+
+async def get_vector_index(
+        db: AsyncIOMotorDatabase,
+        syllabus_id: str,
+        version: int,
+        course_data: Dict[str, Any],
+        embedder: Optional[Embedder] = None
+    ) -> VectorIndex:
+    """Return the vector index for a syllabus version: memory, then Mongo, then embed."""
+    embedder = embedder or get_embedder()
+    cached = _indexes.get((syllabus_id, embedder.name))
+    if cached and cached[0] == version:
+        return cached[1]
+
+    stored = await _load_vectors(db, syllabus_id, version, embedder)
+    if stored:
+        section_ids, matrix = stored
+        sections_by_id = {s["id"]: s for s in build_sections(course_data)}
+        if all(section_id in sections_by_id for section_id in section_ids):
+            index = VectorIndex([sections_by_id[i] for i in section_ids], matrix)
+            _indexes[(syllabus_id, embedder.name)] = (version, index)
+            return index
+        logger.warning(f"Stored vectors for syllabus {syllabus_id} v{version} do not match its sections, re-embedding")
+
+    return await build_vector_index(db, syllabus_id, version, course_data, embedder)
+
+
+async def search_syllabus(
+        db: AsyncIOMotorDatabase,
+        query: str,
+        syllabus_id: str,
+        version: int,
+        course_data: Dict[str, Any],
+        top_k: int = 5,
+        embedder: Optional[Embedder] = None
+    ) -> List[Tuple[Dict[str, str], float]]:
+    """Embed the query and return the top-k (section, cosine score) pairs."""
+    embedder = embedder or get_embedder()
+    index = await get_vector_index(db, syllabus_id, version, course_data, embedder)
+    query_vector = await embedder.embed([query])
+    return index.search(query_vector[0], top_k=top_k)
+
+
+def clear_indexes() -> None:
+    """Drop all in-process vector indexes. Useful for development/testing."""
+    _indexes.clear()
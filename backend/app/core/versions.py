@@ -0,0 +1,145 @@
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.models.syllabus import SyllabusCourse, SyllabusDocument, SyllabusVersion, CourseMeta
+from app.core import lexical_index, vector_index
+from app.core.cache import TTLCache, answer_cache
+from app.core.context_format import CONTEXT_FORMAT, render_compact_context
+from app.core.course_router import routing_table
+from app.core.syllabus_search import search_fields
+from app.core.utils import detect_changes
+
+logger = logging.getLogger(__name__)
+
+# Version documents never change once written, so they are cached by (syllabus id, version)
+version_cache = TTLCache(max_entries=64, ttl_seconds=24 * 3600)
+
+
+async def get_version_doc(db: AsyncIOMotorDatabase, syllabus_id: str, version: int) -> Optional[Dict[str, Any]]:
+    key = f"{syllabus_id}:{version}"
+    version_doc = version_cache.get(key)
+    if version_doc is None:
+        version_doc = await db.syllabus_versions.find_one({"syllabus_id": syllabus_id, "version": version})
+        if version_doc:
+            version_cache.set(key, version_doc)
+    return version_doc
+
+
+def _metadata(course: SyllabusCourse) -> CourseMeta:
+    return CourseMeta(name=course.name, heb_name=course.heb_name, year=course.year, semester=course.semester)
+
+
+async def _refresh_indexes(db: AsyncIOMotorDatabase, syllabus_id: str, version: int, data: Dict[str, Any]) -> None:
+    """
+    Keep the answer cache, the course routing table and the retrieval indexes
+    in step with a new version.
+
+    The version is already stored, so a failure to embed it is logged rather
+    than raised: get_vector_index() embeds the version on its first search.
+    """
+    answer_cache.invalidate_tag(syllabus_id)
+    routing_table.invalidate()
+    lexical_index.rebuild_index(syllabus_id, version, data)
+    try:
+        await vector_index.build_vector_index(db, syllabus_id, version, data)
+    except Exception as e:
+        logger.error(f"Failed to embed syllabus {syllabus_id} v{version}, deferring to first search: {e}")
+
+
+async def create_version(
+        db: AsyncIOMotorDatabase,
+        syllabus_id: str,
+        course: SyllabusCourse,
+        created_by: str,
+        change_summary: Optional[str] = None
+    ) -> Dict[str, Any]:
+    """
+    Store course as the next version of an existing syllabus.
+
+    Returns:
+        {"version": ..., "changes": ...}; no version is created when nothing changed.
+
+    Raises:
+        LookupError: The syllabus or its current version does not exist.
+    """
+    oid = ObjectId(syllabus_id)
+    syllabus_doc = await db.syllabi.find_one({"_id": oid})
+    if not syllabus_doc:
+        raise LookupError(f"Syllabus {syllabus_id} not found")
+    current_version_doc = await db.syllabus_versions.find_one({
+        "syllabus_id": syllabus_id,
+        "version": syllabus_doc["current_version"]
+    })
+    if not current_version_doc:
+        raise LookupError(f"Current version data not found for syllabus {syllabus_id}")
+
+    data = course.model_dump()
+    changes = detect_changes(current_version_doc["data"], data)
+    if not changes:
+        return {"version": syllabus_doc["current_version"], "changes": 0}
+
+    new_version_number = syllabus_doc["current_version"] + 1
+    new_version = SyllabusVersion(
+        syllabus_id=syllabus_id,
+        version=new_version_number,
+        data=course,
+        created_at=datetime.utcnow(),
+        created_by=created_by,
+        change_summary=change_summary or f"Updated {len(changes)} fields",
+        changes=changes,
+        llm_context=render_compact_context(data),
+        llm_context_format=CONTEXT_FORMAT
+    )
+    await db.syllabus_versions.insert_one(new_version.model_dump(by_alias=True, exclude={'id'}))
+    await db.syllabi.update_one(
+        {"_id": oid},
+        {"$set": {
+            "current_version": new_version_number,
+            **{f"metadata.{k}": v for k, v in _metadata(course).model_dump().items()},
+            "search": search_fields(syllabus_doc["course_id"], course.name, course.heb_name)
+        }}
+    )
+    await _refresh_indexes(db, syllabus_id, new_version_number, data)
+    logger.info(f"Created version {new_version_number} of syllabus {syllabus_id} ({len(changes)} changes)")
+    return {"version": new_version_number, "changes": len(changes)}
+
+
+async def create_syllabus(
+        db: AsyncIOMotorDatabase,
+        course: SyllabusCourse,
+        created_by: str,
+        change_summary: Optional[str] = None
+    ) -> str:
+    """Create a syllabus with course as its first version. Returns the syllabus id."""
+    syllabus_doc = SyllabusDocument(
+        course_id=course.id,
+        current_version=1,
+        created_at=datetime.utcnow(),
+        created_by=created_by,
+        metadata=_metadata(course)
+    )
+    result = await db.syllabi.insert_one({
+        **syllabus_doc.model_dump(by_alias=True, exclude={'id'}),
+        "search": search_fields(course.id, course.name, course.heb_name)
+    })
+    syllabus_id = str(result.inserted_id)
+
+    data = course.model_dump()
+    version = SyllabusVersion(
+        syllabus_id=syllabus_id,
+        version=1,
+        data=course,
+        created_at=datetime.utcnow(),
+        created_by=created_by,
+        change_summary=change_summary or "Initial version",
+        llm_context=render_compact_context(data),
+        llm_context_format=CONTEXT_FORMAT
+    )
+    await db.syllabus_versions.insert_one(version.model_dump(by_alias=True, exclude={'id'}))
+    await _refresh_indexes(db, syllabus_id, 1, data)
+    logger.info(f"Created syllabus {syllabus_id} for course {course.id}")
+    return syllabus_id
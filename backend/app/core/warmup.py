@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Any, Awaitable, Callable, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core import lexical_index, token_budget, vector_index
+from app.core.context_format import ensure_llm_context
+from app.core.llm_services import model_supports_reasoning, preload_prompts
+
+logger = logging.getLogger(__name__)
+
+warmup_state: Dict[str, Any] = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},  # step name -> seconds
+    "errors": {}  # step name -> error message
+}
+
+
+def _configured_models() -> Set[str]:
+    """Every model the app may call, so their metadata lookups are resolved up front."""
+    models = {settings.LLM_MODEL, settings.GENERATION_LLM_MODEL, settings.CHAT_RETRIEVAL_MODEL, "gpt-4o", "o4-mini"}
+    if settings.RETRIEVAL_LLM_MODEL:
+        models.add(settings.RETRIEVAL_LLM_MODEL)
+    models.update(tier["model"] for tier in settings.CHAT_CASCADE_TIERS)
+    models.update(settings.LLM_HEDGE_MODELS.keys())
+    models.update(settings.LLM_HEDGE_MODELS.values())
+    for primary, fallbacks in settings.LLM_FALLBACK_MODELS.items():
+        models.add(primary)
+        models.update(fallbacks)
+    return models
+
+
+def warm_model_metadata() -> int:
+    models = _configured_models()
+    for model in models:
+        model_supports_reasoning(model)
+        token_budget.get_context_window(model)
+        # Loads the tokenizer for the model
+        token_budget.count_tokens(model, "warmup")
+    return len(models)
+
+
+async def warm_syllabi(db: AsyncIOMotorDatabase) -> int:
+    """Render the LLM context and build the retrieval indexes of every current syllabus version."""
+    count = 0
+    async for syllabus_doc in db.syllabi.find({}, {"_id": 1, "current_version": 1}):
+        syllabus_id = str(syllabus_doc["_id"])
+        version_doc = await db.syllabus_versions.find_one({
+            "syllabus_id": syllabus_id,
+            "version": syllabus_doc["current_version"]
+        })
+        if not version_doc or not version_doc.get("data"):
+            continue
+        await ensure_llm_context(db, version_doc)
+        await asyncio.to_thread(lexical_index.get_index, syllabus_id, version_doc["version"], version_doc["data"])
+        if settings.RETRIEVAL_MODE == "vector":
+            await vector_index.get_vector_index(db, syllabus_id, version_doc["version"], version_doc["data"])
+        count += 1
+    return count
+
+
+async def _step(name: str, fn: Callable[[], Awaitable[Any]]) -> None:
+    started = time.perf_counter()
+    try:
+        result = await fn()
+        elapsed = time.perf_counter() - started
+        logger.info(f"Warm-up step '{name}' done in {elapsed * 1000:.0f} ms ({result})")
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        warmup_state["errors"][name] = str(e)
+        logger.error(f"Warm-up step '{name}' failed after {elapsed * 1000:.0f} ms: {e}")
+    warmup_state["steps"][name] = round(elapsed, 4)
+
+
+async def run_warmup(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """
+    Warm the caches the first requests would otherwise fill: prompt templates,
+    model metadata and tokenizers, and the LLM context and retrieval indexes of
+    every syllabus. A failed step is logged and does not stop the others.
+    """
+    warmup_state.update(ready=False, started_at=datetime.utcnow(), finished_at=None, steps={}, errors={})
+    started = time.perf_counter()
+
+    async def prompts() -> str:
+        await asyncio.to_thread(preload_prompts)
+        return "prompts loaded"
+
+    async def models() -> str:
+        return f"{await asyncio.to_thread(warm_model_metadata)} models"
+
+    async def syllabi() -> str:
+        return f"{await warm_syllabi(db)} syllabi"
+
+    await _step("prompts", prompts)
+    await _step("model_metadata", models)
+    await _step("syllabus_contexts", syllabi)
+
+    warmup_state.update(ready=True, finished_at=datetime.utcnow())
+    logger.info(f"Warm-up complete in {(time.perf_counter() - started) * 1000:.0f} ms: {warmup_state['steps']}")
+    return warmup_state
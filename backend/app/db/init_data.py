@@ -15,6 +15,8 @@ from app.models.syllabus import (
 )
 from app.db.session import database
 from app.core.config import settings
+from app.core.context_format import CONTEXT_FORMAT, render_compact_context
+from app.core.syllabus_search import search_fields
 
 logger = logging.getLogger(__name__)
 
@@ -81,7 +83,9 @@ async def create_syllabus_from_yaml(
                     data=syllabus_course,
                     created_at=datetime.utcnow(),
                     created_by="system",
-                    change_summary="Initial import from YAML"
+                    change_summary="Initial import from YAML",
+                    llm_context=render_compact_context(syllabus_course.model_dump()),
+                    llm_context_format=CONTEXT_FORMAT
                 )
                 
                 # Insert version
@@ -102,9 +106,10 @@ async def create_syllabus_from_yaml(
         )
         
         # Insert syllabus document
-        result = await db.syllabi.insert_one(
-            syllabus_doc.model_dump(by_alias=True, exclude={'id'})
-        )
+        result = await db.syllabi.insert_one({
+            **syllabus_doc.model_dump(by_alias=True, exclude={'id'}),
+            "search": search_fields(syllabus_doc.course_id, metadata.name, metadata.heb_name)
+        })
         syllabus_id = str(result.inserted_id)
         
         # Create course model
@@ -117,7 +122,9 @@ async def create_syllabus_from_yaml(
             data=syllabus_course,
             created_at=datetime.utcnow(),
             created_by="system",
-            change_summary="Initial import from YAML"
+            change_summary="Initial import from YAML",
+            llm_context=render_compact_context(syllabus_course.model_dump()),
+            llm_context_format=CONTEXT_FORMAT
         )
         
         # Insert version
@@ -144,10 +151,16 @@ async def initialize_syllabi(db: AsyncIOMotorDatabase = None):
     await db.syllabi.create_index("metadata.name")
     await db.syllabi.create_index("metadata.year")
     await db.syllabi.create_index("metadata.semester")
+    # Multikey index over normalized terms, prefixes and trigrams (app.core.syllabus_search)
+    await db.syllabi.create_index("search.keys")
     
     await db.syllabus_versions.create_index([("syllabus_id", 1), ("version", -1)])
     await db.syllabus_versions.create_index("created_at")
     
+    await db.syllabus_embeddings.create_index(
+        [("syllabus_id", 1), ("version", 1), ("embedder", 1)], unique=True
+    )
+    
     # Check if data already exists
     count = await db.syllabi.count_documents({})
     if count > 0:
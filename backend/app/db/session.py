@@ -16,7 +16,9 @@ async def setup_indexes():
         ("content.description", "text")
     ])
     
-    await database.messages.create_index("sender")
+    # Serves the per-sender history query: equality on sender, sorted by timestamp
+    await database.messages.create_index([("sender", 1), ("timestamp", -1)])
+    await database.subscriptions.create_index("sender", unique=True)
 
 async def get_db() -> AsyncGenerator[AsyncIOMotorDatabase, None]:
     """Get database connection."""
@@ -1,11 +1,18 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+import asyncio
 import logging
 import os
 
 from app.api.v1.endpoints import admin, chat, syllabus, webhook
 from app.core.config import settings
+from app.core.ingestion_jobs import ingestion_workers
+from app.core.message_writer import message_writer
+from app.core.syllabus_search import backfill_search_keys
+from app.core.warmup import run_warmup, warmup_state
 from app.db.init_data import initialize_syllabi
+from app.db.session import database, setup_indexes
 
 logging.basicConfig(
     level=logging.DEBUG if os.getenv("DEBUG", "False").lower() == "true" else logging.INFO,
@@ -34,10 +41,25 @@ async def startup_event():
     logger.info("Starting application initialization...")
     try:
         await initialize_syllabi()
+        await setup_indexes()
+        await backfill_search_keys(database)
         logger.info("Application initialization complete")
     except Exception as e:
         logger.error(f"Error during initialization: {e}")
         # Don't fail startup, just log the error
+    # Warm caches in the background; /ready reports when it is done
+    app.state.warmup_task = asyncio.create_task(run_warmup(database))
+    message_writer.start(database)
+    try:
+        await ingestion_workers.start(database)
+    except Exception as e:
+        logger.error(f"Error starting ingestion workers: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered messages and stop the ingestion workers; jobs in progress go back to the queue."""
+    await message_writer.stop()
+    await ingestion_workers.stop()
 
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["admin"])
 app.include_router(chat.router, prefix="/api/v1/chat", tags=["chat"])
@@ -50,4 +72,16 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"} 
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the startup warm-up has finished, 503 before."""
+    return JSONResponse(
+        status_code=200 if warmup_state["ready"] else 503,
+        content={
+            "status": "ready" if warmup_state["ready"] else "warming_up",
+            "steps": warmup_state["steps"],
+            "errors": warmup_state["errors"]
+        }
+    )
@@ -1,7 +1,6 @@
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Literal
 from pydantic import BaseModel, Field
-from beanie import Document, Link # Import Document for Beanie integration if used
 
 class SyllabusPersonnelItem(BaseModel):
     name: Optional[str] = None
@@ -106,6 +105,7 @@ class SyllabusCourse(BaseModel):
     assignments: Optional[List[SyllabusAssignmentItem]] = None
     schedule: Optional[SyllabusScheduleItem] = None
     tests: Optional[List[SyllabusTestItem]] = None
+    document_sections: Optional[List[Dict[str, str]]] = None  # [{label, content}] structured from an uploaded file
 
 class SyllabusSummaryResponse(BaseModel):
     id: str
@@ -136,6 +136,8 @@ class SyllabusVersion(BaseModel):
     created_by: Optional[str] = None
     change_summary: Optional[str] = None
     changes: Optional[List[FieldChange]] = None
+    llm_context: Optional[str] = None  # precomputed compact rendering for LLM prompts
+    llm_context_format: Optional[str] = None
 
     class Config:
         populate_by_name = True
@@ -0,0 +1,55 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from fake_mongo import FakeDatabase
+
+# Settings are read when app.core.config is first imported: keep tests offline and off the disk cache
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("RUN_TIMING_TESTS") == "1":
+        return
+    skip = pytest.mark.skip(reason="timing test, set RUN_TIMING_TESTS=1 to run it")
+    for item in items:
+        if "timing" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def db() -> FakeDatabase:
+    return FakeDatabase()
+
+
+def load_course(name: str) -> dict:
+    """Course data of one of the bundled syllabi (app/db/yamls/<name>.yaml)."""
+    import yaml
+
+    from app.models.syllabus import SyllabusCourse
+
+    path = Path(__file__).resolve().parents[1] / "app" / "db" / "yamls" / f"{name}.yaml"
+    return SyllabusCourse(**yaml.safe_load(path.read_text())["courses"][0]).model_dump()
+
+
+@pytest.fixture
+def pathology(db):
+    """db holding the pathology syllabus as the only course, with the routing and version caches cleared."""
+    from app.core.course_router import routing_table
+    from app.core.versions import version_cache
+
+    course = load_course("pathology")
+    db.syllabi.docs.append({
+        "_id": "pathology",
+        "course_id": course["id"],
+        "current_version": 1,
+        "metadata": {"name": course["name"], "heb_name": course["heb_name"]}
+    })
+    db.syllabus_versions.docs.append({"syllabus_id": "pathology", "version": 1, "data": course})
+    routing_table.invalidate()
+    version_cache.clear()
+    yield db
+    routing_table.invalidate()
+    version_cache.clear()
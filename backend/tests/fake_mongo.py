@@ -0,0 +1,342 @@
+"""
+In-memory stand-in for the parts of a Motor database the app uses.
+
+Covers the query operators, update operators and aggregation stages and
+expressions that appear in app/; anything else raises NotImplementedError
+so a test never passes by silently ignoring a condition.
+"""
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+_MISSING = object()
+
+
+def _get(doc: Any, path: str) -> Any:
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+
+def _set(doc: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc: Dict[str, Any], path: str) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _candidates(value: Any) -> List[Any]:
+    """A field value and, for arrays, each element (Mongo's multikey matching)."""
+    if value is _MISSING:
+        return []
+    return [value, *value] if isinstance(value, list) else [value]
+
+
+def _compare(value: Any, op: str, arg: Any) -> bool:
+    values = _candidates(value)
+    if op == "$eq":
+        return arg in values or (arg is None and value is _MISSING)
+    if op == "$ne":
+        return not _compare(value, "$eq", arg)
+    if op == "$in":
+        return any(v in arg for v in values) or (None in arg and value is _MISSING)
+    if op == "$nin":
+        return not _compare(value, "$in", arg)
+    if op == "$all":
+        return all(a in values for a in arg)
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    comparisons = {"$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b, "$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b}
+    if op in comparisons:
+        return any(v is not None and comparisons[op](v, arg) for v in values)
+    raise NotImplementedError(f"query operator {op}")
+
+
+def matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not all(_compare(_get(doc, key), op, arg) for op, arg in condition.items()):
+                return False
+        elif not _compare(_get(doc, key), "$eq", condition):
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = {k for k, v in projection.items() if v and k != "_id"}
+    if included:
+        result = {}
+        for path in included:
+            value = _get(doc, path)
+            if value is not _MISSING:
+                _set(result, path, value)
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    for path, flag in projection.items():
+        if not flag:
+            _unset(doc, path)
+    return doc
+
+
+def _sort_key(spec: List[Tuple[str, int]]):
+    class Key:
+        def __init__(self, doc):
+            self.values = [_get(doc, field) for field, _ in spec]
+
+        def __lt__(self, other):
+            for (_, direction), a, b in zip(spec, self.values, other.values):
+                a, b = (None if a is _MISSING else a), (None if b is _MISSING else b)
+                if a == b:
+                    continue
+                # None sorts first ascending, as missing fields do in Mongo
+                if a is None or b is None:
+                    less = a is None
+                else:
+                    less = a < b
+                return less if direction == 1 else not less
+            return False
+
+    return Key
+
+
+def _sort_spec(key: Any, direction: int = 1) -> List[Tuple[str, int]]:
+    if isinstance(key, str):
+        return [(key, direction)]
+    if isinstance(key, dict):
+        return list(key.items())
+    return list(key)
+
+
+def _apply_update(doc: Dict[str, Any], update: Dict[str, Any]) -> None:
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set":
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                continue
+            elif op == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$push":
+                current = _get(doc, path)
+                _set(doc, path, ([] if current is _MISSING else current) + [value])
+            else:
+                raise NotImplementedError(f"update operator {op}")
+
+
+def _evaluate(expression: Any, doc: Dict[str, Any]) -> Any:
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [_evaluate(e, doc) for e in expression]
+    if not isinstance(expression, dict):
+        return expression
+    (op, arg), = expression.items()
+    if op == "$switch":
+        for branch in arg["branches"]:
+            if _evaluate(branch["case"], doc):
+                return _evaluate(branch["then"], doc)
+        return _evaluate(arg["default"], doc)
+    if op == "$cond":
+        condition, then, otherwise = arg
+        return _evaluate(then if _evaluate(condition, doc) else otherwise, doc)
+    args = _evaluate(arg, doc)
+    if op == "$add":
+        return sum(args)
+    if op == "$size":
+        return len(args[0] if isinstance(arg, list) else args)
+    if op == "$setIntersection":
+        first, *rest = args
+        return [v for v in dict.fromkeys(first) if all(v in other for other in rest)]
+    if op == "$gt":
+        return args[0] > args[1]
+    if op == "$eq":
+        return args[0] == args[1]
+    if op == "$toLower":
+        return (args[0] if isinstance(arg, list) else args).lower()
+    if op == "$ifNull":
+        return args[1] if args[0] is None else args[0]
+    raise NotImplementedError(f"expression operator {op}")
+
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = docs
+
+    def sort(self, key: Any, direction: int = 1) -> "FakeCursor":
+        self.docs = sorted(self.docs, key=_sort_key(_sort_spec(key, direction)))
+        return self
+
+    def limit(self, n: int) -> "FakeCursor":
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.docs[:length] if length else list(self.docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, upserted_id: Any = None):
+        self.matched_count = matched_count
+        self.modified_count = matched_count
+        self.upserted_id = upserted_id
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.docs: List[Dict[str, Any]] = []
+        self.indexes: List[Any] = []
+        self.calls: Dict[str, int] = {}
+        # Set to an exception to make the next write fail
+        self.fail_next_write: Optional[BaseException] = None
+
+    def _count(self, method: str) -> None:
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _check_write(self) -> None:
+        if self.fail_next_write is not None:
+            error, self.fail_next_write = self.fail_next_write, None
+            raise error
+
+    async def create_index(self, keys: Any, **kwargs: Any) -> str:
+        self.indexes.append((keys, kwargs))
+        return str(keys)
+
+    async def insert_one(self, doc: Dict[str, Any]) -> InsertOneResult:
+        self._count("insert_one")
+        self._check_write()
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(copy.deepcopy(doc))
+        return InsertOneResult(doc["_id"])
+
+    async def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True) -> None:
+        self._count("insert_many")
+        self._check_write()
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(copy.deepcopy(doc))
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> FakeCursor:
+        self._count("find")
+        return FakeCursor([_project(d, projection) for d in self.docs if matches(d, query or {})])
+
+    async def find_one(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, sort: Any = None) -> Optional[Dict[str, Any]]:
+        self._count("find_one")
+        docs = [d for d in self.docs if matches(d, query or {})]
+        if sort:
+            docs.sort(key=_sort_key(_sort_spec(sort)))
+        return _project(docs[0], projection) if docs else None
+
+    async def count_documents(self, query: Dict[str, Any]) -> int:
+        return sum(1 for d in self.docs if matches(d, query))
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        self._count("update_one")
+        self._check_write()
+        for doc in self.docs:
+            if matches(doc, query):
+                _apply_update(doc, update)
+                return UpdateResult(1)
+        if not upsert:
+            return UpdateResult(0)
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        _apply_update(doc, {**update, "$set": {**update.get("$setOnInsert", {}), **update.get("$set", {})}})
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(doc)
+        return UpdateResult(0, doc["_id"])
+
+    async def replace_one(self, query: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        self._count("replace_one")
+        for i, doc in enumerate(self.docs):
+            if matches(doc, query):
+                self.docs[i] = {"_id": doc["_id"], **copy.deepcopy(replacement)}
+                return UpdateResult(1)
+        if upsert:
+            self.docs.append({"_id": ObjectId(), **copy.deepcopy(replacement)})
+        return UpdateResult(0)
+
+    async def find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any], sort: Any = None, return_document: Any = False, **kwargs: Any) -> Optional[Dict[str, Any]]:
+        self._count("find_one_and_update")
+        docs = [d for d in self.docs if matches(d, query)]
+        if sort:
+            docs.sort(key=_sort_key(_sort_spec(sort)))
+        if not docs:
+            return None
+        before = copy.deepcopy(docs[0])
+        _apply_update(docs[0], update)
+        return copy.deepcopy(docs[0]) if return_document else before
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> FakeCursor:
+        self._count("aggregate")
+        docs = [copy.deepcopy(d) for d in self.docs]
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                docs = [d for d in docs if matches(d, arg)]
+            elif op == "$addFields":
+                for d in docs:
+                    for field, expression in arg.items():
+                        _set(d, field, _evaluate(expression, d))
+            elif op == "$sort":
+                docs.sort(key=_sort_key(_sort_spec(arg)))
+            elif op == "$limit":
+                docs = docs[:arg]
+            elif op == "$project":
+                docs = [_project(d, arg) for d in docs]
+            else:
+                raise NotImplementedError(f"aggregation stage {op}")
+        return FakeCursor(docs)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
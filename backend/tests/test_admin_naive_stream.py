@@ -0,0 +1,61 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from conftest import load_course
+
+from app.api.v1.endpoints import admin
+from app.api.v1.endpoints.admin import NAIVE_TEST_SENDER, LLMTestRequest
+from app.core.message_writer import message_writer
+
+
+@pytest.fixture
+def syllabus_id(db, monkeypatch):
+    """A stored pathology syllabus, answered by a fake two-chunk stream."""
+    oid = ObjectId()
+    db.syllabi.docs.append({"_id": oid, "current_version": 1})
+    db.syllabus_versions.docs.append({"_id": ObjectId(), "syllabus_id": str(oid), "version": 1, "data": load_course("pathology")})
+
+    async def stream_answer_naively(**_):
+        for delta in ("The exam ", "is on Monday."):
+            yield delta
+
+    monkeypatch.setattr(admin, "stream_answer_naively", stream_answer_naively)
+    return str(oid)
+
+
+def _ask(db, syllabus_id, accept):
+    request = SimpleNamespace(headers={"accept": accept})
+    request_data = LLMTestRequest(syllabus_ids=[syllabus_id], user_query="When is the exam?")
+
+    async def run():
+        try:
+            response = await admin.test_llm_naive_stream(request, request_data, db=db)
+            if isinstance(response, dict):
+                return response
+            return [chunk async for chunk in response.body_iterator]
+        finally:
+            await message_writer.stop()
+
+    return asyncio.run(run())
+
+
+def test_streamed_answer_is_persisted_once_complete(db, syllabus_id):
+    events = _ask(db, syllabus_id, "text/event-stream")
+
+    assert [json.loads(event.split("data: ", 1)[1]) for event in events] == [
+        {"delta": "The exam "}, {"delta": "is on Monday."}, {"response": "The exam is on Monday."}
+    ]
+    message, = db.messages.docs
+    assert message["sender"] == NAIVE_TEST_SENDER
+    assert message["message"] == "When is the exam?"
+    assert message["response"] == "The exam is on Monday."
+    assert message["syllabus_versions"] == {syllabus_id: 1}
+
+
+def test_json_answer_is_persisted(db, syllabus_id):
+    assert _ask(db, syllabus_id, "application/json") == {"response": "The exam is on Monday."}
+    message, = db.messages.docs
+    assert message["response"] == "The exam is on Monday."
@@ -0,0 +1,96 @@
+from app.core import cache
+from app.core.cache import TTLCache, make_answer_key, normalize_query
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    entries = TTLCache(max_entries=10, ttl_seconds=60)
+    entries.set("a", 1)
+
+    clock.now += 59
+    assert entries.get("a") == 1
+    clock.now += 2
+    assert entries.peek("a") is None
+    assert entries.get("a") is None
+    assert entries.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    entries = TTLCache(max_entries=2, ttl_seconds=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+
+    assert entries.get("b") is None
+    assert entries.get("a") == 1 and entries.get("c") == 3
+    assert entries.stats()["evictions"] == 1
+
+
+def test_peek_leaves_order_and_counters_alone():
+    entries = TTLCache(max_entries=2, ttl_seconds=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.peek("a") == 1
+    entries.set("c", 3)
+
+    assert entries.peek("a") is None
+    stats = entries.stats()
+    assert (stats["hits"], stats["misses"]) == (0, 0)
+
+
+def test_invalidate_tag_drops_every_tagged_entry():
+    entries = TTLCache(max_entries=10, ttl_seconds=60)
+    entries.set("a", 1, tags=["s1"])
+    entries.set("b", 2, tags=["s1", "s2"])
+    entries.set("c", 3, tags=["s2"])
+
+    assert entries.invalidate_tag("s1") == 2
+    assert entries.peek("a") is None and entries.peek("b") is None
+    assert entries.peek("c") == 3
+    assert entries.invalidate_tag("s1") == 0
+    # An overwritten entry no longer carries its old tags
+    entries.set("c", 4)
+    assert entries.invalidate_tag("s2") == 0
+    assert entries.peek("c") == 4
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("  When is the  EXAM?? ") == "when is the exam"
+    assert normalize_query("מתי הבחינה?") == normalize_query("מתי   הבחינה")
+
+
+def _key(**overrides):
+    args = {
+        "user_query": "When is the exam?",
+        "syllabus_versions": {"s1": 1, "s2": 3},
+        "model_name": "gpt-4.1",
+        "temperature": 0.0,
+        "max_tokens": 1000,
+        "system_prompt": "You answer questions about syllabi.",
+        "current_date": "2026-10-18"
+    }
+    return make_answer_key(**{**args, **overrides})
+
+
+def test_answer_key_shares_phrasings_and_changes_with_its_inputs():
+    assert _key(user_query="when is the exam") == _key()
+    assert _key(syllabus_versions={"s2": 3, "s1": 1}) == _key()
+    for overrides in (
+        {"syllabus_versions": {"s1": 2, "s2": 3}},
+        {"model_name": "gpt-4o"},
+        {"temperature": 0.7},
+        {"system_prompt": "Answer briefly."},
+        {"current_date": "2026-10-19"},
+        {"user_prompt_hash": "abc"}
+    ):
+        assert _key(**overrides) != _key(), overrides
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import llm_client
+from app.core.cascade import CascadeTier, cascade_completion, parse_confidence
+
+TIERS = [CascadeTier(model="cheap"), CascadeTier(model="middle"), CascadeTier(model="strong")]
+
+
+class Replies(dict):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    """Map a model to its reply: a string, or an exception to raise."""
+    by_model = Replies()
+
+    async def acompletion(kind, **params):
+        by_model.calls.append(params)
+        reply = by_model[params["model"]]
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+    monkeypatch.setattr(llm_client, "acompletion", acompletion)
+    return by_model
+
+
+def _confident(answer, confidence):
+    return json.dumps({"answer": answer, "confidence": confidence})
+
+
+def _run(**kwargs):
+    return asyncio.run(cascade_completion("Context: ...", "When is the exam?", tiers=TIERS, min_confidence=0.7, **kwargs))
+
+
+def test_confident_cheap_answer_is_accepted(replies):
+    replies["cheap"] = _confident(" On May 3rd. ", 0.9)
+    result = _run()
+    assert (result.answer, result.model, result.tier, result.confidence) == ("On May 3rd.", "cheap", 0, 0.9)
+    assert result.escalations == []
+    call, = replies.calls
+    assert call["response_format"] == {"type": "json_object"}
+    assert "confidence" in call["messages"][0]["content"]
+
+
+def test_low_confidence_unparseable_and_failed_tiers_escalate(replies):
+    replies["cheap"] = _confident("Probably May", 0.3)
+    replies["middle"] = "May 3rd, I think"
+    replies["strong"] = "The exam is on May 3rd."
+    result = _run()
+    assert (result.answer, result.model, result.tier, result.confidence) == ("The exam is on May 3rd.", "strong", 2, None)
+    assert result.escalations == ["cheap: confidence 0.30", "middle: unparseable"]
+    # The last tier answers in plain text
+    last = replies.calls[-1]
+    assert "response_format" not in last
+    assert last["messages"][0]["content"] == "Context: ..."
+
+    replies.calls.clear()
+    replies["cheap"] = TimeoutError("provider timeout")
+    replies["middle"] = _confident("May 3rd", 0.8)
+    result = _run()
+    assert (result.model, result.escalations) == ("middle", ["cheap: error"])
+
+
+def test_last_tier_error_is_raised(replies):
+    replies["cheap"] = _confident("?", 0.1)
+    replies["middle"] = _confident("?", 0.1)
+    replies["strong"] = ConnectionError("provider down")
+    with pytest.raises(ConnectionError):
+        _run()
+
+
+def test_parse_confidence():
+    assert parse_confidence('```json\n{"answer": "yes", "confidence": "0.8"}\n```') == {"answer": "yes", "confidence": 0.8}
+    assert parse_confidence('{"answer": "yes"}') is None
+    assert parse_confidence('{"answer": 3, "confidence": 1}') is None
+    assert parse_confidence("yes") is None
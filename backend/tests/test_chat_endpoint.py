@@ -0,0 +1,158 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from conftest import load_course
+from fastapi import BackgroundTasks
+
+from app.api.v1.endpoints.chat import send_message
+from app.api.v1.schemas import ChatRequest
+from app.core import lexical_index, llm_client
+from app.core.config import settings
+from app.core.llm_services import get_speculation_stats
+from app.core.message_writer import message_writer
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    """A two-tier cascade whose cheap tier is unsure; records the calls."""
+    monkeypatch.setattr(settings, "CHAT_CASCADE_TIERS", [{"model": "cheap"}, {"model": "strong"}])
+    calls = []
+
+    async def acompletion(kind, **params):
+        calls.append(params)
+        if params["model"] == "cheap":
+            content = json.dumps({"answer": "Maybe 50%?", "confidence": 0.2})
+        else:
+            content = "The final exam is 90% of the grade."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(llm_client, "acompletion", acompletion)
+    return calls
+
+
+def _send(db, sender, message):
+    async def run():
+        try:
+            return await send_message(ChatRequest(sender=sender, message=message), BackgroundTasks(), db=db, settings=settings)
+        finally:
+            await message_writer.stop()
+
+    return asyncio.run(run())
+
+
+def test_chat_endpoint_answers_through_the_cascade(pathology, tiers):
+    response = _send(pathology, "cascade-student", "איך מורכב הציון בקורס?")
+
+    assert response == {"response": "The final exam is 90% of the grade."}
+    cheap, strong = tiers
+    assert (cheap["model"], strong["model"]) == ("cheap", "strong")
+    assert cheap["response_format"] == {"type": "json_object"}
+    assert "90%" in cheap["messages"][0]["content"]  # the retrieved context reaches the tiers
+    # The stored message names the model that answered
+    stored, = pathology.messages.docs
+    assert stored["model"] == "strong"
+
+
+def test_chat_endpoint_sends_history_to_the_cascade(pathology, tiers):
+    _send(pathology, "history-student", "מתי הבחינה?")
+    tiers.clear()
+    _send(pathology, "history-student", "איך מורכב הציון בקורס?")
+
+    messages = tiers[0]["messages"]
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[1]["content"] == "מתי הבחינה?"
+    assert messages[-1]["content"] == "איך מורכב הציון בקורס?"
+
+
+def test_identical_questions_in_flight_share_one_answer_run(pathology, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CASCADE_TIERS", [{"model": "strong"}])
+    answer_calls = []
+
+    async def slow(kind, **params):
+        await asyncio.sleep(0.05)
+        answer_calls.append(params)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="On Monday."))])
+
+    monkeypatch.setattr(llm_client, "acompletion", slow)
+
+    async def run():
+        try:
+            requests = [
+                ChatRequest(sender="first-student", message="מתי הבחינה?"),
+                ChatRequest(sender="second-student", message="מתי  הבחינה"),
+                ChatRequest(sender="third-student", message="איך מורכב הציון?")
+            ]
+            return await asyncio.gather(*(send_message(r, BackgroundTasks(), db=pathology, settings=settings) for r in requests))
+        finally:
+            await message_writer.stop()
+
+    responses = asyncio.run(run())
+
+    assert [r["response"] for r in responses] == ["On Monday."] * 3
+    # The two phrasings of the same question were answered once
+    assert len(answer_calls) == 2
+    # Each stored message carries its caller's own timings next to the shared run's
+    stored = {doc["sender"]: doc for doc in pathology.messages.docs}
+    for sender in ("first-student", "second-student"):
+        assert {"lookup", "answer", "retrieval", "generation", "total"} <= stored[sender]["timings_ms"].keys()
+
+
+@pytest.fixture
+def speculative(pathology, monkeypatch):
+    """LLM retrieval with speculative generation; retrieval answers with the section ids in `selected`."""
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "llm")
+    monkeypatch.setattr(settings, "CHAT_SPECULATIVE_GENERATION", True)
+    monkeypatch.setattr(settings, "CHAT_CASCADE_TIERS", [{"model": "strong"}])
+    state = SimpleNamespace(db=pathology, selected=[], events=[], generations=[])
+
+    async def acompletion(kind, **params):
+        if kind == "retrieval":
+            state.events.append("retrieval started")
+            await asyncio.sleep(0.05)
+            state.events.append("retrieval done")
+            content = json.dumps({"section_ids": state.selected})
+        else:
+            state.events.append("generation started")
+            state.generations.append(params["messages"][0]["content"])
+            content = "The final exam is 90% of the grade."
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(llm_client, "acompletion", acompletion)
+    return state
+
+
+def _lexical_top_k(query):
+    index = lexical_index.get_index("pathology", 1, load_course("pathology"))
+    ranked = [section["id"] for section, _ in index.search(query, top_k=len(index.sections))]
+    top_k = ranked[:settings.RETRIEVAL_TOP_K]
+    others = [s["id"] for s in index.sections if s["id"] not in top_k]
+    return top_k, others
+
+
+def test_speculative_answer_is_kept_when_retrieval_agrees(speculative):
+    query = "איך מורכב הציון בקורס?"
+    top_k, _ = _lexical_top_k(query)
+    speculative.selected = top_k[:1]
+    before = get_speculation_stats()
+
+    response = _send(speculative.db, "speculating-student", query)
+
+    assert response == {"response": "The final exam is 90% of the grade."}
+    # Generation started on the BM25 context before retrieval returned, and was not redone
+    assert speculative.events == ["retrieval started", "generation started", "retrieval done"]
+    assert get_speculation_stats()["accepted"] == before["accepted"] + 1
+
+
+def test_speculative_answer_is_redone_when_retrieval_disagrees(speculative):
+    query = "איך מורכב הציון בקורס?"
+    _, others = _lexical_top_k(query)
+    speculative.selected = others[:1]
+    before = get_speculation_stats()
+
+    _send(speculative.db, "second-guessing-student", query)
+
+    speculated, redone = speculative.generations
+    assert "Course: פתולוגיה כללית" in redone and redone != speculated
+    assert get_speculation_stats()["discarded"] == before["discarded"] + 1
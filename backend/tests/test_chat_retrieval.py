@@ -0,0 +1,61 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import llm_services, vector_index
+from app.core.config import settings
+from app.core.llm_services import process_message
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    calls = []
+
+    async def acompletion(**params):
+        calls.append(params)
+        content = "90% final exam"
+        if "response_format" in params:
+            # A cascade tier below the last: answer confidently
+            content = json.dumps({"answer": content, "confidence": 0.9})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(llm_services.llm_client, "acompletion", acompletion)
+    return calls
+
+
+def test_process_message_follows_the_retrieval_mode(pathology, completions, monkeypatch):
+    async def no_vectors(*args, **kwargs):
+        raise AssertionError("vector retrieval used in bm25 mode")
+
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "bm25")
+    monkeypatch.setattr(vector_index, "search_syllabus", no_vectors)
+    trace = {}
+
+    answer = asyncio.run(process_message("איך מורכב הציון בקורס?", "student", pathology, settings, trace=trace))
+
+    assert answer == "90% final exam"
+    system = completions[0]["messages"][0]["content"]
+    assert "Course: פתולוגיה כללית" in system
+    assert "90%" in system  # the grading policy section was retrieved
+    assert trace["retrieval_context"] and "retrieval" in trace["timings_ms"]
+
+
+def test_process_message_vector_mode(pathology, completions, monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "vector")
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", "hashing")
+
+    answer = asyncio.run(process_message("how is the grade made up?", "student", pathology, settings))
+
+    assert answer == "90% final exam"
+    assert "Course: פתולוגיה כללית" in completions[0]["messages"][0]["content"]
+
+
+def test_process_message_retrieves_locally_by_default(pathology, completions):
+    assert settings.RETRIEVAL_MODE == "bm25"
+
+    asyncio.run(process_message("איך מורכב הציון בקורס?", "student", pathology, settings))
+
+    # Only the generation call: no retrieval model round-trip before it
+    assert [call["model"] for call in completions] == [settings.CHAT_CASCADE_TIERS[0]["model"]]
@@ -0,0 +1,117 @@
+import asyncio
+
+import yaml
+from bson import ObjectId
+from conftest import load_course
+
+from app.core.context_format import CONTEXT_FORMAT, ensure_llm_context, prune, render_compact_context
+from app.core.token_budget import count_tokens
+
+COURSE = {
+    "id": "0101.1234",
+    "name": "Pathology",
+    "heb_name": "פתולוגיה",
+    "year": "2025",
+    "semester": "b",
+    "description": {"general": "Mechanisms of disease", "goals": ""},
+    "personnel": {
+        "coordinator": {"name": "Dr. Levi", "email": "levi@example.com"},
+        "lab_staff": [{"name": "Noa"}, {"name": "Noa"}, {"name": "Omer", "email": None}],
+        "secretary": None,
+    },
+    "requirements": "Attend every lab",
+    "grading_policy": None,
+    "assignments": [{"name": "Lab report", "due_date": "2025-05-01", "due_time": "23:59", "submission_method": "Moodle", "details": None}],
+    "tests": [{"name": "Final exam", "test_type": "written", "notes": None, "moadim": [
+        {"moad_name": "A", "date": "2025-07-01", "time": "09:00", "location": "Hall 1"},
+        {"moad_name": "B", "date": "2025-08-01", "time": None, "location": None},
+    ]}],
+    "schedule": {
+        "general_notes": "Labs start in week 2",
+        "calendar_entries": [
+            {"date": "2025-04-28", "day_of_week_heb": "ב", "day_of_week_en": "Monday", "daily_notes": "Bring a lab coat", "time_slots": [
+                {"start_time": "09:00", "end_time": "12:00", "subject": "Inflammation", "activity_type": "lecture", "location": "Room 5",
+                 "instructors": ["Prof. Maya", "Dr. Levi"], "attending_groups": ["A", "B"], "details": "", "resources": []},
+            ]},
+            {"date": "2025-05-05", "day_of_week_heb": "ב", "time_slots": [
+                {"start_time": "09:00", "end_time": "12:00", "subject": "Neoplasia", "activity_type": "lab", "location": None,
+                 "instructors": ["Prof. Maya"], "attending_groups": [], "details": "Slides 1-20",
+                 "resources": [{"title": "Atlas", "url": "https://example.com/atlas"}]},
+            ]},
+        ],
+    },
+}
+
+
+def test_header_description_and_personnel():
+    lines = render_compact_context(COURSE).splitlines()
+
+    assert lines[0] == "0101.1234 | Pathology | פתולוגיה | 2025 | b"
+    assert "description.general: Mechanisms of disease" in lines
+    assert "coordinator: Dr. Levi | levi@example.com" in lines
+    # Repeated people are listed once, empty roles are dropped
+    assert "lab_staff: Noa; Omer" in lines
+    assert not any(line.startswith(("secretary", "description.goals")) for line in lines)
+
+
+def test_other_fields_are_kept_without_nulls():
+    rendered = render_compact_context(COURSE)
+
+    assert "requirements: Attend every lab" in rendered
+    assert "grading_policy" not in rendered
+    assert "None" not in rendered and "null" not in rendered
+
+
+def test_assignments_and_tests_take_one_line_each():
+    lines = render_compact_context(COURSE).splitlines()
+
+    assert "- Lab report | 2025-05-01 | 23:59 | Moodle" in lines
+    assert "- Final exam | written | A | 2025-07-01 | 09:00 | Hall 1; B | 2025-08-01" in lines
+
+
+def test_schedule_slots_are_flattened_with_repeated_instructors_coded():
+    lines = render_compact_context(COURSE).splitlines()
+
+    assert "schedule notes: Labs start in week 2" in lines
+    # Only instructors appearing in more than one slot get a code
+    assert "instructors: P1=Prof. Maya" in lines
+    assert "2025-04-28 ב | note: Bring a lab coat" in lines
+    assert "2025-04-28 ב | 09:00-12:00 | Inflammation | lecture | Room 5 | P1,Dr. Levi | A,B" in lines
+    assert "2025-05-05 ב | 09:00-12:00 | Neoplasia | lab | P1 | Slides 1-20 | Atlas | https://example.com/atlas" in lines
+    assert sum("Prof. Maya" in line for line in lines) == 1
+
+
+def test_empty_course_renders_only_what_it_has():
+    assert render_compact_context({"id": "1", "name": "Empty", "schedule": {}, "tests": [], "description": None}) == "1 | Empty"
+
+
+def test_prune_drops_empty_values_recursively():
+    assert prune({"a": None, "b": " x ", "c": [None, "", {"d": []}], "e": {"f": {}}, "g": 0}) == {"b": "x", "g": 0}
+
+
+def test_bundled_syllabus_is_smaller_than_its_yaml_and_keeps_the_schedule():
+    course = load_course("pathology")
+    compact = render_compact_context(course)
+    dumped = yaml.dump({"courses": [course]}, allow_unicode=True, sort_keys=False, Dumper=yaml.SafeDumper)
+
+    assert count_tokens("gpt-4o", compact) < count_tokens("gpt-4o", dumped) * 0.8
+    for entry in course["schedule"]["calendar_entries"]:
+        assert entry["date"] in compact
+        for slot in entry["time_slots"]:
+            if slot.get("subject"):
+                assert slot["subject"] in compact
+
+
+def test_ensure_llm_context_renders_once_and_rerenders_old_formats(db):
+    version_doc = {"_id": ObjectId(), "syllabus_id": "s", "version": 1, "data": COURSE}
+    db.syllabus_versions.docs.append(version_doc)
+
+    context = asyncio.run(ensure_llm_context(db, dict(version_doc)))
+    stored = db.syllabus_versions.docs[0]
+    assert context == render_compact_context(COURSE)
+    assert (stored["llm_context"], stored["llm_context_format"]) == (context, CONTEXT_FORMAT)
+
+    # A stored rendering in the current format is used as-is
+    assert asyncio.run(ensure_llm_context(db, {**version_doc, "llm_context": "stored", "llm_context_format": CONTEXT_FORMAT})) == "stored"
+    # One from an older format is rendered again
+    assert asyncio.run(ensure_llm_context(db, {**version_doc, "llm_context": "stored", "llm_context_format": "yaml"})) == context
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from app.core.course_router import RoutingTable
+
+COURSES = [
+    ("0102.1119.01", "General Pathology", "פתולוגיה כללית"),
+    ("0101.2315.01", "Clinical Experience, Medical Interviewing, Physical Examination, and Professionalism (YAHALOM Program)",
+     "יהלום - ימי התנסות קלינית, למידת ניהול ראיון רפואי ובדיקה גופנית, ומקצוענות"),
+    ("0102-2314", "Human Anatomy", "אנטומיה של גוף האדם"),
+    ("0102.2130.01", "Medical Genetics and Genomics", "גנטיקה וגנומיקה רפואית"),
+]
+
+
+@pytest.fixture
+def table(db):
+    for i, (course_id, name, heb_name) in enumerate(COURSES):
+        db.syllabi.docs.append({
+            "_id": i,
+            "course_id": course_id,
+            "current_version": 1,
+            "metadata": {"name": name, "heb_name": heb_name}
+        })
+    db.subscriptions.docs.append({"sender": "pathology-student", "courses": [{"course_id": "0102.1119.01", "group": "3"}]})
+    routing_table = RoutingTable()
+    asyncio.run(routing_table.ensure_loaded(db))
+    return routing_table
+
+
+def routed(table, sender, query):
+    route = table.route(sender, query)
+    return [course.course_id for course in route.courses], route.reason
+
+
+@pytest.mark.parametrize("query", [
+    "when is the final examination?",
+    "מתי הבדיקה הסופית?",
+    "is the physical examination part graded?",
+])
+def test_weak_matches_stay_within_the_subscription(table, query):
+    assert routed(table, "pathology-student", query) == (["0102.1119.01"], "subscription")
+
+
+@pytest.mark.parametrize("query, course_id", [
+    ("when is the anatomy exam?", "0102-2314"),
+    ("מתי המבחן באנטומיה?", "0102-2314"),
+    ("what does 0102-2314 cover?", "0102-2314"),
+    ("what is on the 2314 exam?", "0102-2314"),
+    ("genetics and genomics reading list", "0102.2130.01"),
+])
+def test_naming_another_course_leaves_the_subscription(table, query, course_id):
+    assert routed(table, "pathology-student", query) == ([course_id], "keywords")
+
+
+def test_own_course_keyword_wins(table):
+    assert routed(table, "pathology-student", "pathology vs anatomy exam dates") == (["0102.1119.01"], "keywords")
+
+
+def test_any_keyword_routes_senders_without_subscription(table):
+    assert routed(table, "new-student", "when is the final examination?") == (["0101.2315.01"], "keywords")
+
+
+def test_default_is_the_newest_course(table):
+    assert routed(table, "new-student", "hello") == (["0102.2130.01"], "default")
+
+
+def test_group_is_passed_on(table):
+    assert table.route("pathology-student", "when is the exam?").groups == {"0102.1119.01": "3"}
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+
+from app.core import extraction
+from app.core.extraction import DOCX_MIME_TYPE, PDF_MIME_TYPE, extract_document, extract_docx_text, extract_pdf_pages
+
+
+def _pdf(pages):
+    """A minimal PDF; each page is a list of (x, y, text) drawn in Helvetica, [] for a page without text."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for i, lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        kids.append(f"{page_id} 0 R")
+        stream = "".join(f"BT /F1 10 Tf {x} {y} Td ({text}) Tj ET\n" for x, y, text in lines).encode("latin-1")
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>"
+        ).encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = out.tell()
+        out.write(b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for number in sorted(objects):
+        out.write(b"%010d 00000 n \n" % offsets[number])
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+SCHEDULE_PAGE = [
+    (72, 700, "Date"), (250, 700, "Topic"), (450, 700, "Room"),
+    (72, 688, "2025-05-01"), (250, 688, "Inflammation"), (450, 688, "Hall 1"),
+]
+
+
+def test_layout_pdf_keeps_table_columns_apart():
+    first, second = extract_pdf_pages(_pdf([SCHEDULE_PAGE, []]))
+
+    assert first.number == 1
+    assert first.text.splitlines() == ["Date | Topic | Room", "2025-05-01 | Inflammation | Hall 1"]
+    assert first.has_text
+    # A page without a text layer is reported as scanned
+    assert second.number == 2 and second.text == "" and not second.has_text
+
+
+def _docx():
+    from docx import Document
+
+    document = Document()
+    document.add_paragraph("Course schedule")
+    table = document.add_table(rows=3, cols=3)
+    for row, values in zip(table.rows, [("Date", "Topic", "Room"), ("2025-05-01", "Inflammation", "Hall 1"), ("", "", "")]):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+    merged = document.add_table(rows=1, cols=3)
+    merged.cell(0, 0).merge(merged.cell(0, 2)).text = "Exam week, no classes"
+    document.add_paragraph("")
+    document.add_paragraph("Grading: final exam 90%")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def test_docx_tables_are_rows_of_cells_in_document_order():
+    assert extract_docx_text(_docx()).splitlines() == [
+        "Course schedule",
+        "Date | Topic | Room",
+        "2025-05-01 | Inflammation | Hall 1",
+        # A merged cell is kept once, empty rows and paragraphs are dropped
+        "Exam week, no classes",
+        "Grading: final exam 90%",
+    ]
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """Counts the extractions that actually run; the cache starts empty."""
+    extraction._extractions.clear()
+    runs = []
+    extract = extraction._extract
+
+    def counting_extract(file_content, mime_type, sha256):
+        runs.append(mime_type)
+        return extract(file_content, mime_type, sha256)
+
+    monkeypatch.setattr(extraction, "_extract", counting_extract)
+    yield runs
+    extraction._extractions.clear()
+
+
+def test_documents_are_cached_by_content_hash(extractions):
+    content = _pdf([SCHEDULE_PAGE])
+
+    async def run():
+        first = await extract_document(content, PDF_MIME_TYPE)
+        again = await extract_document(bytes(content), PDF_MIME_TYPE)  # an equal re-upload
+        other = await extract_document(_pdf([SCHEDULE_PAGE, []]), PDF_MIME_TYPE)
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first.sha256 == hashlib.sha256(content).hexdigest()
+    assert again is first
+    assert len(other.pages) == 2
+    assert extractions == [PDF_MIME_TYPE, PDF_MIME_TYPE]
+
+
+def test_text_docx_and_unsupported_types(extractions):
+    async def run(content, mime_type):
+        return await extract_document(content, mime_type)
+
+    assert asyncio.run(run("שלום, exam on Monday".encode("utf-8"), "text/plain")).text == "שלום, exam on Monday"
+    assert asyncio.run(run(_docx(), DOCX_MIME_TYPE)).pages[0].text.startswith("Course schedule\nDate | Topic | Room")
+    assert asyncio.run(run(b"\x89PNG", "image/png")) is None
+
+
+def test_unreadable_file_is_not_cached(extractions):
+    assert asyncio.run(extract_document(b"not a pdf", PDF_MIME_TYPE)) is None
+    assert asyncio.run(extract_document(b"not a pdf", PDF_MIME_TYPE)) is None
+    assert extractions == [PDF_MIME_TYPE, PDF_MIME_TYPE]
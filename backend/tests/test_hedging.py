@@ -0,0 +1,146 @@
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Dict
+
+import pytest
+
+from app.core import hedging
+from app.core.hedging import LatencyTracker, hedged_call
+
+
+def _fake_provider(first_token: Dict[str, Any], fail: Any = ()):
+    """A streaming completion function whose first-token delay per model comes from first_token."""
+
+    async def completion(model: str, stream: bool = False, **_: Any) -> Any:
+        if model in fail:
+            raise RuntimeError(f"{model} is down")
+        delay = first_token[model]() if callable(first_token[model]) else first_token[model]
+
+        async def chunks() -> AsyncIterator[str]:
+            await asyncio.sleep(delay)
+            for word in (model, "the", "exam", "is", "on", "monday"):
+                yield word
+
+        if stream:
+            return chunks()
+        await asyncio.sleep(delay)
+        return f"{model} response"
+
+    return completion
+
+
+async def _first_chunk(stream: Any) -> str:
+    async for chunk in stream:
+        return chunk
+
+
+async def _first_chunk_of(call) -> str:
+    return await _first_chunk(await call())
+
+
+def test_fast_primary_is_not_hedged():
+    tracker = LatencyTracker()
+    provider = _fake_provider({"primary": 0.01, "secondary": 0.01})
+
+    async def run():
+        return await hedged_call({"model": "primary", "stream": True}, "secondary", provider, delay=0.2, tracker=tracker)
+
+    assert asyncio.run(_first_chunk_of(run)) == "primary"
+    assert len(tracker._samples["primary"]) == 1
+    assert "secondary" not in tracker._samples
+
+
+def test_slow_primary_hedges_and_records_each_model_from_its_own_start():
+    tracker = LatencyTracker()
+    provider = _fake_provider({"primary": 1.0, "secondary": 0.05})
+
+    async def run():
+        return await hedged_call({"model": "primary", "stream": True}, "secondary", provider, delay=0.1, tracker=tracker)
+
+    started = time.monotonic()
+    assert asyncio.run(_first_chunk_of(run)) == "secondary"
+    assert time.monotonic() - started < 0.5
+
+    # The secondary's sample excludes the hedge delay
+    secondary, = tracker._samples["secondary"]
+    assert secondary == pytest.approx(0.05, abs=0.04)
+    # The cancelled primary records how long it had waited: at least the delay plus the secondary's time
+    primary, = tracker._samples["primary"]
+    assert primary >= 0.14
+
+
+def test_failed_primary_is_raised_without_hedging():
+    tracker = LatencyTracker()
+    provider = _fake_provider({"primary": 0.01, "secondary": 0.01}, fail={"primary"})
+    calls = []
+
+    async def completion(**params):
+        calls.append(params["model"])
+        return await provider(**params)
+
+    with pytest.raises(RuntimeError, match="primary is down"):
+        asyncio.run(hedged_call({"model": "primary"}, "secondary", completion, delay=5.0, tracker=tracker))
+    assert calls == ["primary"]
+    assert "primary" not in tracker._samples
+
+
+def _failing_after(delay: float, error: BaseException, secondary_delay: float):
+    """The primary fails after `delay`, the secondary answers after `secondary_delay`."""
+
+    async def completion(model: str, **_: Any) -> Any:
+        if model == "primary":
+            await asyncio.sleep(delay)
+            raise error
+        await asyncio.sleep(secondary_delay)
+        return "secondary response"
+
+    return completion
+
+
+def test_slow_primary_failing_with_a_retryable_error_leaves_the_secondary_running():
+    provider = _failing_after(0.1, asyncio.TimeoutError(), secondary_delay=0.15)
+    result = asyncio.run(hedged_call({"model": "primary"}, "secondary", provider, delay=0.05, tracker=LatencyTracker()))
+    assert result == "secondary response"
+
+
+def test_slow_primary_failing_with_a_non_retryable_error_is_raised():
+    provider = _failing_after(0.1, ValueError("bad request"), secondary_delay=1.0)
+    started = time.monotonic()
+    with pytest.raises(ValueError, match="bad request"):
+        asyncio.run(hedged_call({"model": "primary"}, "secondary", provider, delay=0.05, tracker=LatencyTracker()))
+    # Raised as soon as the primary failed, the secondary was cancelled
+    assert time.monotonic() - started < 0.5
+
+
+@pytest.mark.timing
+def test_hedging_cuts_tail_latency_without_over_hedging(monkeypatch):
+    """5% of calls stall: hedging at the primary's p95 should hedge about that many and remove the stall from p95."""
+    monkeypatch.setattr(hedging.settings, "LLM_HEDGE_MIN_SAMPLES", 20)
+    monkeypatch.setattr(hedging.settings, "LLM_HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setattr(hedging.settings, "LLM_HEDGE_MIN_DELAY", 0.01)
+    rng = random.Random(7)
+    first_token = lambda: rng.uniform(0.02, 0.05) if rng.random() > 0.05 else 0.8
+    provider = _fake_provider({"primary": first_token, "secondary": first_token})
+    tracker = LatencyTracker()
+
+    async def run(calls: int):
+        limit = asyncio.Semaphore(50)
+
+        async def one() -> float:
+            async with limit:
+                started = time.monotonic()
+                stream = await hedged_call({"model": "primary", "stream": True}, "secondary", provider, tracker=tracker)
+                await _first_chunk(stream)
+                return time.monotonic() - started
+
+        return sorted(await asyncio.gather(*(one() for _ in range(calls))))
+
+    asyncio.run(run(100))  # warm the tracker past LLM_HEDGE_MIN_SAMPLES
+    before = dict(hedging._stats)
+    latencies = asyncio.run(run(600))
+    hedged = (hedging._stats["hedged"] - before["hedged"]) / 600
+
+    p95 = latencies[int(len(latencies) * 0.95)]
+    assert p95 < 0.3
+    assert 0.03 <= hedged <= 0.08
@@ -0,0 +1,147 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core import history as history_module
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.history import conversation_cache, get_conversation_history, record_turn
+from app.core.message_writer import message_writer
+
+T0 = datetime(2025, 3, 1, 10, 0, 0, 123456)
+
+
+@pytest.fixture(autouse=True)
+def slow_flush(monkeypatch):
+    # Buffered writes stay pending until stop() flushes them
+    monkeypatch.setattr(settings, "MESSAGE_WRITE_FLUSH_SECONDS", 60)
+    monkeypatch.setattr(settings, "MESSAGE_WRITE_BATCH_SIZE", 100)
+    conversation_cache.clear()
+    yield
+    conversation_cache.clear()
+
+
+def _turn(i):
+    return {"sender": "s1", "message": f"q{i}", "response": f"a{i}", "timestamp": T0 + timedelta(minutes=i)}
+
+
+def messages(history):
+    return [turn["message"] for turn in history]
+
+
+def test_cache_miss_includes_turns_still_in_the_writer_buffer(db):
+    async def run():
+        db.messages.docs.append(_turn(0))
+        await message_writer.write(db, _turn(1))
+        try:
+            return await get_conversation_history("s1", db)
+        finally:
+            await message_writer.stop()
+
+    assert messages(asyncio.run(run())) == ["q0", "q1"]
+    assert not message_writer.pending
+
+
+def test_flushed_and_pending_turns_are_not_duplicated(db):
+    async def run():
+        await message_writer.write(db, _turn(1))
+        # Written by the time of the read, but still listed as pending (ms precision in Mongo)
+        stored = {**_turn(1), "timestamp": _turn(1)["timestamp"].replace(microsecond=123000)}
+        db.messages.docs.append(stored)
+        try:
+            return await get_conversation_history("s1", db)
+        finally:
+            message_writer.pending.clear()
+            await message_writer.stop()
+
+    assert messages(asyncio.run(run())) == ["q1"]
+
+
+def test_history_is_served_from_the_ring_buffer(db):
+    async def run():
+        db.messages.docs.append(_turn(0))
+        await get_conversation_history("s1", db)
+        record_turn("s1", "q1", "a1", T0 + timedelta(minutes=1))
+        finds = db.messages.calls["find"]
+        history = await get_conversation_history("s1", db)
+        assert db.messages.calls["find"] == finds
+        return history
+
+    assert messages(asyncio.run(run())) == ["q0", "q1"]
+
+
+def test_history_keeps_the_last_turns(db, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATION_HISTORY_LENGTH", 3)
+    db.messages.docs.extend(_turn(i) for i in range(5))
+    assert messages(asyncio.run(get_conversation_history("s1", db))) == ["q2", "q3", "q4"]
+
+
+def test_recorded_turns_stay_within_the_ring_buffer(db, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATION_HISTORY_LENGTH", 3)
+
+    async def run():
+        db.messages.docs.append(_turn(0))
+        await get_conversation_history("s1", db)
+        for i in range(1, 6):
+            record_turn("s1", f"q{i}", f"a{i}", T0 + timedelta(minutes=i))
+        history = await get_conversation_history("s1", db)
+        # Callers get a copy, not the buffer
+        history.clear()
+        return await get_conversation_history("s1", db)
+
+    assert messages(asyncio.run(run())) == ["q3", "q4", "q5"]
+    assert len(conversation_cache.peek("s1")) == 3
+
+
+def test_turns_of_uncached_senders_are_left_to_the_database(db):
+    record_turn("s1", "q0", "a0", T0)
+    assert conversation_cache.peek("s1") is None
+
+    db.messages.docs.append(_turn(1))
+    assert messages(asyncio.run(get_conversation_history("s1", db))) == ["q1"]
+
+
+def test_recorded_timestamps_are_naive_utc(db):
+    async def run():
+        await get_conversation_history("s1", db)
+        record_turn("s1", "q0", "a0", datetime(2025, 3, 1, 12, 0, tzinfo=timezone(timedelta(hours=2))))
+        return await get_conversation_history("s1", db)
+
+    turn, = asyncio.run(run())
+    assert turn["timestamp"] == datetime(2025, 3, 1, 10, 0)
+
+
+def test_least_recently_used_sender_is_evicted(db, monkeypatch):
+    monkeypatch.setattr(history_module, "conversation_cache", TTLCache(max_entries=2, ttl_seconds=900))
+
+    async def run():
+        for sender in ("s1", "s2", "s1", "s3"):
+            await get_conversation_history(sender, db)
+        finds = db.messages.calls["find"]
+        await get_conversation_history("s1", db)  # used recently, still buffered
+        assert db.messages.calls["find"] == finds
+        await get_conversation_history("s2", db)  # evicted, loaded again
+        assert db.messages.calls["find"] == finds + 1
+
+    asyncio.run(run())
+    assert history_module.conversation_cache.evictions == 2
+
+
+def test_expired_buffer_picks_up_turns_written_elsewhere(db, monkeypatch):
+    cache = TTLCache(max_entries=10, ttl_seconds=900)
+    monkeypatch.setattr(history_module, "conversation_cache", cache)
+
+    async def run():
+        db.messages.docs.append(_turn(0))
+        await get_conversation_history("s1", db)
+        # Another process answered the next turn
+        db.messages.docs.append(_turn(1))
+        stale = await get_conversation_history("s1", db)
+        cache.ttl_seconds = 0
+        cache.set("s1", cache.peek("s1"))
+        return stale, await get_conversation_history("s1", db)
+
+    stale, fresh = asyncio.run(run())
+    assert messages(stale) == ["q0"]
+    assert messages(fresh) == ["q0", "q1"]
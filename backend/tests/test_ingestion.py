@@ -0,0 +1,135 @@
+import asyncio
+import io
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from app.core import ingestion
+from app.core.config import settings
+from app.core.extraction import DOCX_MIME_TYPE, PDF_MIME_TYPE, ExtractedDocument, ExtractedPage
+from app.core.ingestion import merge_sections, plan_batches, structure_document
+
+SCANNED = ""
+
+
+def _text(number: int) -> str:
+    return f"Page {number}: weekly schedule and reading list"
+
+
+def _pdf(pages: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _document(texts) -> ExtractedDocument:
+    return ExtractedDocument("sha", PDF_MIME_TYPE, [ExtractedPage(number, text) for number, text in enumerate(texts, start=1)])
+
+
+def test_plan_batches_keeps_page_order_and_sends_only_scanned_runs_to_vision():
+    texts = [_text(1), _text(2), _text(3), SCANNED, SCANNED, _text(6), SCANNED]
+    batches = plan_batches(_document(texts), _pdf(len(texts)), pages_per_batch=2)
+
+    assert [(b.first_page, b.last_page, b.mime_type) for b in batches] == [
+        (1, 2, "text/plain"),
+        (3, 3, "text/plain"),
+        (4, 5, PDF_MIME_TYPE),
+        (6, 6, "text/plain"),
+        (7, 7, PDF_MIME_TYPE),
+    ]
+    # Multi-page text batches mark their pages, vision batches carry only their own pages
+    assert batches[0].content.decode() == f"[page 1]\n{_text(1)}\n\n[page 2]\n{_text(2)}"
+    assert len(PdfReader(io.BytesIO(batches[2].content)).pages) == 2
+
+
+def test_plan_batches_chunks_documents_without_pages(monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_TEXT_CHUNK_CHARS", 60)
+    lines = [f"line {i}: " + "x" * 20 for i in range(6)]
+    document = ExtractedDocument("sha", DOCX_MIME_TYPE, [ExtractedPage(1, "\n".join(lines))])
+
+    batches = plan_batches(document, b"", pages_per_batch=5)
+
+    assert [b.first_page for b in batches] == list(range(1, len(batches) + 1))
+    # Chunks split at line boundaries and keep every line in order
+    assert "\n".join(b.content.decode() for b in batches) == "\n".join(lines)
+    assert all(len(b.content) <= 60 for b in batches)
+
+
+def test_merge_sections_keeps_first_appearance_order_and_joins_continued_sections():
+    merged = merge_sections([
+        [{"label": "Grading", "content": "Exam 90%"}, {"label": "Schedule", "content": "Week 1: intro"}],
+        [{"label": "schedule ", "content": "Week 2: cells"}, {"label": "Staff", "content": "Dr. Cohen"}],
+    ])
+
+    assert merged == [
+        {"label": "Grading", "content": "Exam 90%"},
+        {"label": "Schedule", "content": "Week 1: intro\nWeek 2: cells"},
+        {"label": "Staff", "content": "Dr. Cohen"},
+    ]
+
+
+def test_merge_sections_drops_overlapping_content():
+    merged = merge_sections([
+        [{"label": "Schedule", "content": "Week 1: intro"}],
+        # A retried page repeats what is already there
+        [{"label": "Schedule", "content": "Week 1: intro"}],
+        # A longer version of the same section replaces the shorter one
+        [{"label": "Schedule", "content": "Week 1: intro\nWeek 2: cells"}],
+        [{"label": "", "content": ""}, {"label": "", "content": "Bring a lab coat"}],
+    ])
+
+    assert merged == [
+        {"label": "Schedule", "content": "Week 1: intro\nWeek 2: cells"},
+        {"label": "General Information", "content": "Bring a lab coat"},
+    ]
+
+
+@pytest.fixture
+def broken_page(monkeypatch):
+    """Five text pages, page 3 never structures; records each structuring call."""
+    texts = [_text(n) for n in range(1, 6)]
+    texts[2] = "Page 3: BROKEN scan of the grading table"
+
+    async def extract_document(file_content, mime_type):
+        return _document(texts)
+
+    calls = []
+
+    async def process_syllabus_with_llm(content, label, mime_type, max_retries=None, **kwargs):
+        calls.append((label.split("(pages ")[1].rstrip(")"), max_retries))
+        if b"BROKEN" in content:
+            return None
+        pages = [line for line in content.decode().splitlines() if line.startswith("Page ")]
+        return [{"label": "Schedule", "content": line} for line in pages]
+
+    monkeypatch.setattr(ingestion, "extract_document", extract_document)
+    monkeypatch.setattr(ingestion, "process_syllabus_with_llm", process_syllabus_with_llm)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.001)
+    return calls
+
+
+def test_failed_batch_spends_one_retry_budget_per_page(broken_page):
+    progress = []
+    sections = asyncio.run(structure_document(
+        b"%PDF", "syllabus.pdf", PDF_MIME_TYPE, pages_per_batch=2, max_retries=2,
+        progress=lambda done, total: progress.append((done, total))
+    ))
+
+    # The other pages of the failed batch survive, in page order
+    assert sections == [{"label": "Schedule", "content": "\n".join(_text(n) for n in (1, 2, 4, 5))}]
+    # Pages 3-4 failed once as a batch, then page 3 spent the rest of its budget (3 calls in all)
+    # and page 4 succeeded on its own
+    assert sorted(pages for pages, _ in broken_page) == ["1-2", "3-3", "3-3", "3-4", "4-4", "5-5"]
+    # The LLM client is never asked to retry on top of that
+    assert {max_retries for _, max_retries in broken_page} == {0}
+    assert sorted(progress)[-1] == (5, 5)
+
+
+def test_single_page_batch_is_retried_within_the_budget(broken_page):
+    sections = asyncio.run(structure_document(b"%PDF", "syllabus.pdf", PDF_MIME_TYPE, pages_per_batch=1, max_retries=1))
+
+    assert [pages for pages, _ in broken_page].count("3-3") == 2
+    assert [s["content"] for s in sections] == ["\n".join(_text(n) for n in (1, 2, 4, 5))]
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.core import ingestion_jobs
+from app.core.config import settings
+from app.core.ingestion_jobs import IngestionWorkerPool, enqueue_job, get_job
+
+COURSE = {"course_id": "0102.9999.01", "name": "Test Course", "heb_name": "קורס בדיקה", "year": "2025", "semester": "a"}
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_JOB_POLL_SECONDS", 0.01)
+
+
+async def _wait_for(db, job_id, predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await get_job(db, job_id)
+        if predicate(job):
+            return job
+        assert asyncio.get_running_loop().time() < deadline, f"job never reached the expected state: {job}"
+        await asyncio.sleep(0.01)
+
+
+def test_job_runs_all_stages(db, monkeypatch):
+    async def structure_document(content, filename, mime_type, progress=None):
+        await progress(1, 1)
+        return [{"label": "Grading", "content": "Final exam 90%"}]
+
+    monkeypatch.setattr(ingestion_jobs, "structure_document", structure_document)
+
+    async def run():
+        pool = IngestionWorkerPool()
+        await pool.start(db, workers=1)
+        try:
+            job_id = await enqueue_job(db, b"Grading: final exam 90%", "syllabus.txt", "text/plain", course=COURSE)
+            return await _wait_for(db, job_id, lambda job: job["status"] != "queued" and job["status"] != "running")
+        finally:
+            await pool.stop()
+
+    job = asyncio.run(run())
+    assert job["status"] == "succeeded", job.get("error")
+    assert {name: stage["status"] for name, stage in job["stages"].items()} == {
+        "extraction": "done", "structuring": "done", "version": "done"
+    }
+    assert job["result"]["sections"] == 1
+    assert db.syllabi.docs[0]["course_id"] == COURSE["course_id"]
+
+
+def test_shutdown_requeues_the_job_and_resets_its_stage(db, monkeypatch):
+    async def structure_document(*args, **kwargs):
+        await asyncio.Event().wait()  # never finishes
+
+    monkeypatch.setattr(ingestion_jobs, "structure_document", structure_document)
+
+    async def run():
+        pool = IngestionWorkerPool()
+        await pool.start(db, workers=1)
+        job_id = await enqueue_job(db, b"text", "syllabus.txt", "text/plain", course=COURSE)
+        await _wait_for(db, job_id, lambda job: job["stages"]["structuring"]["status"] == "running")
+        await pool.stop()
+        return await get_job(db, job_id)
+
+    job = asyncio.run(run())
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+    assert job["stages"]["extraction"]["status"] == "done"
+    assert job["stages"]["structuring"] == {"status": "pending"}
+    assert job["stages"]["version"]["status"] == "pending"
@@ -0,0 +1,49 @@
+from conftest import load_course
+
+from app.core import lexical_index
+from app.core.lexical_index import BM25Index, normalize_text, tokenize, words
+
+
+def test_normalize_text_folds_case_niqqud_and_final_letters():
+    assert normalize_text("Anatomy שָׁלוֹם") == "anatomy שלומ"
+
+
+def test_tokenize_strips_up_to_two_attached_hebrew_prefixes():
+    assert tokenize("ובבחינה") == ["ובבחינה", "בבחינה", "בחינה"]
+    assert tokenize("הציון exam") == ["הציונ", "ציונ", "exam"]
+    # Short words are left alone: "של" is not "ל" with a prefix
+    assert tokenize("של") == ["של"]
+
+
+def test_words_does_not_add_stripped_forms():
+    assert words("ובבחינה, Exam!") == ["ובבחינה", "exam"]
+
+
+def test_bm25_ranks_the_section_that_matches():
+    index = BM25Index([
+        {"id": "a", "label": "Grading", "content": "The final exam is 90% of the grade"},
+        {"id": "b", "label": "Schedule", "content": "Lectures on Monday and Wednesday"},
+        {"id": "c", "label": "Location", "content": "Dolfi hall"},
+    ])
+    results = index.search("Monday lectures", top_k=2)
+    assert [section["id"] for section, _ in results] == ["b"]
+    assert index.search("nothing relevant here xyz") == []
+
+
+def test_bm25_matches_hebrew_across_prefixes():
+    index = BM25Index([
+        {"id": "grading", "label": "ציון", "content": "הציון בבחינה המסכמת יהווה 90% מהציון בקורס"},
+        {"id": "place", "label": "מיקום", "content": "אולם דולפי"},
+    ])
+    section, _ = index.search("מתי הבחינה?")[0]
+    assert section["id"] == "grading"
+
+
+def test_get_index_is_cached_per_version():
+    lexical_index.clear_indexes()
+    data = load_course("pathology")
+    first = lexical_index.get_index("s1", 1, data)
+    assert lexical_index.get_index("s1", 1) is first
+    assert lexical_index.get_index("s1", 2) is None  # unknown version without data
+    assert lexical_index.get_index("s1", 2, data) is not first
+    lexical_index.clear_indexes()
@@ -0,0 +1,167 @@
+import asyncio
+import json
+
+import litellm
+import pytest
+
+from app.core import llm_client
+from app.core.config import settings
+from app.core.llm_client import CompletionStore, make_completion_key
+from app.core.llm_scheduler import LLMScheduler
+from app.core.llm_services import process_syllabus_with_llm
+
+SECTIONS = [{"label": "Grading", "content": "Final exam 90%"}]
+
+
+def _response(model, content, finish_reason="stop"):
+    return litellm.ModelResponse(
+        model=model,
+        choices=[{"index": 0, "finish_reason": finish_reason, "message": {"role": "assistant", "content": content}}]
+    )
+
+
+@pytest.fixture
+def provider(monkeypatch, tmp_path):
+    """litellm.acompletion replaced by a queue of responses (or errors) per model; the cache in tmp_path."""
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "LLM_HEDGING_ENABLED", False)
+    monkeypatch.setattr(llm_client, "completion_store", CompletionStore(str(tmp_path / "cache.sqlite3"), 100))
+    replies = {}
+    calls = []
+
+    async def acompletion(**params):
+        calls.append(params["model"])
+        reply = replies[params["model"]].pop(0)
+        if isinstance(reply, BaseException):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    return replies, calls
+
+
+def structure():
+    return asyncio.run(process_syllabus_with_llm(b"Grading: final exam 90%", "syllabus.txt", "text/plain", model="struct-model"))
+
+
+def test_unparseable_structuring_response_is_not_cached(provider):
+    replies, calls = provider
+    replies["struct-model"] = [
+        _response("struct-model", '[{"label": "Grading", "content": "Fin', finish_reason="length"),
+        _response("struct-model", json.dumps(SECTIONS)),
+    ]
+
+    assert structure() is None
+    assert structure() == SECTIONS  # asked the model again instead of replaying the truncated output
+    assert structure() == SECTIONS  # now served from the cache
+    assert calls == ["struct-model", "struct-model"]
+
+
+def test_cached_response_failing_cache_if_is_not_served(provider):
+    replies, calls = provider
+    params = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    llm_client.completion_store.set(make_completion_key(params), "structuring", _response("m", "not json").model_dump(), 3600)
+    replies["m"] = [_response("m", json.dumps(SECTIONS))]
+
+    response = asyncio.run(llm_client.acompletion(
+        kind="structuring", cache_if=lambda r: r.choices[0].message.content.startswith("["), **params
+    ))
+
+    assert json.loads(response.choices[0].message.content) == SECTIONS
+    assert calls == ["m"]
+
+
+def test_fallback_answer_is_cached_under_the_fallback_model(provider, monkeypatch):
+    replies, calls = provider
+    monkeypatch.setattr(settings, "LLM_FALLBACK_MODELS", {"primary-model": ["backup-model"]})
+    replies["primary-model"] = [
+        litellm.exceptions.ServiceUnavailableError("down", llm_provider="openai", model="primary-model"),
+        _response("primary-model", "primary answer"),
+    ]
+    replies["backup-model"] = [_response("backup-model", "backup answer")]
+    params = {"model": "primary-model", "messages": [{"role": "user", "content": "when is the exam?"}]}
+
+    first = asyncio.run(llm_client.acompletion(kind="answer", **params))
+    assert first.choices[0].message.content == "backup answer"
+
+    # The primary is not later served the backup's answer as its own
+    second = asyncio.run(llm_client.acompletion(kind="answer", **params))
+    assert second.choices[0].message.content == "primary answer"
+    assert calls == ["primary-model", "backup-model", "primary-model"]
+
+    # The backup's answer is reusable for requests to the backup model itself
+    third = asyncio.run(llm_client.acompletion(kind="answer", **{**params, "model": "backup-model"}))
+    assert third.choices[0].message.content == "backup answer"
+    assert len(calls) == 3
+
+
+def test_sampled_completions_above_the_temperature_threshold_are_not_cached(provider):
+    replies, calls = provider
+    assert settings.LLM_CACHE_MAX_TEMPERATURE == 0.2  # the default
+    replies["m"] = [_response("m", f"answer {i}") for i in range(4)]
+    messages = [{"role": "user", "content": "when is the exam?"}]
+
+    def ask(temperature, **kwargs):
+        response = asyncio.run(llm_client.acompletion(kind="chat", model="m", messages=messages, temperature=temperature, **kwargs))
+        return response.choices[0].message.content
+
+    # Sampled: every call reaches the model, nothing is replayed
+    assert [ask(0.7), ask(0.7)] == ["answer 0", "answer 1"]
+    # At or below the threshold the answer is stored and served again
+    assert [ask(0.1), ask(0.1)] == ["answer 2", "answer 2"]
+    # An explicit use_cache=True overrides the threshold
+    assert [ask(1.0, use_cache=True), ask(1.0, use_cache=True)] == ["answer 3", "answer 3"]
+    assert len(calls) == 4
+
+
+def test_abandoned_stream_releases_its_scheduler_slot(provider, monkeypatch):
+    replies, calls = provider
+    scheduler = LLMScheduler(default_concurrency=1, model_limits={})
+    monkeypatch.setattr(llm_client, "llm_scheduler", scheduler)
+    closed = []
+
+    class Chunks:
+        """A provider stream that records being closed."""
+
+        def __init__(self, name):
+            self.name = name
+            self.words = iter(("the", "exam"))
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            for word in self.words:
+                return f"{self.name}:{word}"
+            raise StopAsyncIteration
+
+        async def aclose(self):
+            closed.append(self.name)
+
+    replies["m"] = [Chunks("dropped"), Chunks("closed"), Chunks("read")]
+    params = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+
+    async def scenario():
+        in_flight = lambda: scheduler.stats()["m"]["in_flight"]
+
+        stream = await llm_client.acompletion(kind="chat", **params)
+        assert in_flight() == 1
+        del stream  # dropped without reading a chunk
+        await asyncio.sleep(0.01)  # the loop closes the abandoned generator in a task of its own
+        assert in_flight() == 0
+
+        # With one slot per model, this call would wait forever if the slot had leaked
+        stream = await asyncio.wait_for(llm_client.acompletion(kind="chat", **params), timeout=1)
+        assert await stream.__anext__() == "closed:the"
+        await stream.aclose()
+        assert in_flight() == 0
+
+        stream = await asyncio.wait_for(llm_client.acompletion(kind="chat", **params), timeout=1)
+        assert [chunk async for chunk in stream] == ["read:the", "read:exam"]
+        assert in_flight() == 0
+
+    asyncio.run(scenario())
+    # Each provider stream was closed along with its slot
+    assert closed == ["dropped", "closed", "read"]
+    assert calls == ["m", "m", "m"]
@@ -0,0 +1,93 @@
+import asyncio
+
+from app.core.llm_scheduler import LLMScheduler, Priority
+
+
+async def _run(scheduler, model, name, log, priority=Priority.CHAT, tokens=0, hold=0.01):
+    async with scheduler.slot(model, priority, tokens):
+        log.append(("start", name))
+        await asyncio.sleep(hold)
+        log.append(("end", name))
+
+
+def test_concurrency_is_bounded_per_model():
+    async def scenario():
+        scheduler = LLMScheduler(default_concurrency=2, model_limits={"slow": {"concurrency": 1}})
+        peak = {"fast": 0, "slow": 0}
+        running = {"fast": 0, "slow": 0}
+
+        async def call(model):
+            async with scheduler.slot(model):
+                running[model] += 1
+                peak[model] = max(peak[model], running[model])
+                await asyncio.sleep(0.01)
+                running[model] -= 1
+
+        await asyncio.gather(*(call("fast") for _ in range(6)), *(call("slow") for _ in range(3)))
+        return scheduler, peak
+
+    scheduler, peak = asyncio.run(scenario())
+    assert peak == {"fast": 2, "slow": 1}
+    stats = scheduler.stats()
+    assert stats["fast"]["served"]["CHAT"] == 6
+    assert stats["slow"]["in_flight"] == 0
+
+
+def test_chat_is_admitted_before_queued_ingestion():
+    async def scenario():
+        scheduler = LLMScheduler(default_concurrency=1, model_limits={})
+        log = []
+        holder = asyncio.create_task(_run(scheduler, "m", "holder", log, hold=0.05))
+        await asyncio.sleep(0)
+        waiting = [
+            asyncio.create_task(_run(scheduler, "m", "ingestion", log, Priority.INGESTION)),
+            asyncio.create_task(_run(scheduler, "m", "admin", log, Priority.ADMIN)),
+            asyncio.create_task(_run(scheduler, "m", "chat", log, Priority.CHAT))
+        ]
+        await asyncio.sleep(0.01)
+        depth = scheduler.stats()["m"]["queue_depth"]
+        await asyncio.gather(holder, *waiting)
+        return log, depth
+
+    log, depth = asyncio.run(scenario())
+    assert depth == {"CHAT": 1, "ADMIN": 1, "INGESTION": 1}
+    assert [name for event, name in log if event == "start"] == ["holder", "chat", "admin", "ingestion"]
+
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    async def scenario():
+        scheduler = LLMScheduler(default_concurrency=1, model_limits={})
+        log = []
+        holder = asyncio.create_task(_run(scheduler, "m", "holder", log, hold=0.02))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(_run(scheduler, "m", "cancelled", log))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(_run(scheduler, "m", "next", log), timeout=1)
+        await holder
+        return scheduler, log
+
+    scheduler, log = asyncio.run(scenario())
+    assert ("start", "cancelled") not in log
+    assert scheduler.stats()["m"]["in_flight"] == 0
+
+
+def test_token_budget_holds_back_calls_over_the_window():
+    async def scenario():
+        scheduler = LLMScheduler(default_concurrency=4, model_limits={"m": {"tokens_per_minute": 100}})
+        log = []
+        await _run(scheduler, "m", "first", log, tokens=80)
+        second = asyncio.create_task(_run(scheduler, "m", "second", log, tokens=50))
+        small = asyncio.create_task(_run(scheduler, "m", "small", log, tokens=20))
+        await asyncio.sleep(0.05)
+        stats = scheduler.stats()["m"]
+        for task in (second, small):
+            task.cancel()
+        await asyncio.gather(second, small, return_exceptions=True)
+        return log, stats
+
+    log, stats = asyncio.run(scenario())
+    # "second" would exceed the window; "small" would fit, but queues behind it
+    assert log == [("start", "first"), ("end", "first")]
+    assert stats["tokens_in_window"] == 80
+    assert stats["queue_depth"]["CHAT"] == 2
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from app.core.prompt_registry import CompiledPrompt, PromptLoadError, PromptRegistry
+
+
+def test_render_substitutes_every_placeholder_in_one_pass():
+    prompt = CompiledPrompt("p.txt", "Hi {{NAME}}, today is {{DATE}}. Bye {{NAME}}.")
+
+    assert prompt.placeholders == ["DATE", "NAME"]
+    assert prompt.render({"NAME": "Dana", "DATE": "2025-03-01"}) == "Hi Dana, today is 2025-03-01. Bye Dana."
+
+
+def test_render_does_not_expand_placeholders_inside_values():
+    prompt = CompiledPrompt("p.txt", "Syllabus: {{SYLLABUS}}\nQuestion: {{QUERY}}")
+
+    # A syllabus that happens to contain {{QUERY}} is inserted as-is
+    rendered = prompt.render({"SYLLABUS": "see {{QUERY}} below", "QUERY": "when is the exam?"})
+
+    assert rendered == "Syllabus: see {{QUERY}} below\nQuestion: when is the exam?"
+
+
+def test_render_leaves_missing_placeholders_and_formats_values():
+    prompt = CompiledPrompt("p.txt", "{{A}} and {{B}}")
+
+    assert prompt.render({"A": 3}) == "3 and {{B}}"
+    assert prompt.render() == "{{A}} and {{B}}"
+    assert prompt.render({}) == "{{A}} and {{B}}"
+    assert CompiledPrompt("p.txt", "no placeholders").render({"A": 1}) == "no placeholders"
+
+
+@pytest.fixture
+def prompts(tmp_path):
+    (tmp_path / "greeting.txt").write_text("Hello {{NAME}}\n", encoding="utf-8")
+    return tmp_path, PromptRegistry(tmp_path)
+
+
+def _touch(path, content, mtime):
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_unchanged_prompt_is_compiled_once(prompts):
+    _, registry = prompts
+
+    first = registry.get("greeting.txt")
+
+    assert first.content == "Hello {{NAME}}"  # stripped
+    assert registry.get("greeting.txt") is first
+    assert registry.render("greeting.txt", {"NAME": "Dana"}) == "Hello Dana"
+
+
+def test_prompt_is_reloaded_when_its_mtime_changes(prompts):
+    prompts_dir, registry = prompts
+    path = prompts_dir / "greeting.txt"
+    _touch(path, "Hello {{NAME}}", 1_000_000)
+    first = registry.get("greeting.txt")
+
+    _touch(path, "Shalom {{NAME}}", 1_000_010)
+    second = registry.get("greeting.txt")
+
+    assert second is not first
+    assert second.render({"NAME": "Dana"}) == "Shalom Dana"
+    assert second.content_hash != first.content_hash
+    assert registry.content_hash("greeting.txt") == second.content_hash
+
+
+def test_force_reload_rereads_a_file_with_the_same_mtime(prompts):
+    prompts_dir, registry = prompts
+    path = prompts_dir / "greeting.txt"
+    _touch(path, "Hello {{NAME}}", 1_000_000)
+    first = registry.get("greeting.txt")
+    # Rewritten within the filesystem's mtime resolution
+    _touch(path, "Shalom {{NAME}}", 1_000_000)
+
+    assert registry.get("greeting.txt") is first
+    assert registry.get("greeting.txt", force_reload=True).content == "Shalom {{NAME}}"
+
+
+def test_missing_and_empty_prompts_raise(prompts):
+    prompts_dir, registry = prompts
+    (prompts_dir / "empty.txt").write_text("  \n", encoding="utf-8")
+
+    with pytest.raises(PromptLoadError, match="greeting.txt"):  # lists the available files
+        registry.get("missing.txt")
+    with pytest.raises(PromptLoadError, match="empty"):
+        registry.get("empty.txt")
+    assert registry.get("empty.txt", validate=False).content == ""
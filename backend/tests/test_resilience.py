@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.resilience import CircuitBreaker, CircuitOpenError, call_with_resilience
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_RECOVERY_SECONDS", 30.0)
+    monkeypatch.setattr(settings, "LLM_FALLBACK_MODELS", {"primary": ["backup"]})
+    resilience._breakers.clear()
+    yield
+    resilience._breakers.clear()
+
+
+class Provider:
+    """call_fn that plays back a scripted outcome per model: an exception to raise or a result."""
+
+    def __init__(self, **outcomes):
+        self.outcomes = {model: list(script) for model, script in outcomes.items()}
+        self.calls = []
+
+    async def __call__(self, params):
+        self.calls.append(params["model"])
+        script = self.outcomes[params["model"]]
+        outcome = script.pop(0) if len(script) > 1 else script[0]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def _call(provider, model="primary", **kwargs):
+    return asyncio.run(call_with_resilience(provider, {"model": model, "messages": []}, **kwargs))
+
+
+def test_transient_errors_are_retried():
+    provider = Provider(primary=[asyncio.TimeoutError(), asyncio.TimeoutError(), "ok"])
+    assert _call(provider) == "ok"
+    assert provider.calls == ["primary"] * 3
+    assert resilience.get_breaker("primary").state == "closed"
+
+
+def test_max_retries_override_leaves_retrying_to_the_caller():
+    provider = Provider(primary=[asyncio.TimeoutError(), "ok"], backup=["backup ok"])
+    # No retry on the same model, but the fallback still applies
+    assert _call(provider, max_retries=0) == "backup ok"
+    assert provider.calls == ["primary", "backup"]
+
+
+def test_non_retryable_errors_are_raised_immediately():
+    from litellm.exceptions import ContextWindowExceededError
+
+    provider = Provider(primary=[ValueError("bad request")])
+    with pytest.raises(ValueError):
+        _call(provider)
+    assert provider.calls == ["primary"]
+
+    provider = Provider(primary=[ContextWindowExceededError("too long", model="primary", llm_provider="openai")])
+    with pytest.raises(ContextWindowExceededError):
+        _call(provider)
+    assert provider.calls == ["primary"]
+
+
+def test_failing_model_falls_back_and_opens_its_circuit():
+    provider = Provider(primary=[asyncio.TimeoutError()], backup=["from backup"])
+    assert _call(provider) == "from backup"
+    assert provider.calls == ["primary"] * 3 + ["backup"]
+    assert resilience.get_breaker("primary").state == "open"
+
+    # While the circuit is open the primary is skipped without a call
+    provider.calls.clear()
+    assert _call(provider) == "from backup"
+    assert provider.calls == ["backup"]
+
+
+def test_all_circuits_open_raises_circuit_open_error():
+    for model in ("primary", "backup"):
+        breaker = resilience.get_breaker(model)
+        for _ in range(3):
+            breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        _call(Provider(primary=["ok"], backup=["ok"]))
+
+
+def test_deadline_caps_the_attempt_timeout_and_the_retries():
+    timeouts = []
+
+    async def slow(params):
+        timeouts.append(params["timeout"])
+        await asyncio.sleep(0.04)
+        raise asyncio.TimeoutError()
+
+    # The second attempt only gets what is left of the deadline, and there is no third
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(call_with_resilience(slow, {"model": "solo", "timeout": 600}, deadline_seconds=0.06))
+    assert len(timeouts) == 2
+    assert timeouts[0] <= 0.06 and timeouts[1] < timeouts[0]
+
+
+def test_breaker_half_open_probe(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=10)
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock[0] = 10
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.times_opened == 2
+
+    clock[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.consecutive_failures == 0
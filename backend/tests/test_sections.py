@@ -0,0 +1,108 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from conftest import load_course
+
+from app.core import llm_client
+from app.core.llm_services import parse_section_ids, retrieve_relevant_sections, select_relevant_sections
+from app.core.sections import build_sections, format_sections
+
+KNOWN = ["description", "test-0", "slot-2025-04-28-0", "slot-2025-04-28-0-1"]
+
+
+@pytest.mark.parametrize("response, expected", [
+    ('{"section_ids": ["test-0", "description"]}', ["test-0", "description"]),
+    ('["slot-2025-04-28-0"]', ["slot-2025-04-28-0"]),
+    # Unknown ids are dropped, repeats collapse to their first position
+    ('{"section_ids": ["test-0", "made-up", "test-0", "description"]}', ["test-0", "description"]),
+    ('{"section_ids": []}', []),
+    ('{"other": 1}', []),
+])
+def test_parse_section_ids_reads_json(response, expected):
+    assert parse_section_ids(response, KNOWN) == expected
+
+
+@pytest.mark.parametrize("response, expected", [
+    # Prose or a truncated reply: known ids are picked out of the text in order
+    ("The relevant sections are test-0 and slot-2025-04-28-0.", ["test-0", "slot-2025-04-28-0"]),
+    ('{"section_ids": ["slot-2025-04-28-0-1", "desc', ["slot-2025-04-28-0-1"]),
+    ('{"section_ids": "test-0"}', ["test-0"]),
+    ("none of them", []),
+])
+def test_parse_section_ids_falls_back_to_scanning_the_text(response, expected):
+    assert parse_section_ids(response, KNOWN) == expected
+
+
+def test_build_sections_ids_are_stable_and_unique():
+    course = load_course("pathology")
+    sections = build_sections(course)
+    ids = [section["id"] for section in sections]
+
+    assert len(ids) == len(set(ids))
+    assert ids[:4] == ["description", "requirements", "grading_policy", "course_notes"]
+    assert all(section["label"].startswith(f"{course['heb_name']} - ") for section in sections)
+    assert all(section["content"] for section in sections)
+    # Ids come from positions and dates, so editing the text keeps them
+    course["requirements"] = "Changed"
+    assert [section["id"] for section in build_sections(course)] == ids
+
+
+def test_build_sections_numbers_repeated_dates_and_keeps_note_only_days():
+    course = {"name": "Course", "schedule": {"calendar_entries": [
+        {"date": "2025-05-01", "time_slots": [{"start_time": "09:00", "subject": "Morning"}]},
+        {"date": "2025-05-01", "time_slots": [{"start_time": "14:00", "subject": "Afternoon"}]},
+        {"date": "2025-05-02", "daily_notes": "No classes, holiday"},
+        {"date": "2025-05-03", "time_slots": []},
+    ]}}
+
+    sections = build_sections(course)
+
+    assert [section["id"] for section in sections] == ["slot-2025-05-01-0", "slot-2025-05-01-0-1", "slot-2025-05-02-notes"]
+    assert sections[1]["content"] == "2025-05-01 14:00\nAfternoon"
+    assert sections[2]["content"] == "2025-05-02\nNo classes, holiday"
+
+
+def test_format_sections_assembles_label_and_content_in_order():
+    sections = [{"id": "b", "label": "B", "content": "second"}, {"id": "a", "label": "A", "content": "first"}]
+    assert format_sections(sections) == "B\nsecond\n\nA\nfirst"
+    assert format_sections([]) == ""
+
+
+@pytest.fixture
+def retrieval(monkeypatch):
+    """The retrieval model replies with the given text, or raises it."""
+    reply = {}
+
+    async def acompletion(kind, **params):
+        if isinstance(reply["content"], BaseException):
+            raise reply["content"]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply["content"]))], usage=None)
+
+    monkeypatch.setattr(llm_client, "acompletion", acompletion)
+    return reply
+
+
+def test_selected_sections_are_assembled_in_the_models_order(retrieval):
+    sections = build_sections(load_course("pathology"))
+    retrieval["content"] = json.dumps({"section_ids": ["test-0", "grading_policy"]})
+
+    selected = asyncio.run(select_relevant_sections("When is the exam?", sections))
+    context = asyncio.run(retrieve_relevant_sections("When is the exam?", sections))
+
+    by_id = {section["id"]: section for section in sections}
+    assert selected == [by_id["test-0"], by_id["grading_policy"]]
+    assert context == format_sections(selected)
+
+
+def test_no_relevant_sections_and_failures_give_no_context(retrieval):
+    sections = build_sections(load_course("pathology"))
+
+    retrieval["content"] = '{"section_ids": []}'
+    assert asyncio.run(select_relevant_sections("Hello", sections)) == []
+    assert asyncio.run(retrieve_relevant_sections("Hello", sections)) is None
+
+    retrieval["content"] = RuntimeError("model is down")
+    assert asyncio.run(select_relevant_sections("Hello", sections)) is None
+    assert asyncio.run(retrieve_relevant_sections("Hello", sections)) is None
@@ -0,0 +1,74 @@
+import asyncio
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_calls_with_one_key_run_once():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+
+        async def answer(key):
+            runs.append(key)
+            await asyncio.sleep(0.01)
+            return f"answer to {key}"
+
+        results = await asyncio.gather(
+            *(flight.do("q1", lambda: answer("q1")) for _ in range(5)),
+            flight.do("q2", lambda: answer("q2"))
+        )
+        return flight, runs, results
+
+    flight, runs, results = asyncio.run(scenario())
+    assert sorted(runs) == ["q1", "q2"]
+    assert results == ["answer to q1"] * 5 + ["answer to q2"]
+    stats = flight.stats()
+    assert (stats["executions"], stats["coalesced"], stats["in_flight"]) == (2, 4, 0)
+    assert stats["top_keys"] == [{"key": "q1", "executions": 1, "waiters": 4}]
+
+
+def test_a_finished_key_runs_again():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+
+        async def answer():
+            runs.append(1)
+            return len(runs)
+
+        return [await flight.do("q", answer), await flight.do("q", answer)]
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def answer():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        leader = asyncio.create_task(flight.do("q", answer))
+        waiter = asyncio.create_task(flight.do("q", answer))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await waiter, leader
+
+    result, leader = asyncio.run(scenario())
+    assert result == "done"
+    assert leader.cancelled()
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("provider error")
+
+        return await asyncio.gather(flight.do("q", fail), flight.do("q", fail), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [ValueError, ValueError]
@@ -0,0 +1,68 @@
+"""
+Import-time budget for worker startup.
+
+Imports app.main in a fresh interpreter with `-X importtime` and fails when
+a module that must load lazily was imported eagerly. The wall-clock budget
+depends on the machine, so it is a `timing` test: run it with
+RUN_TIMING_TESTS=1 (and `-s` to see the slowest top-level packages).
+"""
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+BUDGET_MS = int(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+# Heavy dependencies that must only be imported on first use
+LAZY_MODULES = ("litellm", "openai", "deepdiff", "beanie")
+
+_PROBE = "import sys, app.main; print('LOADED=' + ','.join(m for m in {modules!r} if m in sys.modules))"
+_BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def measure_imports() -> Tuple[int, Dict[str, int], List[str]]:
+    """
+    Returns:
+        (total microseconds to import app.main, microseconds spent in each
+        top-level package, lazy modules that were loaded anyway)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(modules=LAZY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=_BACKEND_DIR
+    )
+    per_package: Dict[str, int] = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue  # header line
+        if name == "app.main":
+            total = int(cumulative)
+        # Self times summed per top-level package: no module is counted twice
+        per_package[name.split(".")[0]] += int(self_time)
+    loaded = result.stdout.strip().split("LOADED=", 1)[-1]
+    return total, dict(per_package), [m for m in loaded.split(",") if m]
+
+
+def test_heavy_dependencies_load_lazily():
+    total, _, eager = measure_imports()
+    assert total > 0, "app.main was not imported"
+    assert not eager, f"modules that should load lazily were imported at startup: {', '.join(eager)}"
+
+
+@pytest.mark.timing
+def test_startup_import_budget():
+    total, per_package, _ = measure_imports()
+    for name, micros in sorted(per_package.items(), key=lambda item: item[1], reverse=True)[:15]:
+        print(f"{name:<32}{micros / 1000:>10.1f} ms")
+
+    assert total / 1000 <= BUDGET_MS, f"importing app.main took {total / 1000:.0f} ms, over the {BUDGET_MS} ms budget"
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import llm_client, summarizer
+from app.core.config import settings
+from app.core.history import conversation_cache
+from app.core.summarizer import get_summary, get_summary_stats, prompt_turns, summary_cache, update_summary
+
+T0 = datetime(2025, 3, 1, 10, 0)
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """Two turns kept verbatim, two folded per update; the summary model replies from a script."""
+    monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_ENABLED", True)
+    monkeypatch.setattr(settings, "CONVERSATION_RECENT_TURNS", 2)
+    monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_MIN_TURNS", 2)
+    conversation_cache.clear()
+    summary_cache.clear()
+    replies = []
+    prompts = []
+
+    async def acompletion(kind, messages, **params):
+        prompts.append(messages[0]["content"])
+        reply = replies.pop(0)
+        if isinstance(reply, BaseException):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+    monkeypatch.setattr(llm_client, "acompletion", acompletion)
+    yield replies, prompts
+    conversation_cache.clear()
+    summary_cache.clear()
+
+
+def _add_turns(db, first, last):
+    for i in range(first, last + 1):
+        db.messages.docs.append({"sender": "s1", "message": f"q{i}", "response": f"a{i}", "timestamp": T0 + timedelta(minutes=i)})
+    conversation_cache.clear()
+
+
+def _update(db):
+    asyncio.run(update_summary("s1", db))
+
+
+def _prompt_messages(db):
+    async def run():
+        history = await summarizer.get_conversation_history("s1", db)
+        return [turn["message"] for turn in prompt_turns(history, await get_summary("s1", db))]
+
+    return asyncio.run(run())
+
+
+def test_summary_waits_until_enough_turns_left_the_recent_window(db, summaries):
+    replies, prompts = summaries
+    _add_turns(db, 0, 2)  # one turn older than the recent window
+
+    _update(db)
+    assert prompts == []
+    assert db.conversation_summaries.docs == []
+    assert _prompt_messages(db) == ["q0", "q1", "q2"]
+
+    _add_turns(db, 3, 3)  # two now
+    replies.append("Asked about q0 and q1.")
+    _update(db)
+    assert len(prompts) == 1
+    assert "q0" in prompts[0] and "q1" in prompts[0] and "q2" not in prompts[0]
+
+
+def test_summary_is_persisted_and_replaces_the_folded_turns(db, summaries):
+    replies, prompts = summaries
+    replies.extend(["Asked about q0 and q1.", "Asked about q0 to q3."])
+    _add_turns(db, 0, 3)
+
+    _update(db)
+    doc, = db.conversation_summaries.docs
+    assert doc["sender"] == "s1"
+    assert doc["summary"] == "Asked about q0 and q1."
+    assert doc["through"] == T0 + timedelta(minutes=1)
+    assert doc["turns"] == 2
+    assert _prompt_messages(db) == ["q2", "q3"]
+
+    # Read back from the database, not only from the in-process cache
+    summary_cache.clear()
+    assert asyncio.run(get_summary("s1", db)) == {"summary": "Asked about q0 and q1.", "through": T0 + timedelta(minutes=1)}
+
+    # The next update folds in the previous summary and counts the new turns
+    _add_turns(db, 4, 5)
+    _update(db)
+    assert "Asked about q0 and q1." in prompts[1]
+    doc, = db.conversation_summaries.docs
+    assert doc["summary"] == "Asked about q0 to q3."
+    assert doc["turns"] == 4
+    assert _prompt_messages(db) == ["q4", "q5"]
+
+
+def test_failed_summary_keeps_the_turns_verbatim(db, summaries):
+    replies, _ = summaries
+    replies.extend([RuntimeError("summary model is down"), "Asked about q0 and q1."])
+    _add_turns(db, 0, 3)
+    errors = get_summary_stats()["errors"]
+
+    _update(db)
+    assert get_summary_stats()["errors"] == errors + 1
+    assert db.conversation_summaries.docs == []
+    # Nothing is lost: the chat prompt still carries every turn
+    assert _prompt_messages(db) == ["q0", "q1", "q2", "q3"]
+    assert not summarizer._updating
+
+    # The next turn catches up
+    _update(db)
+    assert db.conversation_summaries.docs[0]["summary"] == "Asked about q0 and q1."
+    assert _prompt_messages(db) == ["q2", "q3"]
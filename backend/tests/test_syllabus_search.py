@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from app.core import syllabus_search
+from app.core.syllabus_search import backfill_search_keys, search_fields, search_syllabi
+
+COURSES = [
+    ("0102.2319.01", "Human Anatomy", "אנטומיה של גוף האדם", "2025"),
+    ("0102.1111.01", "Anatomical Pathology", "פתולוגיה", "2025"),
+    ("0102.2222.01", "Physiology", "פיזיולוגיה", "2024"),
+    ("0102-2315", "Neuroanatomy", "נוירואנטומיה", "2025"),
+]
+
+
+@pytest.fixture
+def courses(db):
+    for course_id, name, heb_name, year in COURSES:
+        db.syllabi.docs.append({
+            "_id": course_id,
+            "course_id": course_id,
+            "current_version": 1,
+            "metadata": {"name": name, "heb_name": heb_name, "year": year, "semester": "A"},
+            "search": search_fields(course_id, name, heb_name)
+        })
+    return db
+
+
+def names(db, query, **kwargs):
+    return [doc["metadata"]["name"] for doc in asyncio.run(search_syllabi(db, query, **kwargs))]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("anat", ["Anatomical Pathology", "Human Anatomy", "Neuroanatomy"]),  # prefixes (ties by name), then substrings
+    ("anatomy", ["Human Anatomy", "Neuroanatomy"]),  # exact before substring
+    ("ANATOMY", ["Human Anatomy", "Neuroanatomy"]),
+    ("tomy", ["Human Anatomy", "Neuroanatomy"]),  # substring via trigrams
+    ("האנטומיה", ["Human Anatomy", "Neuroanatomy"]),  # attached Hebrew prefix
+    ("ובאנטומיה", ["Human Anatomy", "Neuroanatomy"]),
+    ("לוגיה", ["Anatomical Pathology", "Physiology"]),
+    ("human anat", ["Human Anatomy"]),  # every word must match
+    ("physio path", []),
+    ("2319", ["Human Anatomy"]),
+    ("0102-2315", ["Neuroanatomy"]),
+    ("xyz", []),
+])
+def test_search_matches_and_ranks(courses, query, expected):
+    assert names(courses, query) == expected
+
+
+def test_exact_course_id_ranks_first(courses):
+    assert names(courses, "0102.1111.01")[0] == "Anatomical Pathology"
+
+
+def test_trigram_false_positives_are_dropped(courses):
+    # "htom" is not in any term, although "hto" and "tom" may each be
+    assert names(courses, "htom") == []
+
+
+def test_filters_apply(courses):
+    assert names(courses, "logy", filters={"metadata.year": "2024"}) == ["Physiology"]
+
+
+def test_query_without_words_matches_everything(courses):
+    assert len(names(courses, "?!")) == len(COURSES)
+    assert names(courses, " - ", filters={"metadata.year": "2024"}) == ["Physiology"]
+
+
+def test_candidate_cap_keeps_the_best_matches(courses, monkeypatch):
+    monkeypatch.setattr(syllabus_search.settings, "SYLLABUS_SEARCH_MAX_CANDIDATES", 1)
+    # Both match "anatomy"; the exact match outranks the substring one before the cap applies
+    assert names(courses, "anatomy") == ["Human Anatomy"]
+
+
+def test_limit(courses):
+    assert names(courses, "anat", limit=1) == ["Anatomical Pathology"]
+
+
+def test_backfill_adds_missing_keys_once(db):
+    db.syllabi.docs.append({"_id": 1, "course_id": "X1", "metadata": {"name": "Virology", "heb_name": "וירולוגיה"}})
+    assert asyncio.run(backfill_search_keys(db)) == 1
+    assert asyncio.run(backfill_search_keys(db)) == 0
+    assert names(db, "viro") == ["Virology"]
@@ -0,0 +1,106 @@
+import pytest
+from conftest import load_course
+
+from app.core import token_budget
+from app.core.config import settings
+from app.core.context_format import render_compact_context
+from app.core.sections import build_sections
+from app.core.token_budget import SyllabusContextPart, count_tokens, fit_syllabus_context
+
+MODEL = "gpt-4o"
+
+
+@pytest.fixture
+def window(monkeypatch):
+    """Sets the model's context window, with no safety margin."""
+    monkeypatch.setattr(settings, "TOKEN_BUDGET_MARGIN", 0)
+
+    def set_window(tokens):
+        monkeypatch.setattr(token_budget, "get_context_window", lambda model: tokens)
+
+    return set_window
+
+
+def _part(name, syllabus_id=None):
+    course = load_course(name)
+    syllabus_id = syllabus_id or name
+    return SyllabusContextPart(
+        syllabus_id=syllabus_id,
+        version=1,
+        text=render_compact_context(course),
+        course_data=course,
+        header=f"--- START SYLLABUS: {syllabus_id} ---\n",
+        footer=f"--- END SYLLABUS: {syllabus_id} ---\n\n",
+        rendering="test"
+    )
+
+
+def _full_tokens(part):
+    return count_tokens(MODEL, part.header + part.text + part.footer)
+
+
+def test_context_that_fits_is_sent_unchanged(window):
+    part = _part("pathology")
+    window(_full_tokens(part) + 100)
+
+    result = fit_syllabus_context(MODEL, [part], reserved_tokens=100)
+
+    assert result.content == part.header + part.text + part.footer
+    assert result.trimmed_syllabi == [] and result.dropped_sections == 0
+
+
+def _kept(result, part):
+    return [s["id"] for s in build_sections(part.course_data) if f"{s['label']}\n{s['content']}\n\n" in result.content]
+
+
+def test_schedule_slots_are_trimmed_before_tests_and_assignments(window):
+    part = _part("pathology")
+    window(_full_tokens(part) // 3)
+
+    result = fit_syllabus_context(MODEL, [part], reserved_tokens=0)
+
+    kept = _kept(result, part)
+    assert result.trimmed_syllabi == ["pathology"]
+    assert result.dropped_sections == len(build_sections(part.course_data)) - len(kept)
+    assert {"test-0", "assignment-0", "requirements", "grading_policy"} <= set(kept)
+    # Most of the schedule did not make it
+    slots = [section_id for section_id in kept if section_id.startswith("slot-")]
+    assert len(slots) < 8
+
+
+def test_sections_matching_the_query_are_kept_first(window):
+    part = _part("pathology")
+    slot = next(s for s in build_sections(part.course_data) if s["id"] == "slot-2025-05-15-0")
+    slot_tokens = count_tokens(MODEL, f"{slot['label']}\n{slot['content']}\n\n")
+    window(count_tokens(MODEL, part.header + part.footer) + slot_tokens)
+
+    without_query = fit_syllabus_context(MODEL, [part], reserved_tokens=0)
+    with_query = fit_syllabus_context(MODEL, [part], reserved_tokens=0, user_query=slot["content"])
+
+    assert "slot-2025-05-15-0" not in _kept(without_query, part)
+    assert "slot-2025-05-15-0" in _kept(with_query, part)
+
+
+def test_reserved_tokens_beyond_the_window_leave_no_context(window):
+    window(1000)
+
+    result = fit_syllabus_context(MODEL, [_part("pathology")], reserved_tokens=5000)
+
+    assert result.budget == 0
+    assert result.content == ""
+    assert result.tokens == 0
+    assert result.trimmed_syllabi == ["pathology"]
+
+
+@pytest.mark.parametrize("budget", [0, 40, 200, 800, 2000])
+def test_trimmed_context_stays_within_the_budget(window, budget):
+    parts = [_part("pathology"), _part("genetics")]
+    window(budget)
+
+    result = fit_syllabus_context(MODEL, parts, reserved_tokens=0)
+
+    assert result.tokens <= budget
+    assert count_tokens(MODEL, result.content) <= budget
+    if budget >= 800:
+        # Sections are taken round-robin, so no syllabus is crowded out
+        assert "SYLLABUS: pathology" in result.content and "SYLLABUS: genetics" in result.content
@@ -0,0 +1,93 @@
+import asyncio
+
+import numpy as np
+import pytest
+from conftest import load_course
+
+from app.core import lexical_index, vector_index
+from app.core.cache import answer_cache
+from app.core.vector_index import Embedder, HashingEmbedder, VectorIndex, get_embedder
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self, dim: int = 256):
+        super().__init__(dim)
+        self.calls = 0
+
+    async def embed(self, texts):
+        self.calls += 1
+        return await super().embed(texts)
+
+
+class FailingEmbedder(HashingEmbedder):
+    async def embed(self, texts):
+        raise ConnectionError("embedding service unavailable")
+
+
+@pytest.fixture(autouse=True)
+def clear_indexes():
+    vector_index.clear_indexes()
+    yield
+    vector_index.clear_indexes()
+
+
+def test_embedder_is_abstract():
+    with pytest.raises(TypeError):
+        Embedder()
+
+
+def test_hashing_embedder_rows_are_normalized_and_deterministic():
+    embedder = get_embedder("hashing-256")
+    matrix = asyncio.run(embedder.embed(["final exam", "בחינה מסכמת"]))
+    assert matrix.shape == (2, 256)
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0)
+    assert np.array_equal(matrix, asyncio.run(embedder.embed(["final exam", "בחינה מסכמת"])))
+    assert asyncio.run(embedder.embed([])).shape == (0, 256)
+
+
+def test_search_ranks_by_cosine_similarity():
+    embedder = HashingEmbedder(256)
+    sections = [{"id": "grading", "label": "Grading"}, {"id": "schedule", "label": "Schedule"}, {"id": "staff", "label": "Staff"}]
+    matrix = asyncio.run(embedder.embed(["final exam grade", "weekly lecture schedule", "course staff and lecturers"]))
+    index = VectorIndex(sections, matrix)
+    query = asyncio.run(embedder.embed(["lecture schedule", "exam grade"]))
+
+    first, second = index.search_many(query, top_k=2)
+    assert first[0][0]["id"] == "schedule"
+    assert second[0][0]["id"] == "grading"
+    assert len(first) == 2 and first[0][1] >= first[1][1]
+    assert VectorIndex([], np.zeros((0, 256), dtype=np.float32)).search(query[0]) == []
+
+
+def test_vectors_are_persisted_and_reloaded_without_re_embedding(db):
+    data = load_course("pathology")
+    embedder = CountingEmbedder()
+    built = asyncio.run(vector_index.get_vector_index(db, "s1", 1, data, embedder))
+    assert embedder.calls == 1
+    assert len(db.syllabus_embeddings.docs) == 1
+
+    # Another worker: nothing in memory, the vectors come from Mongo
+    vector_index.clear_indexes()
+    loaded = asyncio.run(vector_index.get_vector_index(db, "s1", 1, data, embedder))
+    assert embedder.calls == 1
+    assert [s["id"] for s in loaded.sections] == [s["id"] for s in built.sections]
+    assert np.array_equal(loaded.matrix, built.matrix)
+
+    # A new version is embedded again
+    asyncio.run(vector_index.get_vector_index(db, "s1", 2, data, embedder))
+    assert embedder.calls == 2
+
+
+def test_refresh_indexes_survives_an_embedding_failure(db, monkeypatch):
+    from app.core import versions
+
+    data = load_course("pathology")
+    monkeypatch.setattr(vector_index, "get_embedder", lambda name=None: FailingEmbedder(256))
+    answer_cache.set("key", "stale answer", tags=["s1"])
+
+    asyncio.run(versions._refresh_indexes(db, "s1", 2, data))
+
+    assert answer_cache.peek("key") is None
+    assert lexical_index.get_index("s1", 2) is not None
+    assert db.syllabus_embeddings.docs == []
+    lexical_index.clear_indexes()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from bson import ObjectId
+
+from app.core import lexical_index, warmup
+from app.core.context_format import CONTEXT_FORMAT
+from app.core.warmup import run_warmup, warmup_state
+from app.main import ready
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """warmup_state as before startup, restored afterwards; model metadata is not loaded."""
+    saved = dict(warmup_state)
+    warmup_state.update(ready=False, started_at=None, finished_at=None, steps={}, errors={})
+    monkeypatch.setattr(warmup, "warm_model_metadata", lambda: 0)
+    yield
+    warmup_state.clear()
+    warmup_state.update(saved)
+
+
+def _ready():
+    response = asyncio.run(ready())
+    return response.status_code, json.loads(response.body)
+
+
+def test_ready_is_503_until_warmup_finishes(db, monkeypatch):
+    started = asyncio.Event()
+    release = asyncio.Event()
+    seen = {}
+
+    async def slow_syllabi(db):
+        started.set()
+        await release.wait()
+        return 0
+
+    monkeypatch.setattr(warmup, "warm_syllabi", slow_syllabi)
+
+    async def run():
+        task = asyncio.create_task(run_warmup(db))
+        await started.wait()
+        response = await ready()
+        seen["during"] = (response.status_code, json.loads(response.body)["status"])
+        release.set()
+        await task
+
+    assert _ready()[0] == 503
+    asyncio.run(run())
+    assert seen["during"] == (503, "warming_up")
+    status, body = _ready()
+    assert (status, body["status"]) == (200, "ready")
+    assert set(body["steps"]) == {"prompts", "model_metadata", "syllabus_contexts"}
+    assert body["errors"] == {}
+
+
+def test_warmup_renders_contexts_and_builds_indexes(pathology):
+    pathology.syllabus_versions.docs[0]["_id"] = ObjectId()
+    lexical_index._indexes.pop("pathology", None)
+
+    state = asyncio.run(run_warmup(pathology))
+
+    assert state["ready"] and state["errors"] == {}
+    version_doc = pathology.syllabus_versions.docs[0]
+    assert version_doc["llm_context_format"] == CONTEXT_FORMAT
+    assert version_doc["llm_context"]
+    assert lexical_index._indexes["pathology"][0] == 1
+
+
+def test_failed_step_is_reported_and_the_others_still_run(db, monkeypatch):
+    def broken():
+        raise RuntimeError("tokenizer download failed")
+
+    monkeypatch.setattr(warmup, "warm_model_metadata", broken)
+
+    asyncio.run(run_warmup(db))
+
+    status, body = _ready()
+    # Warm-up only fills caches: a failed step is visible but does not hold readiness back
+    assert status == 200
+    assert body["errors"] == {"model_metadata": "tokenizer download failed"}
+    assert set(body["steps"]) == {"prompts", "model_metadata", "syllabus_contexts"}
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { Form, Input, Button, Typography, Spin, Alert, Select, InputNumber, Card, Row, Col, message } from 'antd';
-import axios, { AxiosError } from 'axios';
+import axios from 'axios';
 
 const { Title, Paragraph } = Typography;
 const { TextArea } = Input;
@@ -67,12 +67,42 @@ const LLMTestPage: React.FC = () => {
         };
 
         try {
-            const response = await axios.post(`${API_BASE_URL}/api/v1/admin/llm/test-naive-stream`, requestBody);
-            setLlmResponse(response.data.response || "No response content.");
+            // The endpoint streams Server-Sent Events when asked for text/event-stream
+            const response = await fetch(`${API_BASE_URL}/api/v1/admin/llm/test-naive-stream`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: JSON.stringify(requestBody),
+            });
+            if (!response.ok || !response.body) {
+                const errorBody = await response.json().catch(() => null);
+                throw new Error(errorBody?.detail || `Request failed with status ${response.status}`);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            let streamedText = "";
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split("\n\n");
+                buffer = events.pop() || "";
+                for (const rawEvent of events) {
+                    const dataLine = rawEvent.split("\n").find(line => line.startsWith("data: "));
+                    if (!dataLine) continue;
+                    const payload = JSON.parse(dataLine.slice("data: ".length));
+                    if (payload.delta) {
+                        streamedText += payload.delta;
+                        setLlmResponse(streamedText);
+                    } else if (payload.response !== undefined) {
+                        setLlmResponse(payload.response || "No response content.");
+                    }
+                }
+            }
         } catch (err) {
             console.error("Error testing LLM:", err);
-            const axiosError = err as AxiosError<any>;
-            const errorMsg = axiosError.response?.data?.detail || axiosError.message || 'Error during LLM test.';
+            const errorMsg = (err as Error).message || 'Error during LLM test.';
             setError(errorMsg);
             message.error(errorMsg);
         }